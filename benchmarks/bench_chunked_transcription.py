@@ -0,0 +1,114 @@
+"""
+Benchmark: tiempo de pared de la transcripción de audios largos, una sola
+llamada contra fragmentos en paralelo (whatsapp/webhook/media/chunking.py).
+
+El backend de transcripción es simulado: tarda BASE_LATENCY + duración del
+audio × REAL_TIME_FACTOR y "transcribe" cada segundo con voz como la
+palabra `s<n>` (el índice va codificado en la amplitud), así además se
+comprueba que el texto unido no pierde ni repite palabras en los solapes.
+
+Uso:
+    python benchmarks/bench_chunked_transcription.py [concurrencia]
+"""
+
+import array
+import asyncio
+import io
+import os
+import random
+import sys
+import time
+import wave
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whatsapp.webhook.media.chunking import (  # noqa: E402
+    BYTES_PER_SECOND,
+    SAMPLE_RATE,
+    pcm_to_wav,
+    transcribe_in_chunks,
+)
+
+BASE_LATENCY = 0.2  # s por llamada
+REAL_TIME_FACTOR = 0.01  # s de proceso por s de audio
+CHUNK_SECONDS = 30
+OVERLAP = 1.0
+DURATIONS = (20, 60, 120, 300, 600)
+
+
+def synthetic_audio(seconds: int, seed: int = 7) -> tuple[bytes, list]:
+    """PCM con voz (amplitud = índice del segundo + 1) y pausas de 0.6 s."""
+    rng = random.Random(seed)
+    samples = array.array("h")
+    silences = []
+    next_pause = rng.uniform(5, 12)
+    for second in range(seconds):
+        samples.extend([second + 1] * SAMPLE_RATE)
+        if second >= next_pause and second + 1 < seconds:
+            # Silencio en la segunda mitad del segundo (la palabra sigue entera)
+            start = len(samples) - SAMPLE_RATE // 2
+            for i in range(start + SAMPLE_RATE // 5, len(samples)):
+                samples[i] = 0
+            silences.append((start / SAMPLE_RATE + 0.2, len(samples) / SAMPLE_RATE))
+            next_pause = second + rng.uniform(5, 12)
+    return samples.tobytes(), silences
+
+
+def words_in(wav: bytes) -> list[str]:
+    with wave.open(io.BytesIO(wav)) as reader:
+        samples = array.array("h", reader.readframes(reader.getnframes()))
+    counts = Counter(s for s in samples if s)
+    # Una palabra cuenta si el fragmento tiene al menos 0.3 s de ese segundo
+    return [f"s{amp - 1}" for amp in sorted(counts) if counts[amp] >= SAMPLE_RATE * 0.3]
+
+
+def make_backend(concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def transcribe(wav: bytes) -> str:
+        seconds = (len(wav) - 44) / BYTES_PER_SECOND
+        async with semaphore:
+            await asyncio.sleep(BASE_LATENCY + seconds * REAL_TIME_FACTOR)
+        return " ".join(words_in(wav))
+
+    return transcribe
+
+
+async def run(concurrency: int):
+    print(
+        f"Backend simulado: {BASE_LATENCY}s + {REAL_TIME_FACTOR}×duración por "
+        f"llamada · concurrencia {concurrency} · fragmentos de ~{CHUNK_SECONDS}s\n"
+    )
+    print(
+        f"{'audio':>7}{'1 llamada':>12}{'fragmentos':>12}{'n':>5}{'mejora':>9}  texto"
+    )
+    for seconds in DURATIONS:
+        pcm, silences = synthetic_audio(seconds)
+        expected = " ".join(f"s{i}" for i in range(seconds))
+        backend = make_backend(concurrency)
+
+        start = time.perf_counter()
+        single = await backend(pcm_to_wav(pcm))
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stitched, chunks = await transcribe_in_chunks(
+            pcm, silences, backend, chunk_seconds=CHUNK_SECONDS, overlap=OVERLAP
+        )
+        chunked_time = time.perf_counter() - start
+
+        intact = "íntegro" if stitched == expected == single else "DIFIERE"
+        print(
+            f"{seconds:>6}s{single_time:>11.2f}s{chunked_time:>11.2f}s{chunks:>5}"
+            f"{single_time / chunked_time:>8.1f}x  {intact}"
+        )
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    asyncio.run(run(concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Microbenchmark: costo de CPU por request del parseo de webhooks.
+
+Compara el camino anterior (request.json() + recorridos repetidos del dict
+en should_process_webhook, receive_data, el dispatcher de un solo mensaje,
+extract_user_info de cada handler y extract_whatsapp_user_info;
+json.dumps(indent=2) para loguear el payload web) contra la decodificación
+tipada en una sola pasada.
+
+Uso:
+    python benchmarks/bench_webhook_parse.py [iteraciones]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from whatsapp.webhook.request.dispatcher import dispatch_messages  # noqa: E402
+from whatsapp.webhook.request.payload import (  # noqa: E402
+    decode_web_payload,
+    decode_whatsapp_payload,
+)
+
+VALID_TYPES = {"text", "audio", "image", "video", "document", "button", "interactive"}
+
+WHATSAPP_BODY = json.dumps(
+    {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": "102290129340398",
+                "changes": [
+                    {
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "metadata": {
+                                "display_phone_number": "15550783881",
+                                "phone_number_id": "106540352242922",
+                            },
+                            "contacts": [
+                                {
+                                    "profile": {"name": "Sheena Nelson"},
+                                    "wa_id": "5493412732652",
+                                }
+                            ],
+                            "messages": [
+                                {
+                                    "from": "5493412732652",
+                                    "id": "wamid.HBgLMTY1MDM4Nzk0MzkVAgASGBQzQTRBNjU5OUFFRTAzODEwMTQ0RgA=",
+                                    "timestamp": "1749416383",
+                                    "type": "text",
+                                    "text": {
+                                        "body": "Hola, quiero agendar una reunión para mañana a las 10"
+                                    },
+                                }
+                            ],
+                        },
+                        "field": "messages",
+                    }
+                ],
+            }
+        ],
+    }
+).encode()
+
+WEB_BODY = json.dumps(
+    {
+        "userPhone": "web-3b1f9c",
+        "message": "Hola, ¿qué servicios ofrecen?",
+        "user_name": "Visitante",
+        "webhook_url": "https://example.com/hooks/chat",
+        "timestamp": "2025-11-17T14:00:00Z",
+    }
+).encode()
+
+
+# ----------------------------------------------------------
+# Camino anterior (reproducido tal cual lo recorría el código)
+# ----------------------------------------------------------
+def legacy_extract_user_info(raw_data):
+    try:
+        contacts = raw_data["entry"][0]["changes"][0]["value"].get("contacts", [])
+        if contacts:
+            contact = contacts[0]
+            return {
+                "usuario": contact.get("wa_id", ""),
+                "nombre": contact.get("profile", {}).get("name", ""),
+            }
+    except Exception:
+        pass
+    return {"usuario": "", "nombre": ""}
+
+
+def legacy_whatsapp(body: bytes):
+    raw_data = json.loads(body)  # request.json()
+
+    # should_process_webhook
+    value = raw_data.get("entry", [])[0].get("changes", [])[0].get("value", {})
+    if value.get("statuses", []):
+        return None
+    message = value.get("messages", [])[0]
+    if not message.get("from", "") or message.get("type", "") not in VALID_TYPES:
+        return None
+
+    # receive_data: phone_number_id
+    phone_id = (
+        raw_data.get("entry", [{}])[0]
+        .get("changes", [{}])[0]
+        .get("value", {})
+        .get("metadata", {})
+        .get("phone_number_id")
+    )
+
+    # Dispatcher anterior (primer mensaje) + handle_text (extract_user_info)
+    msg = raw_data["entry"][0]["changes"][0]["value"].get("messages", [])[0]
+    user_info = legacy_extract_user_info(raw_data)
+    unit = {
+        "type": "text",
+        "message": msg.get("text", {}).get("body", ""),
+        "from": msg.get("from"),
+        "wamid": msg.get("id"),
+        "usuario": user_info.get("usuario"),
+        "nombre": user_info.get("nombre"),
+        "raw": raw_data,
+    }
+
+    # extract_whatsapp_user_info
+    contacts = (
+        raw_data.get("entry", [{}])[0]
+        .get("changes", [{}])[0]
+        .get("value", {})
+        .get("contacts", [])
+    )
+    unit["profile"] = contacts[0].get("profile", {}).get("name", "")
+    unit["phone_number_id"] = phone_id
+    return unit
+
+
+def legacy_web(body: bytes):
+    payload = json.loads(body.decode("utf-8", errors="ignore"))
+    json.dumps(payload, indent=2, ensure_ascii=False)  # log del payload completo
+    return (
+        payload.get("userPhone") or payload.get("session_id"),
+        payload.get("message") or payload.get("text"),
+        payload.get("user_name") or payload.get("userName", "Usuario Web"),
+        payload.get("webhook_url") or payload.get("webhookUrl"),
+    )
+
+
+# ----------------------------------------------------------
+# Camino nuevo: una sola decodificación tipada
+# ----------------------------------------------------------
+def typed_whatsapp(body: bytes):
+    payload = decode_whatsapp_payload(body)
+    return dispatch_messages(
+        payload, accept=lambda m: bool(m.sender) and m.type in VALID_TYPES
+    )
+
+
+def typed_web(body: bytes):
+    payload = decode_web_payload(body)
+    return (payload.session_id, payload.message, payload.user_name, payload.webhook_url)
+
+
+def bench(fn, body: bytes, iterations: int) -> float:
+    """Devuelve microsegundos de CPU por llamada."""
+    for _ in range(min(1000, iterations)):
+        fn(body)
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(body)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+    rows = [
+        ("whatsapp", legacy_whatsapp, typed_whatsapp, WHATSAPP_BODY),
+        ("web", legacy_web, typed_web, WEB_BODY),
+    ]
+
+    print(f"{iterations} iteraciones por caso (µs de CPU por request)\n")
+    print(f"{'payload':<10}{'anterior':>12}{'tipado':>12}{'ahorro':>12}")
+    for name, legacy, typed, body in rows:
+        before = bench(legacy, body, iterations)
+        after = bench(typed, body, iterations)
+        saved = (1 - after / before) * 100 if before else 0.0
+        print(f"{name:<10}{before:>12.2f}{after:>12.2f}{saved:>11.1f}%")
+
+
+if __name__ == "__main__":
+    main()
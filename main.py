@@ -1,13 +1,51 @@
 import warnings
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from whatsapp.config import config
+from whatsapp.webhook.media.processor import MEDIA_PROCESSOR
+from whatsapp.webhook.pipeline.work_queue import WEBHOOK_QUEUE
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+from whatsapp.webhook.response.media_upload import MEDIA_UPLOADER
+from whatsapp.webhook.response.outbound import OUTBOUND
+from whatsapp.webhook.response.web_delivery import WEB_DELIVERY
+from whatsapp.webhook.route import drain_background_tasks
 from whatsapp.webhook.route import router as webhook_router
+from whatsapp.webhook.utilis.security import WebhookSignatureMiddleware
+from whatsapp.webhook.utilis.tenant_registry import TENANT_REGISTRY
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🌐 Pools HTTP compartidos (keep-alive)
+    await HTTP_CLIENTS.start()
+
+    # 📇 Registro de negocios en memoria (Credentials)
+    await TENANT_REGISTRY.start()
+
+    # ⚡ Workers del modo ack rápido
+    if config.webhook_async_mode:
+        await WEBHOOK_QUEUE.start()
+
+    yield
+
+    await WEBHOOK_QUEUE.stop(drain_timeout=config.webhook_drain_timeout)
+    # Avisos de "ocupado" y adjuntos lanzados en segundo plano
+    await drain_background_tasks(timeout=config.webhook_drain_timeout)
+    # Después del drenado: los jobs pendientes todavía envían respuestas
+    await OUTBOUND.stop(drain_timeout=config.webhook_drain_timeout)
+    await WEB_DELIVERY.stop()
+    await TENANT_REGISTRY.stop()
+    await MEDIA_PROCESSOR.close()
+    MEDIA_UPLOADER.close()
+    await HTTP_CLIENTS.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ✅ AGREGAR CORS ANTES DE LOS ROUTERS
 app.add_middleware(
@@ -20,6 +58,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 🔐 Firma de Meta en POST /webhook (se ejecuta antes que cualquier ruta)
+app.add_middleware(WebhookSignatureMiddleware, path="/webhook")
+
 # Registrar routers después del middleware
 app.include_router(webhook_router)
 
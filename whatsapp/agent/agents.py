@@ -3,22 +3,27 @@ Servicio de agente con herramientas nativas (sin MCP Server)
 Memoria persistente en SQLite (carpeta memory/).
 Incluye guardrail de entrada usando un clasificador LLM.
 Gestiona el contexto del sheet_crm_id vía RunContextWrapper.
+Las corridas en curso se registran por session_key para poder
+reemplazarlas (supersede) cuando llega un mensaje más nuevo.
 """
 
+import asyncio
 import os
+import time
 
 from agents import (
     Agent,
     GuardrailFunctionOutput,
     InputGuardrailTripwireTriggered,
     RunContextWrapper,
+    RunHooks,
     Runner,
     TResponseInputItem,
     input_guardrail,
 )
 from agents.extensions.memory import AdvancedSQLiteSession
 from agents.model_settings import ModelSettings
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from whatsapp.agent.tools import ALL_TOOLS
 from whatsapp.config import config
@@ -29,6 +34,8 @@ from whatsapp.config import config
 # ============================================================
 class AgentContextData(BaseModel):
     sheet_crm_id: str | None = None
+    # Media que las tools adjuntan a la respuesta (se envía después del texto)
+    attachments: list[dict] = Field(default_factory=list)
 
 
 USER_CONTEXTS: dict[str, RunContextWrapper[AgentContextData]] = {}
@@ -164,6 +171,124 @@ async def safety_guardrail(
     )
 
 
+# ============================================================
+# SUPERSEDE: CANCELAR CORRIDAS DESACTUALIZADAS
+# ============================================================
+class RunSuperseded(Exception):
+    """Se lanza en un punto seguro cuando llegó un mensaje más nuevo."""
+
+
+class _RunHandle:
+    """Corrida en curso de una sesión."""
+
+    def __init__(self, session_key: str, user_message: str):
+        self.session_key = session_key
+        self.user_message = user_message
+        self.task: asyncio.Task | None = None
+        self.started_at = time.monotonic()
+        self.in_llm_call = False
+        self.input_persisted = False
+        self.superseded = False
+        self.tokens_used = 0
+
+
+class SupersedeHooks(RunHooks):
+    """
+    Hooks que marcan los puntos seguros de una corrida:
+    - Durante una llamada al LLM no hay tools ejecutándose → se puede cancelar.
+    - Al empezar cada llamada al LLM, los tools del turno anterior ya
+      terminaron y quedaron guardados en la sesión → se aborta si corresponde.
+    """
+
+    def __init__(self, handle: _RunHandle):
+        self.handle = handle
+
+    async def on_agent_start(self, context, agent):
+        # El SDK guarda el input del usuario en la sesión antes de este hook
+        self.handle.input_persisted = True
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items):
+        if self.handle.superseded:
+            raise RunSuperseded()
+        self.handle.in_llm_call = True
+
+    async def on_llm_end(self, context, agent, response):
+        self.handle.in_llm_call = False
+        self.handle.tokens_used = context.usage.total_tokens
+
+
+ACTIVE_RUNS: dict[str, _RunHandle] = {}
+
+# Mensajes de corridas canceladas antes de persistirse en la sesión
+SUPERSEDED_INPUTS: dict[str, list[str]] = {}
+
+SUPERSEDE_STATS = {
+    "runs_completed": 0,
+    "runs_superseded": 0,
+    "hard_cancels": 0,
+    "deferred_cancels": 0,
+    "tokens_completed_total": 0,
+    "seconds_completed_total": 0.0,
+    "tokens_spent_superseded": 0,
+    "estimated_tokens_saved": 0,
+    "estimated_seconds_saved": 0.0,
+}
+
+
+def supersede_active_run(session_key: str) -> bool:
+    """
+    Pide cancelar la corrida en curso de la sesión porque llegó un mensaje
+    más nuevo. Si la corrida está esperando al LLM se cancela de inmediato;
+    si está ejecutando tools, se aborta al inicio de la siguiente llamada.
+
+    Returns:
+        True si había una corrida en curso.
+    """
+    if not config.supersede_inflight_runs:
+        return False
+
+    handle = ACTIVE_RUNS.get(session_key)
+    if handle is None or handle.superseded or handle.task is None:
+        return False
+
+    handle.superseded = True
+    if handle.in_llm_call or not handle.input_persisted:
+        handle.task.cancel()
+        SUPERSEDE_STATS["hard_cancels"] += 1
+    else:
+        SUPERSEDE_STATS["deferred_cancels"] += 1
+
+    print(f"[SUPERSEDE] Corrida en curso reemplazada (session={session_key})")
+    return True
+
+
+def _record_superseded(handle: _RunHandle):
+    elapsed = time.monotonic() - handle.started_at
+    SUPERSEDE_STATS["runs_superseded"] += 1
+    SUPERSEDE_STATS["tokens_spent_superseded"] += handle.tokens_used
+
+    # Estimación: lo que habría costado terminarla según el promedio histórico
+    completed = SUPERSEDE_STATS["runs_completed"]
+    if completed:
+        avg_tokens = SUPERSEDE_STATS["tokens_completed_total"] / completed
+        avg_seconds = SUPERSEDE_STATS["seconds_completed_total"] / completed
+        SUPERSEDE_STATS["estimated_tokens_saved"] += int(
+            max(0, avg_tokens - handle.tokens_used)
+        )
+        SUPERSEDE_STATS["estimated_seconds_saved"] += max(0.0, avg_seconds - elapsed)
+
+    # Si el input no llegó a guardarse, se combina con el próximo mensaje
+    if not handle.input_persisted:
+        SUPERSEDED_INPUTS.setdefault(handle.session_key, []).append(handle.user_message)
+
+
+def get_supersede_stats() -> dict:
+    stats = dict(SUPERSEDE_STATS)
+    stats["estimated_seconds_saved"] = round(stats["estimated_seconds_saved"], 2)
+    stats["active_runs"] = len(ACTIVE_RUNS)
+    return stats
+
+
 # ============================================================
 # SERVICIO PRINCIPAL DEL AGENTE
 # ============================================================
@@ -192,6 +317,14 @@ async def agent_service(
             ctx_wrapper.context.sheet_crm_id = sheet_crm_id
             print(f"[CONTEXT] sheet_crm_id actualizado")
 
+        # Los adjuntos son por respuesta
+        ctx_wrapper.context.attachments = []
+
+        # Combinar mensajes de corridas reemplazadas que no llegaron a la sesión
+        pending = SUPERSEDED_INPUTS.pop(session_key, [])
+        if pending:
+            user_message = "\n".join(pending + [user_message])
+
         # Construir prompt
         if user_data:
             extra = "\n".join([f"{k}: {v}" for k, v in user_data.items()])
@@ -208,12 +341,39 @@ async def agent_service(
             model_settings=ModelSettings(tool_choice="auto"),
         )
 
-        # Ejecutar
-        result = await Runner.run(
-            agent,
-            full_prompt,
-            session=session,
-            context=ctx_wrapper.context,
+        # Ejecutar (como task registrada para poder reemplazarla)
+        handle = _RunHandle(session_key, user_message)
+        handle.task = asyncio.create_task(
+            Runner.run(
+                agent,
+                full_prompt,
+                session=session,
+                context=ctx_wrapper.context,
+                hooks=SupersedeHooks(handle),
+            )
+        )
+        ACTIVE_RUNS[session_key] = handle
+
+        try:
+            result = await handle.task
+        except (asyncio.CancelledError, RunSuperseded):
+            if not handle.superseded:
+                # Cancelaron a quien llama: no dejar la corrida huérfana
+                handle.task.cancel()
+                raise
+            _record_superseded(handle)
+            print("[SUPERSEDE] Corrida cancelada en punto seguro")
+            return {"final_output": None, "superseded": True}
+        finally:
+            if ACTIVE_RUNS.get(session_key) is handle:
+                del ACTIVE_RUNS[session_key]
+
+        SUPERSEDE_STATS["runs_completed"] += 1
+        SUPERSEDE_STATS[
+            "tokens_completed_total"
+        ] += result.context_wrapper.usage.total_tokens
+        SUPERSEDE_STATS["seconds_completed_total"] += (
+            time.monotonic() - handle.started_at
         )
 
         await session.store_run_usage(result)
@@ -222,7 +382,10 @@ async def agent_service(
 
         print("[AGENT] Respuesta generada")
 
-        return {"final_output": output}
+        return {
+            "final_output": output,
+            "attachments": list(ctx_wrapper.context.attachments),
+        }
 
     except InputGuardrailTripwireTriggered:
         print("[GUARDRAIL] Mensaje bloqueado")
@@ -74,6 +74,12 @@ class GetServiceByNameInput(BaseModel):
     service_name: str = Field(..., description="Nombre del servicio a buscar")
 
 
+class AttachServiceMediaInput(BaseModel):
+    """Input para adjuntar la imagen o el brochure de un servicio a la respuesta."""
+
+    service_name: str = Field(..., description="Nombre exacto del servicio")
+
+
 # ====================================================
 # 📅 CALENDAR MODELS
 # ====================================================
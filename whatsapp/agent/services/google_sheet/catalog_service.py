@@ -10,6 +10,10 @@ gc = get_gspread_client(service_name="CatalogService")
 # Usamos directamente las variables de config
 SHEET_NAME = config.sheet_name_catalog
 
+# Columnas del catálogo con URLs de archivos para enviar al cliente
+# (varias URLs en una celda se separan por coma o salto de línea)
+MEDIA_COLUMNS = ("Imagen", "Brochure")
+
 
 class CatalogService:
     @staticmethod
@@ -44,3 +48,24 @@ class CatalogService:
             return {"success": False, "error": "Servicio no encontrado"}
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    @staticmethod
+    def get_service_media(service_name: str, ctx=None) -> dict:
+        """
+        URLs de imagen / brochure de un servicio (columnas MEDIA_COLUMNS).
+        """
+        result = CatalogService.get_service_by_name(service_name, ctx=ctx)
+        if not result.get("success"):
+            return result
+
+        service = result["service"]
+        media = []
+        for column in MEDIA_COLUMNS:
+            for url in str(service.get(column) or "").replace("\n", ",").split(","):
+                url = url.strip()
+                if url.startswith(("http://", "https://")):
+                    media.append({"url": url, "caption": service.get("Nombre")})
+
+        if not media:
+            return {"success": False, "error": "El servicio no tiene archivos"}
+        return {"success": True, "media": media}
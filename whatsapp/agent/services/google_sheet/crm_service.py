@@ -5,8 +5,14 @@ import pytz
 import shortuuid
 
 from whatsapp.agent.services.google_sheet.gspread_helper import (
+    RowWriteBuilder,
+    find_records,
+    find_row_indices,
     get_gspread_client,
     get_spreadsheet_id_from_context,
+    invalidate_headers,
+    notify_row_changed,
+    read_columns,
 )
 from whatsapp.config import config
 
@@ -27,14 +33,19 @@ class CRMService:
         spreadsheet_id = get_spreadsheet_id_from_context(ctx)
         sh = gc.open_by_key(spreadsheet_id)
         worksheet = sh.worksheet(SHEET_NAME)
-        all_records = worksheet.get_all_records()
+        # Solo las columnas Id y Telefono, no la hoja completa
+        columns = read_columns(worksheet, ["Id", "Telefono"])
+        ids = columns.get("Id", [])
+        phones = columns.get("Telefono", [])
         phone_norm = "".join(filter(str.isdigit, str(client_id_or_phone)))
 
-        for row in all_records:
-            if str(row.get("Id")) == str(client_id_or_phone):
-                return row.get("Id")
-            if "".join(filter(str.isdigit, str(row.get("Telefono")))) == phone_norm:
-                return row.get("Id")
+        for offset in range(max(len(ids), len(phones))):
+            row_id = ids[offset] if offset < len(ids) else ""
+            phone = phones[offset] if offset < len(phones) else ""
+            if str(row_id) == str(client_id_or_phone):
+                return row_id
+            if "".join(filter(str.isdigit, str(phone))) == phone_norm:
+                return row_id
         return None
 
     @staticmethod
@@ -46,24 +57,33 @@ class CRMService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME)
-            all_records = worksheet.get_all_records()
             telefono_norm = (
                 "".join(filter(str.isdigit, str(telefono))) if telefono else ""
             )
 
-            for row in all_records:
-                matched_by = None
+            def match_by(row: dict) -> str | None:
                 if (
                     telefono
                     and "".join(filter(str.isdigit, str(row.get("Telefono"))))
                     == telefono_norm
                 ):
-                    matched_by = "telefono"
-                elif correo and str(row.get("Correo")).lower() == str(correo).lower():
-                    matched_by = "correo"
-                elif usuario and str(row.get("Usuario")) == str(usuario):
-                    matched_by = "usuario"
+                    return "telefono"
+                if correo and str(row.get("Correo")).lower() == str(correo).lower():
+                    return "correo"
+                if usuario and str(row.get("Usuario")) == str(usuario):
+                    return "usuario"
+                return None
+
+            # Se buscan en las columnas clave y solo se trae la fila encontrada
+            found = find_records(
+                worksheet,
+                ["Telefono", "Correo", "Usuario"],
+                lambda keys: match_by(keys) is not None,
+                limit=1,
+            )
 
+            for _, row in found:
+                matched_by = match_by(row)
                 if matched_by:
                     return {
                         "exists": True,
@@ -84,6 +104,7 @@ class CRMService:
             return {"exists": False, "client_id": None}
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"error": str(e)}
 
     @staticmethod
@@ -100,23 +121,27 @@ class CRMService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME)
-            all_records = worksheet.get_all_records()
             fecha_actual = datetime.now(TIMEZONE).strftime("%Y-%m-%d %H:%M:%S")
             client_id = shortuuid.ShortUUID().random(length=6)
-            next_row = len(all_records) + 2
-
-            worksheet.update_cell(next_row, 1, client_id)
-            worksheet.update_cell(next_row, 2, nombre)
-            worksheet.update_cell(next_row, 3, telefono or "")
-            worksheet.update_cell(next_row, 4, correo or "")
-            worksheet.update_cell(next_row, 5, "Lead")
-            worksheet.update_cell(next_row, 6, "Nuevo")
-            worksheet.update_cell(next_row, 7, nota or "")
-            worksheet.update_cell(next_row, 8, usuario or "")
-            worksheet.update_cell(next_row, 9, canal)
-            worksheet.update_cell(next_row, 10, fecha_actual)
-            worksheet.update_cell(next_row, 11, "")
-            worksheet.update_cell(next_row, 12, "")
+
+            # Toda la fila en un solo append_rows
+            row = RowWriteBuilder(worksheet)
+            row.update(
+                {
+                    "Id": client_id,
+                    "Nombre": nombre,
+                    "Telefono": telefono or "",
+                    "Correo": correo or "",
+                    "Tipo": "Lead",
+                    "Estado": "Nuevo",
+                    "Nota": nota or "",
+                    "Usuario": usuario or "",
+                    "Canal": canal,
+                }
+            )
+            # La hoja Lead de algunos negocios usa "Fecha Adquisicion"
+            row.set(("Fecha Creacion", "Fecha Adquisicion"), fecha_actual)
+            row.append()
 
             return {
                 "success": True,
@@ -127,6 +152,7 @@ class CRMService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
 
     @staticmethod
@@ -147,36 +173,25 @@ class CRMService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME)
-            all_records = worksheet.get_all_records()
-            updated_fields = []
-
-            col_map = {
-                "Id": 1,
-                "Nombre": 2,
-                "Telefono": 3,
-                "Correo": 4,
-                "Tipo": 5,
-                "Estado": 6,
-                "Nota": 7,
-                "Usuario": 8,
-                "Canal": 9,
-                "Fecha Creacion": 10,
-                "Fecha Conversion": 11,
-                "Thread_Id": 12,
-            }
 
-            for idx, row in enumerate(all_records, start=2):
-                if str(row.get("Id")) == str(resolved_id):
-                    for key, value in fields.items():
-                        col = col_map.get(key)
-                        if col:
-                            worksheet.update_cell(idx, col, value)
-                            updated_fields.append(key)
-                    return {
-                        "success": True,
-                        "client_id": resolved_id,
-                        "updated_fields": updated_fields,
-                    }
+            indices = find_row_indices(
+                worksheet,
+                ["Id"],
+                lambda keys: str(keys.get("Id")) == str(resolved_id),
+                limit=1,
+            )
+
+            for idx in indices:
+                # Todos los campos en un solo batch_update
+                row = RowWriteBuilder(worksheet)
+                updated_fields = row.update(fields)
+                row.update_row(idx)
+                notify_row_changed(spreadsheet_id, SHEET_NAME, idx)
+                return {
+                    "success": True,
+                    "client_id": resolved_id,
+                    "updated_fields": updated_fields,
+                }
 
             return {
                 "success": False,
@@ -184,4 +199,5 @@ class CRMService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
@@ -4,12 +4,20 @@ Evita duplicación de código entre servicios.
 Ahora soporta uso del sheet_crm_id desde contexto.
 """
 
+import logging
+import re
+import time
+from typing import Any, Callable
+
 import gspread
 from agents import RunContextWrapper
 from google.oauth2.service_account import Credentials
+from gspread.utils import ValueInputOption, numericise, numericise_all, rowcol_to_a1
 
 from whatsapp.config import config
 
+logger = logging.getLogger("whatsapp")
+
 
 def get_gspread_client(service_name: str = "Service") -> gspread.Client:
     """
@@ -53,3 +61,259 @@ def get_spreadsheet_id_from_context(ctx: RunContextWrapper = None) -> str:
         "No se encontró 'sheet_crm_id' en el contexto. "
         "Debe proporcionarse explícitamente en el contexto del agente."
     )
+
+
+# ==========================================================
+# Lecturas por columnas
+# ==========================================================
+# Buscar una fila con get_all_records() descarga la hoja entera. Aquí se
+# leen solo las columnas clave (Id, Telefono, Correo, Id Cliente...) en un
+# batch_get, se ubican las filas que coinciden y se traen únicamente esas
+# filas por rango A1. Los valores se numerizan igual que get_all_records().
+#
+# Los encabezados se cachean SHEET_HEADER_TTL_SECONDS. Se releen antes si
+# falta una columna pedida (como mucho cada HEADER_RECHECK_SECONDS) y se
+# olvidan ante cualquier error de los servicios. Si alguien reordena
+# columnas sin que nada falle, las lecturas y escrituras pueden usar las
+# posiciones viejas hasta que venza el TTL.
+
+# {(spreadsheet_id, worksheet_id): (leído_en, encabezados)}
+_HEADER_CACHE: dict[tuple[str, int], tuple[float, list[str]]] = {}
+
+# Antigüedad mínima de la caché para releer por una columna faltante
+HEADER_RECHECK_SECONDS = 30
+
+
+def _column_letter(col: int) -> str:
+    return rowcol_to_a1(1, col)[:-1]
+
+
+def get_headers(worksheet: gspread.Worksheet, max_age: float = None) -> list[str]:
+    """
+    Encabezados (fila 1, sin espacios sobrantes) de la hoja, cacheados
+    SHEET_HEADER_TTL_SECONDS (o `max_age` segundos si se indica).
+    """
+    if max_age is None:
+        max_age = config.sheet_header_ttl_seconds
+    key = (worksheet.spreadsheet_id, worksheet.id)
+    cached = _HEADER_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return cached[1]
+
+    headers = [str(h).strip() for h in worksheet.row_values(1)]
+    _HEADER_CACHE[key] = (time.monotonic(), headers)
+    return headers
+
+
+def get_headers_with(worksheet: gspread.Worksheet, columns) -> list[str]:
+    """
+    get_headers, pero si falta alguna de `columns` se releen (quizás la
+    agregaron o renombraron después de cachear).
+    """
+    headers = get_headers(worksheet)
+    if any(column not in headers for column in columns):
+        headers = get_headers(worksheet, max_age=HEADER_RECHECK_SECONDS)
+    return headers
+
+
+def invalidate_headers(spreadsheet_id: str | None):
+    """Olvida los encabezados cacheados de todas las hojas del spreadsheet."""
+    if not spreadsheet_id:
+        return
+    for key in [key for key in _HEADER_CACHE if key[0] == spreadsheet_id]:
+        _HEADER_CACHE.pop(key, None)
+
+
+def read_columns(worksheet: gspread.Worksheet, columns: list[str]) -> dict[str, list]:
+    """
+    Valores de las columnas pedidas desde la fila 2, en una sola lectura.
+    Las columnas que no existen en la hoja se omiten.
+
+    Returns:
+        {columna: [valor fila 2, valor fila 3, ...]}
+    """
+    headers = get_headers_with(worksheet, columns)
+    present = [column for column in columns if column in headers]
+    if not present:
+        return {}
+
+    ranges = []
+    for column in present:
+        letter = _column_letter(headers.index(column) + 1)
+        ranges.append(f"{letter}2:{letter}")
+
+    results = worksheet.batch_get(ranges)
+    return {
+        column: [numericise(cells[0]) if cells else "" for cells in values]
+        for column, values in zip(present, results)
+    }
+
+
+def find_row_indices(
+    worksheet: gspread.Worksheet,
+    columns: list[str],
+    match,
+    limit: int = None,
+) -> list[int]:
+    """
+    Números de fila (base 1, como en la hoja) cuyas columnas clave cumplen
+    `match({columna: valor})`. Solo lee esas columnas.
+    """
+    values = read_columns(worksheet, columns)
+    length = max((len(column) for column in values.values()), default=0)
+
+    found = []
+    for offset in range(length):
+        keys = {
+            column: column_values[offset] if offset < len(column_values) else ""
+            for column, column_values in values.items()
+        }
+        if match(keys):
+            found.append(offset + 2)
+            if limit and len(found) >= limit:
+                break
+    return found
+
+
+def get_rows(worksheet: gspread.Worksheet, row_indices: list[int]) -> list[dict]:
+    """Filas completas (como dict por encabezado) leídas por rango A1."""
+    headers = get_headers(worksheet)
+    if not row_indices or not headers:
+        return []
+
+    last = _column_letter(len(headers))
+    results = worksheet.batch_get([f"A{row}:{last}{row}" for row in row_indices])
+
+    rows = []
+    for values in results:
+        cells = list(values[0]) if values else []
+        cells += [""] * (len(headers) - len(cells))
+        rows.append(dict(zip(headers, numericise_all(cells))))
+    return rows
+
+
+def find_records(
+    worksheet: gspread.Worksheet,
+    columns: list[str],
+    match,
+    limit: int = None,
+) -> list[tuple[int, dict]]:
+    """
+    find_row_indices + get_rows: [(fila, registro)] de las filas que
+    coinciden, sin descargar la hoja completa.
+    """
+    indices = find_row_indices(worksheet, columns, match, limit=limit)
+    return list(zip(indices, get_rows(worksheet, indices)))
+
+
+# ==========================================================
+# Escrituras por fila
+# ==========================================================
+# Quien cachea filas fuera de esta capa (p. ej. el índice de leads del
+# webhook) se suscribe aquí; los servicios avisan qué fila modificaron sin
+# depender de esa caché.
+_ROW_CHANGE_LISTENERS: list[Callable[[str, str, int], None]] = []
+
+
+def on_row_changed(listener: Callable[[str, str, int], None]):
+    """Registra `listener(spreadsheet_id, nombre_hoja, fila)`."""
+    _ROW_CHANGE_LISTENERS.append(listener)
+
+
+def notify_row_changed(spreadsheet_id: str, sheet_name: str, row_index: int):
+    for listener in _ROW_CHANGE_LISTENERS:
+        try:
+            listener(spreadsheet_id, sheet_name, row_index)
+        except Exception as e:
+            logger.warning(f"⚠️ Aviso de fila modificada fallido: {e}")
+
+
+_UPDATED_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def appended_row(response: dict) -> int | None:
+    """Número de fila escrita según el updatedRange de append_rows/append_row."""
+    updated_range = ((response or {}).get("updates") or {}).get("updatedRange", "")
+    match = _UPDATED_ROW.search(updated_range)
+    return int(match.group(1)) if match else None
+
+
+class RowWriteBuilder:
+    """
+    Junta los cambios de una fila y los envía en una sola llamada:
+    batch_update para una fila existente, append_rows para una nueva (en
+    lugar de un update_cell por celda). Las columnas se ubican por el
+    encabezado cacheado de la hoja, no por posiciones fijas.
+
+    Los valores se escriben como USER_ENTERED, igual que update_cell.
+    """
+
+    def __init__(self, worksheet: gspread.Worksheet):
+        self.worksheet = worksheet
+        self.headers = get_headers(worksheet)
+        self.values: dict[str, Any] = {}
+
+    def _column(self, column) -> str | None:
+        names = (column,) if isinstance(column, str) else column
+        if not any(name in self.headers for name in names):
+            # ¿Columna nueva o renombrada? Se releen los encabezados
+            self.headers = get_headers_with(self.worksheet, names)
+        for name in names:
+            if name in self.headers:
+                return name
+        return None
+
+    def set(self, column, value) -> bool:
+        """
+        Args:
+            column: encabezado, o tupla de nombres alternativos (se usa el
+                primero que exista en la hoja)
+
+        Returns:
+            False si la columna no existe en la hoja (el valor se ignora)
+        """
+        name = self._column(column)
+        if name is None:
+            return False
+        self.values[name] = value
+        return True
+
+    def update(self, fields: dict) -> list[str]:
+        """set() de varios campos. Returns: los que existen en la hoja."""
+        return [field for field, value in fields.items() if self.set(field, value)]
+
+    def update_row(self, row_index: int) -> dict | None:
+        """Escribe los valores en la fila `row_index` con un solo batch_update."""
+        return self.update_rows([row_index])
+
+    def update_rows(self, row_indices: list[int]) -> dict | None:
+        """Los mismos valores en varias filas, también en un solo batch_update."""
+        if not self.values or not row_indices:
+            return None
+        data = [
+            {
+                "range": f"{_column_letter(self.headers.index(column) + 1)}{row_index}",
+                "values": [[value]],
+            }
+            for row_index in row_indices
+            for column, value in self.values.items()
+        ]
+        return self.worksheet.batch_update(
+            data, value_input_option=ValueInputOption.user_entered
+        )
+
+    def append(self) -> int | None:
+        """
+        Agrega una fila nueva con un solo append_rows (columnas sin valor
+        quedan vacías).
+
+        Returns:
+            número de la fila creada (None si la respuesta no lo trae)
+        """
+        if not self.headers:
+            raise ValueError(f"La hoja '{self.worksheet.title}' no tiene encabezados")
+        row = [self.values.get(header, "") for header in self.headers]
+        response = self.worksheet.append_rows(
+            [row], value_input_option=ValueInputOption.user_entered
+        )
+        return appended_row(response)
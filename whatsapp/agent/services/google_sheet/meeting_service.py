@@ -2,8 +2,12 @@ import logging
 from datetime import datetime
 
 from whatsapp.agent.services.google_sheet.gspread_helper import (
+    RowWriteBuilder,
+    find_records,
+    find_row_indices,
     get_gspread_client,
     get_spreadsheet_id_from_context,
+    invalidate_headers,
 )
 from whatsapp.config import config
 
@@ -47,30 +51,32 @@ class MeetingService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_MEETINGS)
-            all_records = worksheet.get_all_records()
 
-            # Normalizar y buscar si ya existe el event_id
-            for idx, row in enumerate(all_records, start=2):
-                nrow = _normalize_row(row)
-                if str(nrow.get("Id")) == str(event_id):
-                    logger.warning(
-                        f"⚠️ Reunión {event_id} ya existe, actualizando en lugar de crear..."
-                    )
-                    # Ya existe → actualizar la fila en lugar de crear nueva
-                    return MeetingService.update_meeting(
-                        event_id,
-                        {
-                            "Asunto": asunto,
-                            "Detalles": detalles or "",
-                            "Fecha Inicio": fecha_inicio,
-                            "Meet_Link": meet_link or "",
-                            "Calendar_Link": calendar_link or "",
-                            "Estado": estado,
-                        },
-                        ctx=ctx,
-                    )
-
-            next_row = len(all_records) + 2
+            # Buscar si ya existe el event_id (solo la columna Id)
+            existing = find_row_indices(
+                worksheet,
+                ["Id"],
+                lambda keys: str(keys.get("Id")) == str(event_id),
+                limit=1,
+            )
+            if existing:
+                logger.warning(
+                    f"⚠️ Reunión {event_id} ya existe, actualizando en lugar de crear..."
+                )
+                # Ya existe → actualizar la fila en lugar de crear nueva
+                return MeetingService.update_meeting(
+                    event_id,
+                    {
+                        "Asunto": asunto,
+                        "Detalles": detalles or "",
+                        "Fecha Inicio": fecha_inicio,
+                        "Meet_Link": meet_link or "",
+                        "Calendar_Link": calendar_link or "",
+                        "Estado": estado,
+                    },
+                    ctx=ctx,
+                )
+
             tz = TIMEZONE
             fecha_creada = datetime.now(tz).strftime("%d/%m/%Y %H:%M")
 
@@ -95,15 +101,22 @@ class MeetingService:
 
             fecha_inicio_formatted = fecha_inicio_dt.strftime("%d/%m/%Y %H:%M")
 
-            worksheet.update_cell(next_row, 1, event_id)
-            worksheet.update_cell(next_row, 2, asunto)
-            worksheet.update_cell(next_row, 3, detalles or "")
-            worksheet.update_cell(next_row, 4, fecha_inicio_formatted)
-            worksheet.update_cell(next_row, 5, meet_link or "")
-            worksheet.update_cell(next_row, 6, calendar_link or "")
-            worksheet.update_cell(next_row, 7, estado)
-            worksheet.update_cell(next_row, 8, fecha_creada)
-            worksheet.update_cell(next_row, 9, id_cliente)
+            # Toda la fila en un solo append_rows
+            row = RowWriteBuilder(worksheet)
+            row.update(
+                {
+                    "Id": event_id,
+                    "Asunto": asunto,
+                    "Detalles": detalles or "",
+                    "Fecha Inicio": fecha_inicio_formatted,
+                    "Meet_Link": meet_link or "",
+                    "Calendar_Link": calendar_link or "",
+                    "Estado": estado,
+                    "Fecha Creada": fecha_creada,
+                    "Id Cliente": id_cliente,
+                }
+            )
+            next_row = row.append()
 
             logger.info(f"✅ Reunión creada en Sheet: fila {next_row}")
 
@@ -120,6 +133,7 @@ class MeetingService:
                 "fecha_creada": fecha_creada,
             }
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             logger.error(f"❌ Error creando reunión en Sheet: {e}")
             return {"success": False, "error": str(e)}
 
@@ -134,13 +148,19 @@ class MeetingService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_MEETINGS)
-            all_records = worksheet.get_all_records()
 
-            for idx, row in enumerate(all_records, start=2):
+            # Solo la columna Id y la fila encontrada, no la hoja completa
+            found = find_records(
+                worksheet,
+                ["Id"],
+                lambda keys: str(keys.get("Id")) == str(event_id),
+                limit=1,
+            )
+
+            for idx, row in found:
                 nrow = _normalize_row(row)
-                if str(nrow.get("Id")) == str(event_id):
-                    logger.info(f"✅ Reunión encontrada: {nrow.get('Asunto')}")
-                    return {"success": True, "meeting": nrow, "row_index": idx}
+                logger.info(f"✅ Reunión encontrada: {nrow.get('Asunto')}")
+                return {"success": True, "meeting": nrow, "row_index": idx}
 
             logger.warning(f"⚠️ Reunión no encontrada: {event_id}")
             return {
@@ -148,6 +168,7 @@ class MeetingService:
                 "error": f"No se encontró reunión con ID '{event_id}'",
             }
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             logger.error(f"❌ Error buscando reunión: {e}")
             return {"success": False, "error": str(e)}
 
@@ -173,6 +194,7 @@ class MeetingService:
             logger.info(f"✅ {len(meetings)} reuniones encontradas")
             return {"success": True, "count": len(meetings), "meetings": meetings}
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             logger.error(f"❌ Error buscando reuniones: {e}")
             return {"success": False, "error": str(e)}
 
@@ -204,6 +226,7 @@ class MeetingService:
                 "meetings": meetings,
             }
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             logger.error(f"❌ Error buscando reuniones por fecha: {e}")
             return {"success": False, "error": str(e)}
 
@@ -220,63 +243,55 @@ class MeetingService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_MEETINGS)
-            all_records = worksheet.get_all_records()
 
-            # Mapa de columnas (basado en la estructura que mencionaste)
-            col_map = {
-                "Id": 1,
-                "Asunto": 2,
-                "Detalles": 3,
-                "Fecha Inicio": 4,
-                "Meet_Link": 5,
-                "Calendar_Link": 6,
-                "Estado": 7,
-                "Fecha Creada": 8,
-                "Id Cliente": 9,
-            }
+            indices = find_row_indices(
+                worksheet,
+                ["Id"],
+                lambda keys: str(keys.get("Id")) == str(event_id),
+                limit=1,
+            )
 
             tz = TIMEZONE
 
-            for idx, row in enumerate(all_records, start=2):
-                nrow = _normalize_row(row)
-                if str(nrow.get("Id")) == str(event_id):
-                    logger.info(f"📝 Actualizando fila {idx}")
-
-                    for key, value in fields.items():
-                        col = col_map.get(key)
-                        if not col:
-                            continue
-
-                        if key == "Fecha Inicio" and value:
-                            try:
-                                fecha_dt = datetime.fromisoformat(value)
-                                if fecha_dt.tzinfo is None:
-                                    fecha_dt = tz.localize(fecha_dt)
-                                else:
-                                    fecha_dt = fecha_dt.astimezone(tz)
-                                # Evitar asignar fecha en pasado
-                                if fecha_dt <= datetime.now(tz):
-                                    logger.warning(
-                                        "⚠️ Intento de actualizar a fecha pasada"
-                                    )
-                                    return {
-                                        "success": False,
-                                        "error": "No se puede actualizar a una fecha pasada",
-                                    }
-                                value = fecha_dt.strftime("%d/%m/%Y %H:%M")
-                            except Exception:
-                                # si falla el parseo, usar el value tal cual
-                                pass
-
-                        worksheet.update_cell(idx, col, value)
+            for idx in indices:
+                logger.info(f"📝 Actualizando fila {idx}")
+
+                # Todos los campos en un solo batch_update; las columnas
+                # salen del encabezado de la hoja
+                row = RowWriteBuilder(worksheet)
+                for key, value in fields.items():
+                    if key == "Fecha Inicio" and value:
+                        try:
+                            fecha_dt = datetime.fromisoformat(value)
+                            if fecha_dt.tzinfo is None:
+                                fecha_dt = tz.localize(fecha_dt)
+                            else:
+                                fecha_dt = fecha_dt.astimezone(tz)
+                            # Evitar asignar fecha en pasado
+                            if fecha_dt <= datetime.now(tz):
+                                logger.warning(
+                                    "⚠️ Intento de actualizar a fecha pasada"
+                                )
+                                return {
+                                    "success": False,
+                                    "error": "No se puede actualizar a una fecha pasada",
+                                }
+                            value = fecha_dt.strftime("%d/%m/%Y %H:%M")
+                        except Exception:
+                            # si falla el parseo, usar el value tal cual
+                            pass
+
+                    if row.set(key, value):
                         logger.info(f"   ✓ {key}: {value}")
 
-                    logger.info(f"✅ Reunión actualizada correctamente")
-                    return {
-                        "success": True,
-                        "event_id": event_id,
-                        "updated_fields": list(fields.keys()),
-                    }
+                row.update_row(idx)
+
+                logger.info(f"✅ Reunión actualizada correctamente")
+                return {
+                    "success": True,
+                    "event_id": event_id,
+                    "updated_fields": list(fields.keys()),
+                }
 
             logger.warning(f"⚠️ Reunión no encontrada: {event_id}")
             return {
@@ -284,6 +299,7 @@ class MeetingService:
                 "error": f"No se encontró reunión con ID '{event_id}'",
             }
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             logger.error(f"❌ Error actualizando reunión: {e}")
             return {"success": False, "error": str(e)}
 
@@ -316,5 +332,6 @@ class MeetingService:
                 "error": f"No se encontró reunión con ID '{event_id}'",
             }
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             logger.error(f"❌ Error eliminando reunión: {e}")
             return {"success": False, "error": str(e)}
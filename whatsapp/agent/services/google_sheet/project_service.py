@@ -1,8 +1,12 @@
 from datetime import datetime
 
 from whatsapp.agent.services.google_sheet.gspread_helper import (
+    RowWriteBuilder,
+    find_records,
+    find_row_indices,
     get_gspread_client,
     get_spreadsheet_id_from_context,
+    invalidate_headers,
 )
 from whatsapp.config import config
 
@@ -37,22 +41,27 @@ class ProjectService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_PROJECTS)
-            all_records = worksheet.get_all_records()
 
             tz = TIMEZONE
             fecha_creada = datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
             project_id = f"PRJ-{datetime.now(tz).strftime('%Y%m%d%H%M%S')}"
-            next_row = len(all_records) + 2
-
-            worksheet.update_cell(next_row, 1, project_id)
-            worksheet.update_cell(next_row, 2, nombre)
-            worksheet.update_cell(next_row, 3, descripcion or "")
-            worksheet.update_cell(next_row, 4, servicio or "")
-            worksheet.update_cell(next_row, 5, estado)
-            worksheet.update_cell(next_row, 6, nota or "")
-            worksheet.update_cell(next_row, 7, fecha_inicio or fecha_creada)
-            worksheet.update_cell(next_row, 8, fecha_fin or "")
-            worksheet.update_cell(next_row, 9, id_cliente)
+
+            # Toda la fila en un solo append_rows
+            row = RowWriteBuilder(worksheet)
+            row.update(
+                {
+                    "Id": project_id,
+                    "Nombre": nombre,
+                    "Descripcion": descripcion or "",
+                    "Servicio": servicio or "",
+                    "Estado": estado,
+                    "Nota": nota or "",
+                    "Fecha_Inicio": fecha_inicio or fecha_creada,
+                    "Fecha_Fin": fecha_fin or "",
+                    "Id_Cliente": id_cliente,
+                }
+            )
+            row.append()
 
             return {
                 "success": True,
@@ -64,6 +73,7 @@ class ProjectService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
 
     @staticmethod
@@ -75,11 +85,17 @@ class ProjectService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_PROJECTS)
-            all_records = worksheet.get_all_records()
 
-            for row in all_records:
-                if str(row.get("Id")) == str(project_id):
-                    return {"success": True, "project": row}
+            # Solo la columna Id y la fila encontrada, no la hoja completa
+            found = find_records(
+                worksheet,
+                ["Id"],
+                lambda keys: str(keys.get("Id")) == str(project_id),
+                limit=1,
+            )
+
+            for _, row in found:
+                return {"success": True, "project": row}
 
             return {
                 "success": False,
@@ -87,6 +103,7 @@ class ProjectService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
 
     @staticmethod
@@ -108,6 +125,7 @@ class ProjectService:
             return {"success": True, "count": len(projects), "projects": projects}
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
 
     @staticmethod
@@ -121,31 +139,24 @@ class ProjectService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_PROJECTS)
-            all_records = worksheet.get_all_records()
 
-            col_map = {
-                "Id": 1,
-                "Nombre": 2,
-                "Descripcion": 3,
-                "Servicio": 4,
-                "Estado": 5,
-                "Nota": 6,
-                "Fecha_Inicio": 7,
-                "Fecha_Fin": 8,
-                "Id_Cliente": 9,
-            }
-
-            for idx, row in enumerate(all_records, start=2):
-                if str(row.get("Id")) == str(project_id):
-                    for key, value in fields.items():
-                        col = col_map.get(key)
-                        if col:
-                            worksheet.update_cell(idx, col, value)
-                    return {
-                        "success": True,
-                        "project_id": project_id,
-                        "updated_fields": list(fields.keys()),
-                    }
+            indices = find_row_indices(
+                worksheet,
+                ["Id"],
+                lambda keys: str(keys.get("Id")) == str(project_id),
+                limit=1,
+            )
+
+            for idx in indices:
+                # Todos los campos en un solo batch_update
+                row = RowWriteBuilder(worksheet)
+                row.update(fields)
+                row.update_row(idx)
+                return {
+                    "success": True,
+                    "project_id": project_id,
+                    "updated_fields": list(fields.keys()),
+                }
 
             return {
                 "success": False,
@@ -153,6 +164,7 @@ class ProjectService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
 
     @staticmethod
@@ -165,13 +177,18 @@ class ProjectService:
             spreadsheet_id = get_spreadsheet_id_from_context(ctx)
             sh = gc.open_by_key(spreadsheet_id)
             worksheet = sh.worksheet(SHEET_NAME_PROJECTS)
-            all_records = worksheet.get_all_records()
 
-            updated_count = 0
-            for idx, row in enumerate(all_records, start=2):
-                if str(row.get("Id_Cliente")) == str(id_cliente):
-                    worksheet.update_cell(idx, 6, nota)  # Columna 6 es Nota
-                    updated_count += 1
+            indices = find_row_indices(
+                worksheet,
+                ["Id_Cliente"],
+                lambda keys: str(keys.get("Id_Cliente")) == str(id_cliente),
+            )
+
+            # La Nota de todos los proyectos en un solo batch_update
+            row = RowWriteBuilder(worksheet)
+            row.set("Nota", nota)
+            row.update_rows(indices)
+            updated_count = len(indices)
 
             if updated_count == 0:
                 return {
@@ -187,6 +204,7 @@ class ProjectService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
 
     @staticmethod
@@ -214,4 +232,5 @@ class ProjectService:
             }
 
         except Exception as e:
+            invalidate_headers(getattr(ctx, "sheet_crm_id", None))
             return {"success": False, "error": str(e)}
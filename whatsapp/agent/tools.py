@@ -12,6 +12,7 @@ import pytz
 from agents import RunContextWrapper, function_tool
 
 from whatsapp.agent.models import (
+    AttachServiceMediaInput,
     CalendarCheckAvailabilityInput,
     CalendarCreateMeetInput,
     CalendarGetEventDetailsInput,
@@ -151,6 +152,35 @@ def get_service_by_name(wrapper: RunContextWrapper, input: GetServiceByNameInput
     return CatalogService.get_service_by_name(input.service_name, ctx=ctx)
 
 
+@function_tool
+def attach_service_media(wrapper: RunContextWrapper, input: AttachServiceMediaInput):
+    """
+    Adjunta a la respuesta la imagen y/o el brochure de un servicio del
+    catálogo. Los archivos se envían automáticamente después del texto.
+    """
+    ctx = wrapper.context
+    result = CatalogService.get_service_media(input.service_name, ctx=ctx)
+    if not result.get("success"):
+        return result
+
+    attached = {a["url"] for a in ctx.attachments}
+    added = []
+    for media in result["media"]:
+        if len(ctx.attachments) >= config.outbound_max_attachments:
+            break
+        if media["url"] not in attached:
+            ctx.attachments.append(media)
+            attached.add(media["url"])
+            added.append(media["url"])
+
+    logger.info(f"📎 [TOOL] attach_service_media: {len(added)} archivo(s)")
+    return {
+        "success": True,
+        "attached": len(added),
+        "message": "Los archivos se enviarán después de tu respuesta",
+    }
+
+
 # =============================
 # 🗓️ DISPONIBILIDAD
 # =============================
@@ -300,6 +330,7 @@ ALL_TOOLS = [
     update_client_status,
     get_all_services,
     get_service_by_name,
+    attach_service_media,
     calendar_check_availability,
     calendar_create_meet,
     calendar_update_meet,
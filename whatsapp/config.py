@@ -15,6 +15,14 @@ if not logger.handlers:
     )
 
 
+def env_bool(name: str, default: bool = False) -> bool:
+    """Lee una variable de entorno booleana ("true", "1", "yes", "si")."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "si", "sí")
+
+
 class Config:
     def __init__(self):
         self.environment = os.getenv("ENVIRONMENT", "development").lower()
@@ -54,6 +62,132 @@ class Config:
         # =========================
         self.verify_token = os.getenv("VERIFY_TOKEN", "fordez-token")
 
+        # =========================
+        # 🔐 FIRMA X-Hub-Signature-256
+        # =========================
+        # App Secret de la app de Meta. Vacío = sin verificación en desarrollo;
+        # en producción POST /webhook se rechaza con 403.
+        self.app_secret = os.getenv("APP_SECRET", "")
+        # Tamaño máximo aceptado para el cuerpo de POST /webhook (1 MB)
+        self.webhook_max_body_bytes = int(
+            os.getenv("WEBHOOK_MAX_BODY_BYTES", str(1024 * 1024))
+        )
+
+        # =========================
+        # 🌐 POOLS HTTP (Graph API y webhooks web)
+        # =========================
+        self.http_pool_limit = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+        self.http_pool_limit_per_host = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+        self.http_keepalive_seconds = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "60"))
+        self.http_connect_timeout = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+        self.http_timeout = float(os.getenv("HTTP_TIMEOUT", "15"))
+        # HTTP/2 para los webhooks web (requiere el paquete h2)
+        self.http_client_http2 = env_bool("HTTP_CLIENT_HTTP2", True)
+
+        # =========================
+        # 📤 ENVÍO SALIENTE (por phone_number_id)
+        # =========================
+        # Token bucket por número: mensajes/segundo sostenidos y ráfaga máxima
+        self.outbound_rate_per_second = float(
+            os.getenv("OUTBOUND_RATE_PER_SECOND", "20")
+        )
+        self.outbound_burst = int(os.getenv("OUTBOUND_BURST", "20"))
+        # Reintentos ante throttling (429, 130429, 131056), 5xx y errores de red
+        self.outbound_max_attempts = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "6"))
+        self.outbound_backoff_base = float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5"))
+        self.outbound_backoff_max = float(os.getenv("OUTBOUND_BACKOFF_MAX", "30"))
+        # Límite de caracteres por mensaje de texto (las respuestas largas se dividen)
+        self.whatsapp_text_limit = int(os.getenv("WHATSAPP_TEXT_LIMIT", "4096"))
+        # El indicador "escribiendo..." caduca a los ~25 s: se refresca antes
+        self.typing_refresh_seconds = float(os.getenv("TYPING_REFRESH_SECONDS", "20"))
+        # Media saliente (brochures/imágenes de servicios): el media ID de Meta
+        # vence a los 30 días; se reutiliza por negocio + sha256 hasta entonces
+        self.outbound_media_cache_dir = os.getenv(
+            "OUTBOUND_MEDIA_CACHE_DIR", "memory/outbound_media"
+        )
+        self.outbound_media_ttl_seconds = float(
+            os.getenv("OUTBOUND_MEDIA_TTL_SECONDS", str(29 * 24 * 3600))
+        )
+        # Cuánto se confía en que una URL sigue apuntando al mismo archivo
+        self.outbound_media_url_ttl_seconds = float(
+            os.getenv("OUTBOUND_MEDIA_URL_TTL_SECONDS", "86400")
+        )
+        self.outbound_media_max_bytes = int(
+            os.getenv("OUTBOUND_MEDIA_MAX_BYTES", str(16 * 1024 * 1024))
+        )
+        self.outbound_max_attachments = int(os.getenv("OUTBOUND_MAX_ATTACHMENTS", "3"))
+
+        # =========================
+        # 🌐 ENTREGA A WEBHOOKS WEB
+        # =========================
+        self.web_delivery_timeout = float(os.getenv("WEB_DELIVERY_TIMEOUT", "5"))
+        self.web_delivery_max_attempts = int(
+            os.getenv("WEB_DELIVERY_MAX_ATTEMPTS", "5")
+        )
+        self.web_delivery_backoff_base = float(
+            os.getenv("WEB_DELIVERY_BACKOFF_BASE", "1")
+        )
+        self.web_delivery_backoff_max = float(
+            os.getenv("WEB_DELIVERY_BACKOFF_MAX", "60")
+        )
+        # Circuit breaker por host: fallos seguidos para abrir y tiempo abierto
+        self.web_breaker_failures = int(os.getenv("WEB_BREAKER_FAILURES", "5"))
+        self.web_breaker_open_seconds = float(
+            os.getenv("WEB_BREAKER_OPEN_SECONDS", "30")
+        )
+        self.web_dead_letter_path = os.getenv(
+            "WEB_DEAD_LETTER_PATH", "memory/web_dead_letters.db"
+        )
+
+        # =========================
+        # 🎙️ MEDIA ENTRANTE (audios, imágenes, documentos)
+        # =========================
+        # WhatsApp admite audios de hasta 16 MB
+        self.media_max_bytes = int(os.getenv("MEDIA_MAX_BYTES", str(16 * 1024 * 1024)))
+        # Hasta este tamaño la descarga queda en memoria; más allá va a disco
+        self.media_spool_memory_bytes = int(
+            os.getenv("MEDIA_SPOOL_MEMORY_BYTES", str(1024 * 1024))
+        )
+        self.media_download_timeout = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "60"))
+        self.transcription_model = os.getenv("TRANSCRIPTION_MODEL", "gpt-4o-transcribe")
+        # Transcripciones simultáneas contra OpenAI
+        self.transcription_concurrency = int(
+            os.getenv("TRANSCRIPTION_CONCURRENCY", "4")
+        )
+        self.transcription_timeout = float(os.getenv("TRANSCRIPTION_TIMEOUT", "120"))
+        # Audios largos: fragmentos de ~N s cortados en silencios, con solape,
+        # transcritos en paralelo (requiere ffmpeg). Debajo de MIN_BYTES no
+        # se decodifica: una sola llamada.
+        self.transcription_chunk_min_bytes = int(
+            os.getenv("TRANSCRIPTION_CHUNK_MIN_BYTES", "150000")
+        )
+        self.transcription_chunk_seconds = float(
+            os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "30")
+        )
+        self.transcription_chunk_overlap = float(
+            os.getenv("TRANSCRIPTION_CHUNK_OVERLAP", "1.0")
+        )
+        self.transcription_max_seconds = int(
+            os.getenv("TRANSCRIPTION_MAX_SECONDS", "900")
+        )
+        # Imágenes: se reducen y recomprimen antes de la llamada de visión
+        self.image_max_side = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+        self.image_jpeg_quality = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+        self.vision_model = os.getenv("VISION_MODEL", "gpt-4o-mini")
+        self.vision_concurrency = int(os.getenv("VISION_CONCURRENCY", "4"))
+        self.vision_timeout = float(os.getenv("VISION_TIMEOUT", "60"))
+        # Documentos: texto extraído localmente, con límite de páginas y caracteres
+        self.document_max_pages = int(os.getenv("DOCUMENT_MAX_PAGES", "20"))
+        self.document_max_chars = int(os.getenv("DOCUMENT_MAX_CHARS", "20000"))
+        # Caché en disco del texto extraído por sha256 (tamaño 0 = desactivada)
+        self.media_cache_dir = os.getenv("MEDIA_CACHE_DIR", "memory/media_cache")
+        self.media_cache_size_limit = int(
+            os.getenv("MEDIA_CACHE_SIZE_LIMIT", str(256 * 1024 * 1024))
+        )
+        self.media_cache_ttl_seconds = float(
+            os.getenv("MEDIA_CACHE_TTL_SECONDS", str(30 * 24 * 3600))
+        )
+
         # =========================
         # 📄 SHEETS CONFIG
         # =========================
@@ -63,6 +197,94 @@ class Config:
         self.sheet_name_catalog = "Services"
         self.sheet_name_meetings = "Meetings"
         self.sheet_name_projects = "Projects"
+        # Encabezados de cada hoja cacheados para las lecturas por columnas
+        self.sheet_header_ttl_seconds = float(
+            os.getenv("SHEET_HEADER_TTL_SECONDS", "600")
+        )
+        # Índice en memoria de la hoja Lead por spreadsheet (teléfono → fila)
+        self.lead_index_ttl_seconds = float(os.getenv("LEAD_INDEX_TTL_SECONDS", "300"))
+        self.lead_index_max_sheets = int(os.getenv("LEAD_INDEX_MAX_SHEETS", "200"))
+
+        # =========================
+        # ⚡ PROCESAMIENTO WEBHOOK (ACK RÁPIDO)
+        # =========================
+        # Si está activo, /webhook responde 200 al instante y el pipeline
+        # corre en segundo plano en un pool de workers asyncio.
+        self.webhook_async_mode = env_bool("WEBHOOK_ASYNC_MODE", False)
+        self.webhook_workers = int(os.getenv("WEBHOOK_WORKERS", "4"))
+        self.webhook_queue_maxsize = int(os.getenv("WEBHOOK_QUEUE_MAXSIZE", "1000"))
+        self.webhook_drain_timeout = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "8"))
+
+        # =========================
+        # 🚦 CONTROL DE ADMISIÓN
+        # =========================
+        # Mensajes recorriendo el pipeline a la vez (0 = sin límite) y cuántos
+        # pueden esperar turno. Pasado eso: aviso de "ocupado" / HTTP 429.
+        self.admission_max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENT", "40"))
+        self.admission_max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+        self.admission_queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+        self.admission_busy_message = os.getenv(
+            "ADMISSION_BUSY_MESSAGE",
+            "Estamos recibiendo muchos mensajes en este momento. "
+            "Por favor, escríbenos de nuevo en unos minutos 🙏",
+        )
+
+        # =========================
+        # 🏢 PLANIFICADOR POR TENANT
+        # =========================
+        # Turnos globales (0 = sin límite) repartidos entre negocios según
+        # las columnas "Weight" y "Max Concurrency" de Credentials.
+        self.tenant_agent_slots = int(os.getenv("TENANT_AGENT_SLOTS", "16"))
+        self.tenant_sheets_slots = int(os.getenv("TENANT_SHEETS_SLOTS", "8"))
+        self.tenant_default_weight = float(os.getenv("TENANT_DEFAULT_WEIGHT", "1"))
+        self.tenant_default_max_concurrency = int(
+            os.getenv("TENANT_DEFAULT_MAX_CONCURRENCY", "0")
+        )
+
+        # =========================
+        # 📇 REGISTRO DE NEGOCIOS
+        # =========================
+        # Índice en memoria de Credentials refrescado en segundo plano; un
+        # cambio en la hoja tarda como máximo este intervalo en verse.
+        self.tenant_refresh_seconds = float(os.getenv("TENANT_REFRESH_SECONDS", "60"))
+        # Espera máxima por la primera carga si llega tráfico antes que ella
+        self.tenant_initial_load_timeout = float(
+            os.getenv("TENANT_INITIAL_LOAD_TIMEOUT", "15")
+        )
+        # Ids desconocidos: se rechazan sin tocar Google durante este TTL
+        self.tenant_negative_ttl_seconds = float(
+            os.getenv("TENANT_NEGATIVE_TTL_SECONDS", "300")
+        )
+        # Un id desconocido relee la hoja como mucho cada N segundos
+        self.tenant_miss_refresh_seconds = float(
+            os.getenv("TENANT_MISS_REFRESH_SECONDS", "15")
+        )
+        self.tenant_max_tracked_ids = int(os.getenv("TENANT_MAX_TRACKED_IDS", "10000"))
+
+        # =========================
+        # 🔁 IDEMPOTENCIA (wamid)
+        # =========================
+        # Meta reintenta durante horas/días: TTL por defecto de 7 días.
+        self.dedupe_ttl_seconds = float(os.getenv("DEDUPE_TTL_SECONDS", "604800"))
+        self.dedupe_max_entries = int(os.getenv("DEDUPE_MAX_ENTRIES", "50000"))
+        # Vacío = solo memoria. Ej: "memory/dedupe.db" para sobrevivir reinicios.
+        self.dedupe_sqlite_path = os.getenv("DEDUPE_SQLITE_PATH", "")
+
+        # =========================
+        # 🧺 COALESCENCIA DE RÁFAGAS
+        # =========================
+        # Ventana de debounce por sesión (0 = desactivado). Con ~1500 ms se
+        # combinan los mensajes cortos seguidos en una sola corrida del agente.
+        self.coalesce_window_ms = int(os.getenv("COALESCE_WINDOW_MS", "0"))
+        self.coalesce_max_wait_ms = int(os.getenv("COALESCE_MAX_WAIT_MS", "6000"))
+        self.coalesce_max_messages = int(os.getenv("COALESCE_MAX_MESSAGES", "10"))
+
+        # =========================
+        # ✂️ SUPERSEDE DE CORRIDAS
+        # =========================
+        # Un mensaje nuevo cancela (en punto seguro) la corrida en curso
+        # de la misma sesión y se reinicia con el contexto combinado.
+        self.supersede_inflight_runs = env_bool("SUPERSEDE_INFLIGHT_RUNS", True)
 
         # GOOGLE SCOPES
         self.scopes = [
@@ -0,0 +1,141 @@
+"""
+Caché de media direccionada por contenido (sha256).
+
+El mismo audio o imagen llega una y otra vez (reenvíos entre usuarios,
+reintentos de Meta) y cada vez se volvía a descargar y a pagar la
+transcripción. Aquí se guarda en disco (diskcache, LRU + TTL) el texto
+ya obtenido de cada archivo:
+
+    sha:<sha256>   → {"text", "kind", "size"}
+    id:<media_id>  → sha256 (clave secundaria)
+
+Con el media_id (reintento de Meta) o con el sha256 que devuelve la Graph
+API al resolver el media (reenvío) se evita la descarga y la transcripción.
+"""
+
+import logging
+import time
+
+import diskcache
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+class MediaCache:
+    def __init__(self, directory: str, size_limit: int, ttl_seconds: float):
+        self.directory = directory
+        self.size_limit = size_limit
+        self.ttl_seconds = ttl_seconds or None
+        self.enabled = size_limit > 0
+        self._cache: diskcache.Cache | None = None
+
+        # Métricas
+        self.lookups = 0
+        self.hits_by_media_id = 0
+        self.hits_by_sha = 0
+        self.stores = 0
+        self.bytes_saved = 0
+        self.errors = 0
+
+    def _get_cache(self) -> diskcache.Cache:
+        if self._cache is None:
+            self._cache = diskcache.Cache(
+                self.directory,
+                size_limit=self.size_limit,
+                eviction_policy="least-recently-used",
+            )
+            logger.info(f"🗄️ Caché de media lista en {self.directory}")
+        return self._cache
+
+    def _get(self, key: str):
+        try:
+            return self._get_cache().get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ Caché de media no disponible: {e}")
+            return None
+
+    def _hit(self, entry: dict, downloaded: bool = False) -> str:
+        if not downloaded:
+            self.bytes_saved += entry.get("size", 0)
+        return entry["text"]
+
+    def get_by_media_id(self, media_id: str) -> str | None:
+        """Texto ya extraído para este media_id (sin resolver ni descargar)."""
+        if not self.enabled:
+            return None
+        self.lookups += 1
+        sha256 = self._get(f"id:{media_id}")
+        entry = self._get(f"sha:{sha256}") if sha256 else None
+        if entry is None:
+            return None
+        self.hits_by_media_id += 1
+        return self._hit(entry)
+
+    def get_by_sha(
+        self, sha256: str, media_id: str = None, downloaded: bool = False
+    ) -> str | None:
+        """
+        Texto ya extraído para este contenido. Si se pasa `media_id`, se
+        registra como clave secundaria para el próximo reintento.
+        downloaded=True si el archivo ya se descargó: el acierto no ahorra
+        bytes, solo la extracción.
+        """
+        if not self.enabled or not sha256:
+            return None
+        entry = self._get(f"sha:{sha256}")
+        if entry is None:
+            return None
+        self.hits_by_sha += 1
+        if media_id:
+            self._set(f"id:{media_id}", sha256)
+        return self._hit(entry, downloaded)
+
+    def _set(self, key: str, value):
+        try:
+            self._get_cache().set(key, value, expire=self.ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️ No se pudo guardar en la caché de media: {e}")
+
+    def store(self, sha256: str, media_id: str, kind: str, text: str, size: int):
+        if not self.enabled or not sha256:
+            return
+        self._set(
+            f"sha:{sha256}",
+            {"text": text, "kind": kind, "size": size, "created_at": time.time()},
+        )
+        if media_id:
+            self._set(f"id:{media_id}", sha256)
+        self.stores += 1
+
+    def close(self):
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    def stats(self) -> dict:
+        hits = self.hits_by_media_id + self.hits_by_sha
+        data = {
+            "enabled": self.enabled,
+            "lookups": self.lookups,
+            "hits_by_media_id": self.hits_by_media_id,
+            "hits_by_sha": self.hits_by_sha,
+            "hit_ratio": round(hits / self.lookups, 3) if self.lookups else 0.0,
+            "stores": self.stores,
+            "bytes_saved": self.bytes_saved,
+            "errors": self.errors,
+        }
+        if self._cache is not None:
+            data["disk_bytes"] = self._cache.volume()
+        return data
+
+
+# Instancia global
+MEDIA_CACHE = MediaCache(
+    directory=config.media_cache_dir,
+    size_limit=config.media_cache_size_limit,
+    ttl_seconds=config.media_cache_ttl_seconds,
+)
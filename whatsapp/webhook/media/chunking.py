@@ -0,0 +1,149 @@
+"""
+Transcripción por fragmentos de audios largos.
+
+Una nota de voz de 5 minutos en una sola llamada significa una espera
+larga y serial antes de que el agente pueda empezar. Aquí el audio ya
+decodificado (PCM 16 kHz mono s16le) se divide en fragmentos de
+~`chunk_seconds` que cortan en silencios, cada uno solapado `overlap`
+segundos con el anterior; los fragmentos se transcriben en paralelo y los
+textos se unen en orden quitando las palabras repetidas por el solape.
+
+Módulo puro: no depende de config, de ffmpeg ni de la red (la función de
+transcripción se inyecta), así se puede medir con un backend simulado.
+"""
+
+import asyncio
+import io
+import re
+import wave
+from typing import Awaitable, Callable
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # s16le
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH
+
+_SILENCE_START = re.compile(r"silence_start:\s*(-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end:\s*([\d.]+)")
+_WORD_EDGES = re.compile(r"^\W+|\W+$")
+
+
+def parse_silencedetect(log: str) -> list[tuple[float, float]]:
+    """Intervalos (inicio, fin) reportados por el filtro silencedetect de ffmpeg."""
+    silences = []
+    start = None
+    for line in log.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    return silences
+
+
+def plan_chunks(
+    silences: list[tuple[float, float]],
+    duration: float,
+    chunk_seconds: float,
+    overlap: float,
+) -> list[tuple[float, float]]:
+    """
+    Divide [0, duration] en fragmentos (inicio, fin) en segundos.
+
+    Cada corte se hace en el punto medio del silencio más cercano a
+    `chunk_seconds` desde el corte anterior, buscando entre 0.5x y 1.5x;
+    sin silencios en esa ventana se corta en seco a `chunk_seconds`. Cada
+    fragmento empieza `overlap` segundos antes del corte anterior.
+    """
+    chunk_seconds = max(1.0, chunk_seconds)
+    max_chunk = chunk_seconds * 1.5
+    midpoints = [(start + end) / 2 for start, end in silences]
+
+    cuts = []
+    position = 0.0
+    while duration - position > max_chunk:
+        low = position + chunk_seconds * 0.5
+        high = position + max_chunk
+        target = position + chunk_seconds
+        candidates = [m for m in midpoints if low <= m <= high]
+        cut = min(candidates, key=lambda m: abs(m - target)) if candidates else target
+        cuts.append(cut)
+        position = cut
+
+    spans = []
+    previous = 0.0
+    for cut in cuts + [duration]:
+        spans.append((max(0.0, previous - overlap), cut))
+        previous = cut
+    return spans
+
+
+def pcm_to_wav(pcm: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def slice_pcm(pcm: bytes, start: float, end: float) -> bytes:
+    # Alineado a muestra para no partir un sample de 16 bits
+    first = int(start * SAMPLE_RATE) * SAMPLE_WIDTH
+    last = int(end * SAMPLE_RATE) * SAMPLE_WIDTH
+    return pcm[first:last]
+
+
+def _normalize(word: str) -> str:
+    return _WORD_EDGES.sub("", word).lower()
+
+
+def stitch_transcripts(parts: list[str], max_overlap_words: int = 12) -> str:
+    """
+    Une los textos de fragmentos consecutivos. Si el final de uno repite el
+    comienzo del siguiente (por el solape), las palabras repetidas se
+    quitan del siguiente. Una coincidencia de una sola palabra solo cuenta
+    si tiene 3+ letras, para no borrar repeticiones legítimas ("no, no").
+    """
+    words: list[str] = []
+    for part in parts:
+        incoming = part.split()
+        if not incoming:
+            continue
+
+        limit = min(max_overlap_words, len(words), len(incoming))
+        tail = [_normalize(w) for w in words[-limit:]] if limit else []
+        head = [_normalize(w) for w in incoming[:limit]]
+        for size in range(limit, 0, -1):
+            if tail[-size:] != head[:size]:
+                continue
+            if size > 1 or len(head[0]) >= 3:
+                incoming = incoming[size:]
+            break
+        words.extend(incoming)
+    return " ".join(words)
+
+
+async def transcribe_in_chunks(
+    pcm: bytes,
+    silences: list[tuple[float, float]],
+    transcribe: Callable[[bytes], Awaitable[str]],
+    chunk_seconds: float,
+    overlap: float,
+) -> tuple[str, int]:
+    """
+    Transcribe el PCM por fragmentos en paralelo. `transcribe` recibe un
+    WAV y devuelve su texto (la concurrencia la acota quien la provee).
+
+    Returns:
+        (texto unido, cantidad de fragmentos)
+    """
+    duration = len(pcm) / BYTES_PER_SECOND
+    spans = plan_chunks(silences, duration, chunk_seconds, overlap)
+    texts = await asyncio.gather(
+        *(transcribe(pcm_to_wav(slice_pcm(pcm, start, end))) for start, end in spans)
+    )
+    return stitch_transcripts(list(texts)), len(spans)
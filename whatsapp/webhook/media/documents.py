@@ -0,0 +1,200 @@
+"""
+Extracción local de texto de documentos (PDF, Word, PowerPoint, Excel, texto).
+
+Todo se lee en streaming y con límites para que un archivo grande no
+dispare memoria ni CPU:
+
+    - PDF: pypdf página a página, hasta `max_pages`
+    - docx / pptx / xlsx: el XML interno del zip con iterparse (sin cargar
+      el árbol completo); las diapositivas y hojas cuentan como páginas
+    - texto plano / CSV: los primeros `max_chars`
+
+El texto se corta en `max_chars`. Funciones síncronas (CPU): llamarlas con
+asyncio.to_thread.
+"""
+
+import re
+import zipfile
+from typing import IO
+from xml.etree.ElementTree import iterparse
+
+from pypdf import PdfReader
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_S = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+_NUMBERED = re.compile(r"(\d+)\.xml$")
+
+MIME_KINDS = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": "pptx",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/plain": "text",
+    "text/csv": "text",
+}
+
+EXTENSION_KINDS = {
+    "pdf": "pdf",
+    "docx": "docx",
+    "pptx": "pptx",
+    "xlsx": "xlsx",
+    "txt": "text",
+    "csv": "text",
+}
+
+
+class UnsupportedDocument(ValueError):
+    """Formato de documento que no se sabe leer."""
+
+
+class _TextBuffer:
+    """Acumula texto hasta `max_chars` y avisa cuando se llenó."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.parts: list[str] = []
+        self.size = 0
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.max_chars
+
+    def add(self, text: str):
+        text = text.strip()
+        if not text or self.full:
+            return
+        text = text[: self.max_chars - self.size]
+        self.parts.append(text)
+        self.size += len(text) + 1
+
+    def text(self) -> str:
+        return "\n".join(self.parts)
+
+
+def document_kind(mime_type: str, filename: str = None) -> str | None:
+    kind = MIME_KINDS.get((mime_type or "").lower())
+    if kind is None and filename and "." in filename:
+        kind = EXTENSION_KINDS.get(filename.rsplit(".", 1)[1].lower())
+    return kind
+
+
+def _numbered_members(archive: zipfile.ZipFile, prefix: str) -> list[str]:
+    """slide1.xml, slide2.xml, ... en orden numérico (no alfabético)."""
+    names = [
+        n for n in archive.namelist() if n.startswith(prefix) and _NUMBERED.search(n)
+    ]
+    return sorted(names, key=lambda n: int(_NUMBERED.search(n).group(1)))
+
+
+def _extract_pdf(file: IO[bytes], max_pages: int, buffer: _TextBuffer):
+    reader = PdfReader(file)
+    for page in reader.pages[:max_pages]:
+        buffer.add(page.extract_text() or "")
+        if buffer.full:
+            break
+
+
+def _extract_docx(archive: zipfile.ZipFile, buffer: _TextBuffer):
+    paragraph: list[str] = []
+    with archive.open("word/document.xml") as xml:
+        for _, element in iterparse(xml):
+            if element.tag == f"{_W}t" and element.text:
+                paragraph.append(element.text)
+            elif element.tag == f"{_W}p":
+                buffer.add("".join(paragraph))
+                paragraph = []
+                element.clear()
+                if buffer.full:
+                    return
+
+
+def _extract_pptx(archive: zipfile.ZipFile, max_pages: int, buffer: _TextBuffer):
+    for number, name in enumerate(_numbered_members(archive, "ppt/slides/slide")):
+        if number >= max_pages or buffer.full:
+            return
+        texts = []
+        with archive.open(name) as xml:
+            for _, element in iterparse(xml):
+                if element.tag == f"{_A}t" and element.text:
+                    texts.append(element.text)
+        buffer.add(f"[Diapositiva {number + 1}] " + " ".join(texts))
+
+
+def _shared_strings(archive: zipfile.ZipFile) -> list[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as xml:
+        for _, element in iterparse(xml):
+            if element.tag == f"{_S}si":
+                strings.append("".join(t.text or "" for t in element.iter(f"{_S}t")))
+                element.clear()
+    return strings
+
+
+def _extract_xlsx(archive: zipfile.ZipFile, max_pages: int, buffer: _TextBuffer):
+    strings = _shared_strings(archive)
+    sheets = _numbered_members(archive, "xl/worksheets/sheet")
+    for number, name in enumerate(sheets[:max_pages]):
+        buffer.add(f"[Hoja {number + 1}]")
+        with archive.open(name) as xml:
+            row: list[str] = []
+            for _, element in iterparse(xml):
+                if element.tag == f"{_S}c":
+                    value = element.find(f"{_S}v")
+                    inline = element.find(f"{_S}is")
+                    if element.get("t") == "s" and value is not None:
+                        index = int(value.text)
+                        row.append(strings[index] if index < len(strings) else "")
+                    elif inline is not None:
+                        row.append("".join(t.text or "" for t in inline.iter(f"{_S}t")))
+                    elif value is not None:
+                        row.append(value.text or "")
+                elif element.tag == f"{_S}row":
+                    buffer.add(" | ".join(cell for cell in row if cell))
+                    row = []
+                    element.clear()
+                    if buffer.full:
+                        return
+
+
+def extract_document_text(
+    file: IO[bytes],
+    mime_type: str,
+    filename: str = None,
+    max_pages: int = 20,
+    max_chars: int = 20000,
+) -> str:
+    """
+    Texto de un documento, con límite de páginas y de caracteres.
+
+    Raises:
+        UnsupportedDocument: si el formato no es PDF, Office o texto
+    """
+    kind = document_kind(mime_type, filename)
+    buffer = _TextBuffer(max_chars)
+
+    if kind == "pdf":
+        _extract_pdf(file, max_pages, buffer)
+    elif kind == "text":
+        buffer.add(file.read(max_chars * 4).decode("utf-8", errors="ignore"))
+    elif kind in ("docx", "pptx", "xlsx"):
+        try:
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile as e:
+            raise UnsupportedDocument(f"Archivo {kind} inválido: {e}") from e
+        with archive:
+            if kind == "docx":
+                _extract_docx(archive, buffer)
+            elif kind == "pptx":
+                _extract_pptx(archive, max_pages, buffer)
+            else:
+                _extract_xlsx(archive, max_pages, buffer)
+    else:
+        raise UnsupportedDocument(
+            f"Formato no soportado: {mime_type or filename or 'desconocido'}"
+        )
+
+    return buffer.text()
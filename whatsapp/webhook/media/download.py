@@ -0,0 +1,123 @@
+"""
+Descarga de media entrante de WhatsApp (audios, imágenes, documentos).
+
+Dos pasos contra la Graph API, ambos por el pool aiohttp compartido:
+
+    1. resolve_media: GET /{media_id} → URL firmada, mime_type, file_size
+       y sha256 del contenido
+    2. download_media: GET de la URL en streaming hacia un
+       SpooledTemporaryFile (en memoria hasta MEDIA_SPOOL_MEMORY_BYTES,
+       luego a disco) cortando al superar MEDIA_MAX_BYTES. El sha256 se
+       calcula mientras se descarga.
+
+Nada de esto bloquea el event loop: antes se usaba httpx.get síncrono.
+"""
+
+import hashlib
+import tempfile
+
+import aiohttp
+
+from whatsapp.config import config
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+from whatsapp.webhook.response.reply import read_graph_response
+
+GRAPH_API_URL = "https://graph.facebook.com/v20.0"
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaTooLarge(ValueError):
+    """El archivo supera MEDIA_MAX_BYTES."""
+
+    def __init__(self, size: int, limit: int):
+        super().__init__(f"Media de {size} bytes supera el límite de {limit}")
+        self.size = size
+        self.limit = limit
+
+
+class MediaInfo:
+    __slots__ = ("media_id", "url", "mime_type", "file_size", "sha256")
+
+    def __init__(
+        self, media_id: str, url: str, mime_type: str, file_size: int, sha256: str
+    ):
+        self.media_id = media_id
+        self.url = url
+        self.mime_type = mime_type
+        self.file_size = file_size
+        self.sha256 = sha256
+
+
+async def resolve_media(media_id: str, token: str) -> MediaInfo:
+    """
+    Obtiene la URL de descarga de un media_id.
+
+    Raises:
+        WhatsAppAPIError: si la Graph API responde con error
+        MediaTooLarge: si el tamaño declarado ya supera el límite
+    """
+    session = HTTP_CLIENTS.graph()
+    async with session.get(
+        f"{GRAPH_API_URL}/{media_id}",
+        headers={"Authorization": f"Bearer {token}"},
+    ) as resp:
+        data = await read_graph_response(resp)
+
+    file_size = int(data.get("file_size") or 0)
+    if file_size > config.media_max_bytes:
+        raise MediaTooLarge(file_size, config.media_max_bytes)
+
+    return MediaInfo(
+        media_id=media_id,
+        url=data.get("url"),
+        mime_type=(data.get("mime_type") or "").split(";")[0].strip(),
+        file_size=file_size,
+        sha256=(data.get("sha256") or "").lower(),
+    )
+
+
+async def download_media(
+    url: str, token: str
+) -> tuple[tempfile.SpooledTemporaryFile, str, int]:
+    """
+    Descarga `url` en streaming a un archivo temporal (posicionado al inicio).
+    El llamador debe cerrarlo.
+
+    Returns:
+        (archivo, sha256 hex del contenido, tamaño en bytes)
+
+    Raises:
+        aiohttp.ClientResponseError: si la descarga responde con error
+        MediaTooLarge: si el contenido supera MEDIA_MAX_BYTES
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=config.media_spool_memory_bytes)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        session = HTTP_CLIENTS.graph()
+        async with session.get(
+            url,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=aiohttp.ClientTimeout(
+                total=config.media_download_timeout,
+                connect=config.http_connect_timeout,
+            ),
+        ) as resp:
+            resp.raise_for_status()
+
+            declared = resp.content_length or 0
+            if declared > config.media_max_bytes:
+                raise MediaTooLarge(declared, config.media_max_bytes)
+
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                size += len(chunk)
+                if size > config.media_max_bytes:
+                    raise MediaTooLarge(size, config.media_max_bytes)
+                digest.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
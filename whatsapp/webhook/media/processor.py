@@ -0,0 +1,231 @@
+"""
+Procesamiento de media entrante: de un media_id al texto que ve el agente.
+
+Cada etapa se cronometra por separado para ver dónde se va el tiempo:
+
+    audio:      resolve → download → decode (solo audios largos) →
+                transcribe_wait (semáforo) → transcribe
+    imagen:     resolve → download → downscale → vision_wait → vision
+    documento:  resolve → download → extract
+
+Antes de resolver y antes de descargar se consulta MEDIA_CACHE: un archivo
+repetido no se descarga ni se procesa de nuevo.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import IO, Awaitable, Callable
+
+from whatsapp.config import config
+from whatsapp.webhook.media.cache import MEDIA_CACHE
+from whatsapp.webhook.media.documents import extract_document_text
+from whatsapp.webhook.media.download import (
+    MediaInfo,
+    MediaTooLarge,
+    download_media,
+    resolve_media,
+)
+from whatsapp.webhook.media.transcription import TRANSCRIBER
+from whatsapp.webhook.media.vision import IMAGE_DESCRIBER
+
+logger = logging.getLogger("whatsapp")
+
+STAGES = (
+    "resolve",
+    "download",
+    "decode",
+    "transcribe_wait",
+    "transcribe",
+    "downscale",
+    "vision_wait",
+    "vision",
+    "extract",
+    "total",
+)
+
+
+class StageTimings:
+    """Latencias recientes por etapa (promedio y p95 en ms)."""
+
+    def __init__(self, stages: tuple[str, ...], window: int = 500):
+        self._samples = {stage: deque(maxlen=window) for stage in stages}
+
+    def record(self, stage: str, seconds: float):
+        self._samples[stage].append(seconds)
+
+    def stats(self) -> dict:
+        result = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            if not ordered:
+                result[stage] = {"count": 0, "avg_ms": 0.0, "p95_ms": 0.0}
+                continue
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            result[stage] = {
+                "count": len(ordered),
+                "avg_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p95_ms": round(p95 * 1000, 2),
+            }
+        return result
+
+
+class MediaProcessor:
+    def __init__(self):
+        self.timings = StageTimings(STAGES)
+
+        # Métricas
+        self.processed = 0
+        self.from_cache = 0
+        self.failed = 0
+        self.too_large = 0
+        self.bytes_downloaded = 0
+
+    async def transcribe_voice_note(self, media_id: str, token: str) -> str:
+        """
+        Resuelve, descarga y transcribe un audio de WhatsApp.
+
+        Raises:
+            MediaTooLarge: si el audio supera MEDIA_MAX_BYTES
+            Exception: errores de la Graph API, la descarga o OpenAI
+        """
+        return await self._process(media_id, token, "transcript", self._transcribe)
+
+    async def describe_image(self, media_id: str, token: str) -> str:
+        """
+        Resuelve, descarga, reduce y describe una imagen de WhatsApp.
+
+        Raises:
+            MediaTooLarge: si la imagen supera MEDIA_MAX_BYTES
+            Exception: errores de la Graph API, Pillow u OpenAI
+        """
+        return await self._process(media_id, token, "image", self._describe)
+
+    async def read_document(
+        self, media_id: str, token: str, filename: str = None
+    ) -> str:
+        """
+        Resuelve, descarga y extrae el texto de un documento de WhatsApp.
+
+        Raises:
+            MediaTooLarge: si el documento supera MEDIA_MAX_BYTES
+            UnsupportedDocument: si el formato no se sabe leer
+            Exception: errores de la Graph API o del archivo
+        """
+
+        async def extract(file: IO[bytes], info: MediaInfo, size: int) -> str:
+            started = time.monotonic()
+            text = await asyncio.to_thread(
+                extract_document_text,
+                file,
+                info.mime_type,
+                filename,
+                config.document_max_pages,
+                config.document_max_chars,
+            )
+            self.timings.record("extract", time.monotonic() - started)
+            return text
+
+        return await self._process(media_id, token, "document", extract)
+
+    async def _describe(self, image: IO[bytes], info: MediaInfo, size: int) -> str:
+        started = time.monotonic()
+        text, downscale, wait = await IMAGE_DESCRIBER.describe(image, size)
+        self.timings.record("downscale", downscale)
+        self.timings.record("vision_wait", wait)
+        self.timings.record("vision", time.monotonic() - started - downscale - wait)
+        return text
+
+    async def _transcribe(self, audio: IO[bytes], info: MediaInfo, size: int) -> str:
+        started = time.monotonic()
+        text, wait, decode = await TRANSCRIBER.transcribe_audio(
+            audio, info.mime_type, size
+        )
+        if decode:
+            self.timings.record("decode", decode)
+        self.timings.record("transcribe_wait", wait)
+        self.timings.record("transcribe", time.monotonic() - started - decode - wait)
+        return text
+
+    async def _process(
+        self,
+        media_id: str,
+        token: str,
+        kind: str,
+        extract: Callable[[IO[bytes], MediaInfo, int], Awaitable[str]],
+    ) -> str:
+        """
+        Camino común: caché por media_id → resolve → caché por sha256 →
+        descarga → extracción → guardar en caché.
+        """
+        cached = MEDIA_CACHE.get_by_media_id(media_id)
+        if cached is not None:
+            self.from_cache += 1
+            logger.info(f"♻️ Media {media_id} servida desde caché (media_id)")
+            return cached
+
+        started = time.monotonic()
+        try:
+            info = await resolve_media(media_id, token)
+            resolved = time.monotonic()
+            self.timings.record("resolve", resolved - started)
+
+            # Reenvío del mismo archivo: Meta informa el sha256 sin descargar
+            cached = MEDIA_CACHE.get_by_sha(info.sha256, media_id)
+            if cached is not None:
+                self.from_cache += 1
+                logger.info(f"♻️ Media {media_id} servida desde caché (sha256)")
+                return cached
+
+            spool, sha256, size = await download_media(info.url, token)
+            with spool:
+                self.timings.record("download", time.monotonic() - resolved)
+                self.bytes_downloaded += size
+
+                if sha256 != info.sha256:
+                    cached = MEDIA_CACHE.get_by_sha(sha256, media_id, downloaded=True)
+                    if cached is not None:
+                        self.from_cache += 1
+                        return cached
+
+                text = await extract(spool, info, size)
+        except MediaTooLarge:
+            self.too_large += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        MEDIA_CACHE.store(sha256, media_id, kind, text, size)
+
+        total = time.monotonic() - started
+        self.timings.record("total", total)
+        self.processed += 1
+        logger.info(
+            f"📎 Media {media_id} procesada ({kind}, {size} bytes, "
+            f"{total * 1000:.0f} ms)"
+        )
+        return text
+
+    async def close(self):
+        await TRANSCRIBER.close()
+        await IMAGE_DESCRIBER.close()
+        MEDIA_CACHE.close()
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "from_cache": self.from_cache,
+            "failed": self.failed,
+            "too_large": self.too_large,
+            "bytes_downloaded": self.bytes_downloaded,
+            "transcriber": TRANSCRIBER.stats(),
+            "vision": IMAGE_DESCRIBER.stats(),
+            "cache": MEDIA_CACHE.stats(),
+            "stages": self.timings.stats(),
+        }
+
+
+# Instancia global
+MEDIA_PROCESSOR = MediaProcessor()
@@ -0,0 +1,260 @@
+"""
+Transcripción de audios con el cliente asíncrono de OpenAI.
+
+Antes se llamaba `openai.audio.transcriptions.create` (síncrono) dentro del
+handler: una nota de voz congelaba el event loop para todos los negocios.
+Ahora se usa AsyncOpenAI y un semáforo limita cuántas transcripciones
+corren a la vez (TRANSCRIPTION_CONCURRENCY).
+
+Los audios largos se decodifican con ffmpeg (PCM + detección de silencios)
+y se transcriben por fragmentos en paralelo (ver chunking.py). Los clips
+cortos, o si ffmpeg no está disponible, siguen en una sola llamada.
+
+La decodificación se corta en TRANSCRIPTION_MAX_SECONDS (acota la memoria
+del PCM). Si el audio era más largo se registra y el texto termina con
+TRUNCATED_MARKER, así el agente sabe que falta el final.
+"""
+
+import asyncio
+import io
+import logging
+import shutil
+import time
+from typing import IO
+
+from openai import AsyncOpenAI
+
+from whatsapp.config import config
+from whatsapp.webhook.media.chunking import (
+    BYTES_PER_SECOND,
+    SAMPLE_RATE,
+    parse_silencedetect,
+    transcribe_in_chunks,
+)
+
+logger = logging.getLogger("whatsapp")
+
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+# Umbral y duración mínima de silencio para los cortes (filtro silencedetect)
+SILENCE_NOISE_DB = -35
+SILENCE_MIN_SECONDS = 0.3
+
+TRUNCATED_MARKER = "[audio truncado]"
+
+# mime_type de WhatsApp → extensión que OpenAI usa para detectar el formato
+AUDIO_EXTENSIONS = {
+    "audio/ogg": "ogg",
+    "audio/opus": "ogg",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "m4a",
+    "audio/aac": "m4a",
+    "audio/amr": "amr",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/webm": "webm",
+}
+
+
+class Transcriber:
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._client: AsyncOpenAI | None = None
+
+        # Métricas
+        self.running = 0
+        self.waiting = 0
+        self.single_calls = 0
+        self.chunked_calls = 0
+        self.chunks_sent = 0
+        self.decode_failures = 0
+        self.truncated = 0
+
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=config.openai_api_key,
+                timeout=config.transcription_timeout,
+            )
+        return self._client
+
+    async def transcribe(
+        self, audio: IO[bytes], mime_type: str = "audio/ogg"
+    ) -> tuple[str, float]:
+        """
+        Transcribe `audio` (archivo abierto en binario).
+
+        Returns:
+            (texto, segundos esperando turno en el semáforo)
+        """
+        filename = f"audio.{AUDIO_EXTENSIONS.get(mime_type, 'ogg')}"
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.monotonic() - queued_at
+
+        self.running += 1
+        try:
+            resp = await self.client().audio.transcriptions.create(
+                model=config.transcription_model,
+                file=(filename, audio, mime_type or "audio/ogg"),
+            )
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+        return resp.text, wait
+
+    async def decode(
+        self, audio: IO[bytes]
+    ) -> tuple[bytes, list[tuple[float, float]], bool]:
+        """
+        Decodifica con ffmpeg a PCM 16 kHz mono y detecta silencios en la
+        misma pasada (hasta TRANSCRIPTION_MAX_SECONDS).
+
+        Returns:
+            (pcm, silencios, True si el audio superaba el máximo)
+
+        Raises:
+            RuntimeError: si ffmpeg falla
+            asyncio.TimeoutError: si tarda más que TRANSCRIPTION_TIMEOUT
+        """
+        max_seconds = config.transcription_max_seconds
+        proc = await asyncio.create_subprocess_exec(
+            FFMPEG_PATH,
+            "-hide_banner",
+            "-nostats",
+            "-i",
+            "pipe:0",
+            # Un segundo de más para saber si hubo que cortar
+            "-t",
+            str(max_seconds + 1),
+            "-af",
+            f"silencedetect=noise={SILENCE_NOISE_DB}dB:d={SILENCE_MIN_SECONDS}",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-f",
+            "s16le",
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            pcm, log = await asyncio.wait_for(
+                proc.communicate(audio.read()), config.transcription_timeout
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+
+        log = log.decode("utf-8", errors="ignore")
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg terminó con código {proc.returncode}: {log[-300:]}"
+            )
+
+        max_bytes = max_seconds * BYTES_PER_SECOND
+        truncated = len(pcm) > max_bytes
+        silences = parse_silencedetect(log)
+        if truncated:
+            pcm = pcm[:max_bytes]
+            silences = [(start, end) for start, end in silences if start < max_seconds]
+        return pcm, silences, truncated
+
+    async def transcribe_audio(
+        self,
+        audio: IO[bytes],
+        mime_type: str,
+        size: int,
+    ) -> tuple[str, float, float]:
+        """
+        Transcribe eligiendo el camino: una llamada para clips cortos, por
+        fragmentos en paralelo para audios largos.
+
+        Returns:
+            (texto, mayor espera por turno en el semáforo, segundos de decodificación)
+        """
+        decode = 0.0
+        if size >= config.transcription_chunk_min_bytes and FFMPEG_PATH:
+            started = time.monotonic()
+            try:
+                pcm, silences, truncated = await self.decode(audio)
+            except (OSError, RuntimeError, asyncio.TimeoutError) as e:
+                self.decode_failures += 1
+                logger.warning(f"⚠️ No se pudo decodificar el audio, va entero: {e}")
+                pcm, truncated = None, False
+            decode = time.monotonic() - started
+
+            duration = len(pcm) / BYTES_PER_SECOND if pcm else 0.0
+            if duration > config.transcription_chunk_seconds * 1.5:
+                text, wait = await self._transcribe_chunked(pcm, silences)
+                if truncated:
+                    self.truncated += 1
+                    logger.warning(
+                        f"✂️ Audio de más de {config.transcription_max_seconds}s: "
+                        f"solo se transcribió el comienzo"
+                    )
+                    text = f"{text} {TRUNCATED_MARKER}"
+                return text, wait, decode
+            audio.seek(0)
+
+        self.single_calls += 1
+        text, wait = await self.transcribe(audio, mime_type)
+        return text, wait, decode
+
+    async def _transcribe_chunked(
+        self, pcm: bytes, silences: list[tuple[float, float]]
+    ) -> tuple[str, float]:
+        waits = []
+
+        async def transcribe_wav(wav: bytes) -> str:
+            text, wait = await self.transcribe(io.BytesIO(wav), "audio/wav")
+            waits.append(wait)
+            return text
+
+        text, chunks = await transcribe_in_chunks(
+            pcm,
+            silences,
+            transcribe_wav,
+            chunk_seconds=config.transcription_chunk_seconds,
+            overlap=config.transcription_chunk_overlap,
+        )
+        self.chunked_calls += 1
+        self.chunks_sent += chunks
+        logger.info(
+            f"🎙️ Audio de {len(pcm) / BYTES_PER_SECOND:.0f}s transcrito en "
+            f"{chunks} fragmentos"
+        )
+        return text, max(waits, default=0.0)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+            "single_calls": self.single_calls,
+            "chunked_calls": self.chunked_calls,
+            "chunks_sent": self.chunks_sent,
+            "decode_failures": self.decode_failures,
+            "truncated": self.truncated,
+            "ffmpeg": bool(FFMPEG_PATH),
+        }
+
+
+# Instancia global
+TRANSCRIBER = Transcriber(concurrency=config.transcription_concurrency)
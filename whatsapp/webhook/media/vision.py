@@ -0,0 +1,122 @@
+"""
+Imágenes entrantes: reducción local + descripción con un modelo de visión.
+
+Las fotos de WhatsApp llegan en alta resolución; el modelo no necesita
+tanto detalle para describirlas. Antes de subirlas se reducen a
+IMAGE_MAX_SIDE px por lado y se recomprimen como JPEG (IMAGE_JPEG_QUALITY),
+lo que recorta bytes subidos y latencia. Un semáforo acota las llamadas
+simultáneas (VISION_CONCURRENCY).
+"""
+
+import asyncio
+import base64
+import io
+import time
+from typing import IO
+
+from openai import AsyncOpenAI
+from PIL import Image, ImageOps
+
+from whatsapp.config import config
+
+VISION_PROMPT = (
+    "Describe brevemente esta imagen enviada por un cliente por WhatsApp. "
+    "Si contiene texto (precios, direcciones, documentos, capturas), "
+    "transcríbelo tal cual. Responde en español."
+)
+
+
+def downscale_image(image: IO[bytes], max_side: int, quality: int) -> bytes:
+    """
+    Reduce la imagen a `max_side` px en su lado mayor y la recomprime como
+    JPEG. Síncrona (CPU): llamarla con asyncio.to_thread.
+    """
+    with Image.open(image) as original:
+        # JPEG: decodificar ya reducido (DCT a 1/2, 1/4, 1/8). Tiene que ir
+        # antes de exif_transpose, que decodifica la imagen completa
+        original.draft("RGB", (max_side, max_side))
+        # Aplicar la rotación EXIF de las fotos de celular
+        picture = ImageOps.exif_transpose(original)
+        picture.thumbnail((max_side, max_side))
+        if picture.mode != "RGB":
+            picture = picture.convert("RGB")
+        output = io.BytesIO()
+        picture.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ImageDescriber:
+    def __init__(self, concurrency: int):
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._client: AsyncOpenAI | None = None
+
+        # Métricas
+        self.described = 0
+        self.bytes_in = 0
+        self.bytes_uploaded = 0
+
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=config.openai_api_key,
+                timeout=config.vision_timeout,
+            )
+        return self._client
+
+    async def describe(self, image: IO[bytes], size: int) -> tuple[str, float, float]:
+        """
+        Reduce y describe una imagen.
+
+        Returns:
+            (descripción, segundos reduciendo, segundos esperando turno)
+        """
+        started = time.monotonic()
+        jpeg = await asyncio.to_thread(
+            downscale_image, image, config.image_max_side, config.image_jpeg_quality
+        )
+        downscale = time.monotonic() - started
+        self.bytes_in += size
+        self.bytes_uploaded += len(jpeg)
+
+        queued_at = time.monotonic()
+        async with self._semaphore:
+            wait = time.monotonic() - queued_at
+            resp = await self.client().chat.completions.create(
+                model=config.vision_model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": VISION_PROMPT},
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": "data:image/jpeg;base64,"
+                                    + base64.b64encode(jpeg).decode("ascii"),
+                                },
+                            },
+                        ],
+                    }
+                ],
+            )
+
+        self.described += 1
+        return (resp.choices[0].message.content or "").strip(), downscale, wait
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "described": self.described,
+            "bytes_in": self.bytes_in,
+            "bytes_uploaded": self.bytes_uploaded,
+        }
+
+
+# Instancia global
+IMAGE_DESCRIBER = ImageDescriber(concurrency=config.vision_concurrency)
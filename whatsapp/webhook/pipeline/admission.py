@@ -0,0 +1,173 @@
+"""
+Control de admisión del pipeline de procesamiento.
+
+Limita cuántos mensajes recorren a la vez el pipeline caro (gspread, Docs,
+OpenAI) y cuántos pueden esperar turno. Pasados ambos límites el mensaje
+se descarta (shed) al instante con `Overloaded`, en lugar de acumular
+trabajo hasta que todo venza por timeout al mismo tiempo:
+    - WhatsApp: se confirma a Meta y se envía un aviso corto de "ocupado"
+    - Web: 429 con Retry-After
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+class Overloaded(Exception):
+    """El pipeline está saturado; reintentar dentro de `retry_after` segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Pipeline saturado, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max(0, max_concurrent)  # 0 = sin límite
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout or None
+
+        self.running = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._service_avg = None  # EWMA del tiempo en el pipeline (s)
+
+        # Métricas
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.peak_running = 0
+        self.peak_queued = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    async def acquire(self) -> float:
+        """
+        Obtiene un turno en el pipeline (esperando en FIFO si hace falta).
+
+        Returns:
+            Marca de tiempo de admisión, para pasarla a `release`.
+
+        Raises:
+            Overloaded: si la cola de espera está llena o se agotó el timeout
+        """
+        if not self.enabled or (
+            self.running < self.max_concurrent and not self._waiters
+        ):
+            return self._admit()
+
+        if len(self._waiters) >= self.max_queue:
+            self.record_shed()
+            raise Overloaded(self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.record_shed()
+            raise Overloaded(self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Ya se nos había cedido el turno: pasarlo al siguiente
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+
+        # El turno llega ya contado en `running` (ver release)
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, admitted_at: float = None):
+        """Libera el turno y se lo cede al siguiente en espera (FIFO)."""
+        if admitted_at is not None:
+            elapsed = time.monotonic() - admitted_at
+            self._service_avg = (
+                elapsed
+                if self._service_avg is None
+                else 0.8 * self._service_avg + 0.2 * elapsed
+            )
+
+        self.running -= 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.running += 1
+                self.peak_running = max(self.peak_running, self.running)
+                waiter.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def admit(self):
+        admitted_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+    def record_shed(self):
+        self.shed += 1
+        if self.shed == 1 or self.shed % 100 == 0:
+            logger.warning(
+                f"🚦 Pipeline saturado: {self.shed} mensaje(s) descartados "
+                f"({self.running} en curso, {len(self._waiters)} en cola)"
+            )
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere capacidad (1-60)."""
+        if not self._service_avg or not self.enabled:
+            return 5
+        rounds = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, min(60, math.ceil(self._service_avg * rounds)))
+
+    def _admit(self) -> float:
+        self.running += 1
+        self.admitted += 1
+        self.peak_running = max(self.peak_running, self.running)
+        return time.monotonic()
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "peak_running": self.peak_running,
+            "peak_queued": self.peak_queued,
+            "service_avg_ms": (
+                round(self._service_avg * 1000, 2) if self._service_avg else 0.0
+            ),
+            "retry_after_s": self.retry_after(),
+        }
+
+
+# Instancia global compartida por los canales WhatsApp y web
+ADMISSION = AdmissionController(
+    max_concurrent=config.admission_max_concurrent,
+    max_queue=config.admission_max_queue,
+    queue_timeout=config.admission_queue_timeout,
+)
@@ -0,0 +1,123 @@
+"""
+Coalescencia de ráfagas de mensajes por sesión.
+
+Los usuarios de WhatsApp suelen mandar varios mensajes cortos seguidos
+("hola" / "quiero una cita" / "mañana"). En lugar de lanzar un guardrail,
+lecturas de Sheets y una corrida completa del agente por cada uno, se
+espera una ventana de debounce por sesión y se combinan en un único prompt.
+La respuesta se enlaza al último wamid de la ráfaga.
+
+Solo espera el primer mensaje de la ráfaga, que es quien la ejecuta: los
+siguientes se suman y vuelven enseguida, sin retener un worker ni un turno
+de admisión durante la ventana.
+"""
+
+import asyncio
+import logging
+import time
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+class _Burst:
+    __slots__ = ("items", "first_at", "last_at", "full")
+
+    def __init__(self):
+        self.items: list[dict] = []
+        self.first_at = self.last_at = time.monotonic()
+        self.full = asyncio.Event()
+
+
+class BurstCoalescer:
+    def __init__(self, window_ms: int, max_wait_ms: int, max_messages: int):
+        self.window = max(0, window_ms) / 1000
+        self.max_wait = max(window_ms, max_wait_ms) / 1000
+        self.max_messages = max(1, max_messages)
+
+        self._bursts: dict[str, _Burst] = {}
+
+        # Métricas
+        self.bursts_flushed = 0
+        self.messages_seen = 0
+        self.runs_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    async def submit(self, session_key: str, item: dict) -> list[dict] | None:
+        """
+        Agrega un mensaje a la ráfaga de la sesión.
+
+        Returns:
+            La ráfaga completa (en orden de llegada) para el primer mensaje,
+            que espera a que la sesión quede en silencio una ventana, o None
+            si el mensaje se sumó a una ráfaga ya abierta.
+        """
+        if not self.enabled:
+            return [item]
+
+        self.messages_seen += 1
+        burst = self._bursts.get(session_key)
+        if burst is not None:
+            burst.items.append(item)
+            burst.last_at = time.monotonic()
+            if len(burst.items) >= self.max_messages:
+                # Ráfaga llena: se ejecuta ya y el próximo mensaje abre otra
+                del self._bursts[session_key]
+                burst.full.set()
+            return None
+
+        burst = self._bursts[session_key] = _Burst()
+        burst.items.append(item)
+
+        try:
+            while len(burst.items) < self.max_messages:
+                now = time.monotonic()
+                quiet_in = burst.last_at + self.window - now
+                deadline_in = burst.first_at + self.max_wait - now
+                if quiet_in <= 0 or deadline_in <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(
+                        burst.full.wait(), min(quiet_in, deadline_in)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # También si se cancela: la sesión no queda con una ráfaga huérfana
+            if self._bursts.get(session_key) is burst:
+                del self._bursts[session_key]
+
+        self.bursts_flushed += 1
+        self.runs_saved += len(burst.items) - 1
+        if len(burst.items) > 1:
+            logger.info(
+                f"🧺 Sesión {session_key}: {len(burst.items)} mensajes combinados en una sola corrida"
+            )
+        return burst.items
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "window_ms": int(self.window * 1000),
+            "pending_sessions": len(self._bursts),
+            "messages_seen": self.messages_seen,
+            "bursts_flushed": self.bursts_flushed,
+            "runs_saved": self.runs_saved,
+        }
+
+
+def combine_burst_messages(items: list[dict]) -> str:
+    """Une los textos de una ráfaga en un único prompt, en orden de llegada."""
+    return "\n".join(item["message"] for item in items if item.get("message"))
+
+
+# Instancia global (canal WhatsApp)
+MESSAGE_COALESCER = BurstCoalescer(
+    window_ms=config.coalesce_window_ms,
+    max_wait_ms=config.coalesce_max_wait_ms,
+    max_messages=config.coalesce_max_messages,
+)
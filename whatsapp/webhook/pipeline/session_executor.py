@@ -0,0 +1,94 @@
+"""
+Ejecución ordenada por sesión con paralelismo entre sesiones.
+
+Dos mensajes del mismo usuario comparten la sesión SQLite (SESSIONS) y el
+RunContextWrapper (USER_CONTEXTS) del agente. Cada sesión tiene un buzón
+(mailbox) con un lock FIFO: los mensajes de un mismo usuario se ejecutan
+uno detrás de otro y en orden de llegada, mientras que usuarios distintos
+siguen corriendo totalmente en paralelo.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger("whatsapp")
+
+
+class _Mailbox:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()  # asyncio.Lock despierta a los waiters en FIFO
+        self.pending = 0  # trabajos en ejecución + en espera
+
+
+class SessionExecutor:
+    def __init__(self):
+        self._mailboxes: dict[str, _Mailbox] = {}
+
+        # Métricas
+        self.acquired = 0
+        self.executed = 0
+        self.contended = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @asynccontextmanager
+    async def hold(self, session_key: str):
+        """
+        Reserva el turno de la sesión. Los trabajos de la misma sesión
+        esperan en orden de llegada; los de otras sesiones no se bloquean.
+        """
+        box = self._mailboxes.get(session_key)
+        if box is None:
+            box = self._mailboxes[session_key] = _Mailbox()
+
+        box.pending += 1
+        if box.lock.locked():
+            self.contended += 1
+            logger.info(
+                f"📬 Sesión {session_key}: mensaje en cola ({box.pending - 1} antes)"
+            )
+
+        started = time.monotonic()
+        try:
+            async with box.lock:
+                wait = time.monotonic() - started
+                self.acquired += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                yield
+                self.executed += 1
+        finally:
+            box.pending -= 1
+            if box.pending == 0 and self._mailboxes.get(session_key) is box:
+                del self._mailboxes[session_key]
+
+    def queue_length(self, session_key: str) -> int:
+        """Trabajos en espera (sin contar el que se está ejecutando)."""
+        box = self._mailboxes.get(session_key)
+        return max(0, box.pending - 1) if box else 0
+
+    def stats(self, top: int = 10) -> dict:
+        queues = {key: max(0, box.pending - 1) for key, box in self._mailboxes.items()}
+        busiest = sorted(queues.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        return {
+            "active_mailboxes": len(self._mailboxes),
+            "queued_total": sum(queues.values()),
+            "queued_max": max(queues.values(), default=0),
+            "busiest": [{"session": k, "queued": v} for k, v in busiest if v],
+            "executed": self.executed,
+            "contended": self.contended,
+            "wait_avg_ms": (
+                round(self._wait_total / self.acquired * 1000, 2)
+                if self.acquired
+                else 0.0
+            ),
+            "wait_max_ms": round(self._wait_max * 1000, 2),
+        }
+
+
+# Instancia global compartida por los canales WhatsApp y web
+SESSION_EXECUTOR = SessionExecutor()
@@ -0,0 +1,204 @@
+"""
+Planificador justo ponderado por tenant (Phone Number ID).
+
+Todos los negocios comparten el mismo event loop: un negocio haciendo un
+envío masivo podía dejar sin turno al resto. Cada scheduler tiene una
+capacidad global de turnos y reparte los que se liberan entre los tenants
+con trabajo en espera según su peso (start-time fair queuing):
+
+    - cada tenant lleva un tiempo virtual que avanza 1/peso por turno
+    - el siguiente turno va al tenant con menor tiempo virtual
+    - "Max Concurrency" limita los turnos simultáneos de un tenant
+
+El peso y el límite se leen de las columnas "Weight" y "Max Concurrency"
+de la hoja Credentials.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+def tenant_limits(client: dict) -> dict:
+    """Peso y concurrencia máxima del tenant según su fila de Credentials."""
+
+    def _number(key, default, cast):
+        try:
+            value = cast(str((client or {}).get(key, "")).strip() or default)
+        except ValueError:
+            value = default
+        return value if value > 0 else default
+
+    return {
+        "weight": _number("Weight", config.tenant_default_weight, float),
+        "max_concurrency": _number(
+            "Max Concurrency", config.tenant_default_max_concurrency, int
+        ),
+    }
+
+
+class _Tenant:
+    __slots__ = (
+        "weight",
+        "max_concurrency",
+        "running",
+        "waiters",
+        "vtime",
+        "served",
+        "wait_total",
+        "wait_max",
+        "run_total",
+        "run_max",
+    )
+
+    def __init__(self):
+        self.weight = 1.0
+        self.max_concurrency = 0  # 0 = sin límite propio
+        self.running = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self.vtime = 0.0
+
+        # Métricas
+        self.served = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def has_room(self) -> bool:
+        return not self.max_concurrency or self.running < self.max_concurrency
+
+
+class TenantScheduler:
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(0, capacity)  # 0 = sin límite global
+
+        self.running = 0
+        self._vclock = 0.0
+        self._tenants: dict[str, _Tenant] = {}
+
+    def _has_capacity(self) -> bool:
+        return not self.capacity or self.running < self.capacity
+
+    def _grant(self, tenant: _Tenant):
+        tenant.running += 1
+        self.running += 1
+        self._vclock = tenant.vtime
+        tenant.vtime += 1 / tenant.weight
+        tenant.served += 1
+
+    def _dispatch(self):
+        """Cede los turnos libres al tenant elegible de menor tiempo virtual."""
+        while self._has_capacity():
+            eligible = [t for t in self._tenants.values() if t.waiters and t.has_room()]
+            if not eligible:
+                return
+
+            tenant = min(eligible, key=lambda t: t.vtime)
+            waiter = tenant.waiters.popleft()
+            if waiter.done():  # cancelado mientras esperaba
+                continue
+            self._grant(tenant)
+            waiter.set_result(None)
+
+    async def acquire(
+        self, tenant_key: str, weight: float = 1.0, max_concurrency: int = 0
+    ) -> float:
+        """
+        Espera el turno del tenant.
+
+        Returns:
+            Marca de tiempo de inicio, para pasarla a `release`.
+        """
+        tenant = self._tenants.get(tenant_key)
+        if tenant is None:
+            tenant = self._tenants[tenant_key] = _Tenant()
+        tenant.weight = weight
+        tenant.max_concurrency = max_concurrency
+
+        # Un tenant que vuelve a tener trabajo no acumula crédito del tiempo inactivo
+        if not tenant.waiters and not tenant.running:
+            tenant.vtime = max(tenant.vtime, self._vclock)
+
+        enqueued_at = time.monotonic()
+        if not tenant.waiters and tenant.has_room() and self._has_capacity():
+            self._grant(tenant)
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            tenant.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release(tenant_key)
+                else:
+                    try:
+                        tenant.waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+        started_at = time.monotonic()
+        wait = started_at - enqueued_at
+        tenant.wait_total += wait
+        tenant.wait_max = max(tenant.wait_max, wait)
+        return started_at
+
+    def release(self, tenant_key: str, started_at: float = None):
+        tenant = self._tenants[tenant_key]
+        tenant.running -= 1
+        self.running -= 1
+
+        if started_at is not None:
+            elapsed = time.monotonic() - started_at
+            tenant.run_total += elapsed
+            tenant.run_max = max(tenant.run_max, elapsed)
+
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tenant_key: str, weight: float = 1.0, max_concurrency=0):
+        started_at = await self.acquire(tenant_key, weight, max_concurrency)
+        try:
+            yield
+        finally:
+            self.release(tenant_key, started_at)
+
+    def stats(self) -> dict:
+        tenants = {}
+        for key, t in self._tenants.items():
+            tenants[key] = {
+                "weight": t.weight,
+                "max_concurrency": t.max_concurrency,
+                "running": t.running,
+                "waiting": len(t.waiters),
+                "served": t.served,
+                "wait_avg_ms": (
+                    round(t.wait_total / t.served * 1000, 2) if t.served else 0.0
+                ),
+                "wait_max_ms": round(t.wait_max * 1000, 2),
+                "run_avg_ms": (
+                    round(t.run_total / t.served * 1000, 2) if t.served else 0.0
+                ),
+                "run_max_ms": round(t.run_max * 1000, 2),
+            }
+
+        return {
+            "name": self.name,
+            "capacity": self.capacity,
+            "running": self.running,
+            "waiting": sum(len(t.waiters) for t in self._tenants.values()),
+            "tenants": tenants,
+        }
+
+
+# Instancias globales: corridas del agente y trabajo bloqueante de Sheets
+AGENT_SCHEDULER = TenantScheduler("agent", capacity=config.tenant_agent_slots)
+SHEETS_SCHEDULER = TenantScheduler("sheets", capacity=config.tenant_sheets_slots)
@@ -0,0 +1,157 @@
+"""
+Cola de trabajo en proceso para el modo "ack rápido" del webhook.
+
+El endpoint valida el payload, encola el trabajo y responde 200 en
+milisegundos. Un pool de workers asyncio ejecuta después el pipeline
+completo (credenciales, Lead, instrucciones, agente y envío).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+class WorkQueue:
+    """Cola asyncio acotada con un pool fijo de workers y métricas de espera."""
+
+    def __init__(self, name: str, workers: int, maxsize: int):
+        self.name = name
+        self.workers = max(1, workers)
+        self.maxsize = max(0, maxsize)
+
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+        # Métricas
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_workers = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=1000)
+
+    # ------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"{self.name}-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"⚡ Cola '{self.name}' iniciada con {self.workers} workers")
+
+    async def stop(self, drain_timeout: float = 0.0):
+        """Espera a vaciar la cola (hasta drain_timeout) y detiene los workers."""
+        if not self._tasks:
+            return
+
+        if drain_timeout > 0 and self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"⚠️ Cola '{self.name}': {self._queue.qsize()} trabajos sin procesar al apagar"
+                )
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        logger.info(f"🛑 Cola '{self.name}' detenida")
+
+    # ------------------------------------------------------
+    # Encolado
+    # ------------------------------------------------------
+    def submit(self, job: Callable[..., Awaitable[Any]], *args, **kwargs) -> bool:
+        """
+        Encola un trabajo sin bloquear.
+
+        Returns:
+            True si se encoló, False si la cola está llena.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.monotonic(), job, args, kwargs))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(
+                f"⚠️ Cola '{self.name}' llena ({self.maxsize}), trabajo rechazado"
+            )
+            return False
+
+        self.enqueued += 1
+        return True
+
+    async def _worker(self, idx: int):
+        while True:
+            enqueued_at, job, args, kwargs = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._recent_waits.append(wait)
+
+            self.busy_workers += 1
+            try:
+                await job(*args, **kwargs)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(
+                    f"❌ Cola '{self.name}' worker {idx}: error procesando trabajo: {e}",
+                    exc_info=True,
+                )
+            finally:
+                self.busy_workers -= 1
+                self._queue.task_done()
+
+    # ------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------
+    def stats(self) -> dict:
+        done = self.processed + self.failed
+        recent = sorted(self._recent_waits)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "depth": self._queue.qsize() if self._queue else 0,
+            "maxsize": self.maxsize,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg_ms": round(self._wait_total / done * 1000, 2) if done else 0.0,
+            "wait_p95_ms": round(p95 * 1000, 2),
+            "wait_max_ms": round(self._wait_max * 1000, 2),
+        }
+
+
+# Instancia global usada por /webhook en modo ack rápido
+WEBHOOK_QUEUE = WorkQueue(
+    name="webhook",
+    workers=config.webhook_workers,
+    maxsize=config.webhook_queue_maxsize,
+)
@@ -1,8 +1,14 @@
 """
 Dispatcher único para WhatsApp.
 Solo decide qué handler usar y devuelve un mensaje unificado.
+
+Un mismo webhook puede traer varios entry / changes / messages (Meta los
+agrupa bajo carga, incluso de distintos phone_number_id). `dispatch_messages`
+los expande en una lista de unidades normalizadas, una por mensaje.
 """
 
+from typing import Callable, Optional
+
 from whatsapp.webhook.request.handlers import (
     handle_audio,
     handle_contact,
@@ -14,41 +20,54 @@ from whatsapp.webhook.request.handlers import (
     handle_unknown,
     handle_video,
 )
+from whatsapp.webhook.request.payload import (
+    WhatsAppChange,
+    WhatsAppMessage,
+    WhatsAppPayload,
+)
 
+# ✅ Tabla centralizada de handlers
+HANDLERS = {
+    "text": handle_text,
+    "image": handle_image,
+    "audio": handle_audio,
+    "video": handle_video,
+    "document": handle_document,
+    "location": handle_location,
+    "contacts": handle_contact,
+    "reaction": handle_reaction,
+}
 
-def dispatch_message(raw_data):
+
+def build_message_unit(msg: WhatsAppMessage, change: WhatsAppChange) -> dict:
     """
-    Toma todo el raw_data del webhook.
-    Extrae el primer mensaje y llama al handler según msg['type'].
+    Ejecuta el handler según msg.type y añade el tenant del change
+    (phone_number_id) para que cada unidad sea autosuficiente.
     """
+    handler = HANDLERS.get(msg.type, handle_unknown)
+    unit = handler(msg, change)
+    unit["phone_number_id"] = change.phone_number_id
+    unit["display_phone_number"] = change.display_phone_number
+    return unit
+
 
-    # ✅ Extraer el mensaje principal de forma segura
-    try:
-        entry = raw_data["entry"][0]["changes"][0]["value"]
-        messages = entry.get("messages", [])
-        if not messages:
-            return {"status": "no_message", "raw": raw_data}
-
-        msg = messages[0]
-    except Exception:
-        return {"status": "invalid_payload", "raw": raw_data}
-
-    msg_type = msg.get("type")
-
-    # ✅ Tabla centralizada de handlers
-    handlers = {
-        "text": handle_text,
-        "image": handle_image,
-        "audio": handle_audio,
-        "video": handle_video,
-        "document": handle_document,
-        "location": handle_location,
-        "contacts": handle_contact,
-        "reaction": handle_reaction,
-    }
-
-    # ✅ Seleccionar handler o fallback
-    handler = handlers.get(msg_type, handle_unknown)
-
-    # ✅ Ejecutar handler con mensaje + raw original
-    return handler(msg, raw_data)
+def dispatch_messages(
+    payload: WhatsAppPayload,
+    accept: Optional[Callable[[WhatsAppMessage], bool]] = None,
+) -> list[dict]:
+    """
+    Recorre todos los entry → changes → messages del webhook y devuelve
+    una unidad normalizada por mensaje, cada una con su tenant y contacto.
+
+    Args:
+        payload: Webhook ya decodificado
+        accept: Filtro opcional sobre el mensaje (p. ej. tipos válidos)
+
+    Returns:
+        Lista de unidades (vacía si no hay mensajes)
+    """
+    return [
+        build_message_unit(msg, change)
+        for change, msg in payload.iter_messages()
+        if accept is None or accept(msg)
+    ]
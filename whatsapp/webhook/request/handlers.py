@@ -1,8 +1,8 @@
 """
 Todos los handlers de WhatsApp unificados en un solo archivo.
 Cada handler recibe:
-    - msg: mensaje ya identificado
-    - raw_data: payload completo original
+    - msg: mensaje ya identificado (WhatsAppMessage tipado)
+    - change: change al que pertenece el mensaje (contactos y metadata)
 
 Extrae información del payload:
     - canal: siempre "whatsapp"
@@ -10,161 +10,94 @@ Extrae información del payload:
     - nombre: nombre del perfil del contacto
 """
 
+from whatsapp.webhook.request.payload import WhatsAppChange, WhatsAppMessage
 
-def extract_user_info(raw_data: dict) -> dict:
+
+def extract_user_info(change: WhatsAppChange, wa_id: str = None) -> dict:
     """
-    Extrae información del usuario desde el payload de WhatsApp.
+    Extrae información del usuario desde el change de WhatsApp,
+    eligiendo el contacto que coincide con el remitente.
     Retorna: {"usuario": "573146964611", "nombre": "Fordez"}
     """
-    try:
-        contacts = raw_data["entry"][0]["changes"][0]["value"].get("contacts", [])
-        if contacts:
-            contact = contacts[0]
-            return {
-                "usuario": contact.get("wa_id", ""),
-                "nombre": contact.get("profile", {}).get("name", ""),
-            }
-    except Exception:
-        pass
+    contact = change.contact_for(wa_id) if change else None
+    if contact:
+        return {"usuario": contact.wa_id, "nombre": contact.name}
 
     return {"usuario": "", "nombre": ""}
 
 
-def handle_text(msg, raw_data):
-    user_info = extract_user_info(raw_data)
+def _base(msg: WhatsAppMessage, change: WhatsAppChange, msg_type: str) -> dict:
+    user_info = extract_user_info(change, msg.sender)
     return {
-        "type": "text",
-        "message": msg.get("text", {}).get("body", ""),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
+        "type": msg_type,
+        "from": msg.sender,
+        "wamid": msg.id,
         "canal": "whatsapp",
         "usuario": user_info.get("usuario"),
         "nombre": user_info.get("nombre"),
-        "raw": raw_data,
     }
 
 
-def handle_image(msg, raw_data):
-    user_info = extract_user_info(raw_data)
-    img = msg.get("image", {})
-    return {
-        "type": "image",
-        "media_id": img.get("id"),
-        "caption": img.get("caption"),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
-    }
+def handle_text(msg: WhatsAppMessage, change: WhatsAppChange):
+    return {**_base(msg, change, "text"), "message": msg.text or ""}
 
 
-def handle_audio(msg, raw_data):
-    user_info = extract_user_info(raw_data)
-    audio = msg.get("audio", {})
+def handle_image(msg: WhatsAppMessage, change: WhatsAppChange):
     return {
-        "type": "audio",
-        "media_id": audio.get("id"),
-        "mime_type": audio.get("mime_type"),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
+        **_base(msg, change, "image"),
+        "media_id": msg.media_id,
+        "caption": msg.caption,
+        "mime_type": msg.mime_type,
     }
 
 
-def handle_video(msg, raw_data):
-    user_info = extract_user_info(raw_data)
-    video = msg.get("video", {})
+def handle_audio(msg: WhatsAppMessage, change: WhatsAppChange):
     return {
-        "type": "video",
-        "media_id": video.get("id"),
-        "caption": video.get("caption"),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
+        **_base(msg, change, "audio"),
+        "media_id": msg.media_id,
+        "mime_type": msg.mime_type,
     }
 
 
-def handle_document(msg, raw_data):
-    user_info = extract_user_info(raw_data)
-    doc = msg.get("document", {})
+def handle_video(msg: WhatsAppMessage, change: WhatsAppChange):
     return {
-        "type": "document",
-        "media_id": doc.get("id"),
-        "filename": doc.get("filename"),
-        "mime_type": doc.get("mime_type"),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
+        **_base(msg, change, "video"),
+        "media_id": msg.media_id,
+        "caption": msg.caption,
     }
 
 
-def handle_location(msg, raw_data):
-    user_info = extract_user_info(raw_data)
-    loc = msg.get("location", {})
+def handle_document(msg: WhatsAppMessage, change: WhatsAppChange):
     return {
-        "type": "location",
-        "lat": loc.get("latitude"),
-        "lng": loc.get("longitude"),
-        "name": loc.get("name"),
-        "address": loc.get("address"),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
+        **_base(msg, change, "document"),
+        "media_id": msg.media_id,
+        "filename": msg.filename,
+        "mime_type": msg.mime_type,
+        "caption": msg.caption,
     }
 
 
-def handle_contact(msg, raw_data):
-    user_info = extract_user_info(raw_data)
+def handle_location(msg: WhatsAppMessage, change: WhatsAppChange):
     return {
-        "type": "contacts",
-        "contacts": msg.get("contacts", []),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
+        **_base(msg, change, "location"),
+        "lat": msg.latitude,
+        "lng": msg.longitude,
+        "name": msg.location_name,
+        "address": msg.address,
     }
 
 
-def handle_reaction(msg, raw_data):
-    user_info = extract_user_info(raw_data)
-    reaction = msg.get("reaction", {})
-    return {
-        "type": "reaction",
-        "emoji": reaction.get("emoji"),
-        "msg_id": reaction.get("message_id"),
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
-    }
+def handle_contact(msg: WhatsAppMessage, change: WhatsAppChange):
+    return {**_base(msg, change, "contacts"), "contacts": msg.contacts or []}
 
 
-def handle_unknown(msg, raw_data):
-    user_info = extract_user_info(raw_data)
+def handle_reaction(msg: WhatsAppMessage, change: WhatsAppChange):
     return {
-        "type": "unknown",
-        "from": msg.get("from"),
-        "wamid": msg.get("id"),
-        "canal": "whatsapp",
-        "usuario": user_info.get("usuario"),
-        "nombre": user_info.get("nombre"),
-        "raw": raw_data,
+        **_base(msg, change, "reaction"),
+        "emoji": msg.emoji,
+        "msg_id": msg.reacted_message_id,
     }
+
+
+def handle_unknown(msg: WhatsAppMessage, change: WhatsAppChange):
+    return _base(msg, change, "unknown")
@@ -0,0 +1,206 @@
+"""
+Decodificación tipada en una sola pasada de los payloads entrantes.
+
+El cuerpo crudo (bytes) se decodifica una única vez con orjson y se
+proyecta a structs compactos con __slots__. Todas las etapas posteriores
+(filtro, fan-out, handlers, tenant y contacto) leen de estos objetos en
+lugar de volver a recorrer el dict completo.
+"""
+
+import orjson
+
+
+class PayloadError(ValueError):
+    """El cuerpo no es JSON válido o no tiene la forma esperada."""
+
+
+def _as_dict(value) -> dict:
+    return value if isinstance(value, dict) else {}
+
+
+def _as_list(value) -> list:
+    return value if isinstance(value, list) else []
+
+
+# ==========================================================
+# WHATSAPP
+# ==========================================================
+class WhatsAppContact:
+    __slots__ = ("wa_id", "name")
+
+    def __init__(self, wa_id: str, name: str):
+        self.wa_id = wa_id
+        self.name = name
+
+
+class WhatsAppStatus:
+    __slots__ = ("id", "status", "recipient_id")
+
+    def __init__(self, id: str, status: str, recipient_id: str):
+        self.id = id
+        self.status = status
+        self.recipient_id = recipient_id
+
+
+class WhatsAppMessage:
+    """Un mensaje entrante; solo guarda los campos que usan los handlers."""
+
+    __slots__ = (
+        "id",
+        "sender",
+        "type",
+        "timestamp",
+        "text",
+        "media_id",
+        "mime_type",
+        "caption",
+        "filename",
+        "latitude",
+        "longitude",
+        "location_name",
+        "address",
+        "contacts",
+        "emoji",
+        "reacted_message_id",
+    )
+
+    def __init__(self, data: dict):
+        self.id = data.get("id")
+        self.sender = data.get("from") or ""
+        self.type = data.get("type") or ""
+        self.timestamp = data.get("timestamp")
+
+        self.text = None
+        self.media_id = None
+        self.mime_type = None
+        self.caption = None
+        self.filename = None
+        self.latitude = None
+        self.longitude = None
+        self.location_name = None
+        self.address = None
+        self.contacts = None
+        self.emoji = None
+        self.reacted_message_id = None
+
+        body = _as_dict(data.get(self.type))
+        if self.type == "text":
+            self.text = body.get("body", "")
+        elif self.type in ("image", "audio", "video", "document", "sticker"):
+            self.media_id = body.get("id")
+            self.mime_type = body.get("mime_type")
+            self.caption = body.get("caption")
+            self.filename = body.get("filename")
+        elif self.type == "location":
+            self.latitude = body.get("latitude")
+            self.longitude = body.get("longitude")
+            self.location_name = body.get("name")
+            self.address = body.get("address")
+        elif self.type == "contacts":
+            self.contacts = _as_list(data.get("contacts"))
+        elif self.type == "reaction":
+            self.emoji = body.get("emoji")
+            self.reacted_message_id = body.get("message_id")
+
+
+class WhatsAppChange:
+    """Un `value` de entry[].changes[]: un tenant con sus mensajes."""
+
+    __slots__ = (
+        "phone_number_id",
+        "display_phone_number",
+        "contacts",
+        "messages",
+        "statuses",
+    )
+
+    def __init__(self, value: dict):
+        metadata = _as_dict(value.get("metadata"))
+        self.phone_number_id = metadata.get("phone_number_id")
+        self.display_phone_number = metadata.get("display_phone_number")
+
+        self.contacts = [
+            WhatsAppContact(
+                c.get("wa_id", ""), _as_dict(c.get("profile")).get("name", "")
+            )
+            for c in _as_list(value.get("contacts"))
+            if isinstance(c, dict)
+        ]
+        self.messages = [
+            WhatsAppMessage(m)
+            for m in _as_list(value.get("messages"))
+            if isinstance(m, dict)
+        ]
+        self.statuses = [
+            WhatsAppStatus(
+                s.get("id"),
+                s.get("status", "unknown"),
+                s.get("recipient_id", "unknown"),
+            )
+            for s in _as_list(value.get("statuses"))
+            if isinstance(s, dict)
+        ]
+
+    def contact_for(self, wa_id: str) -> WhatsAppContact | None:
+        """Contacto del remitente (o el primero si no hay coincidencia)."""
+        for contact in self.contacts:
+            if wa_id and contact.wa_id == wa_id:
+                return contact
+        return self.contacts[0] if self.contacts else None
+
+
+class WhatsAppPayload:
+    """Webhook completo, con todos los entry/changes aplanados."""
+
+    __slots__ = ("has_entries", "changes")
+
+    def __init__(self, data: dict):
+        entries = _as_list(data.get("entry"))
+        self.has_entries = bool(entries)
+        self.changes = [
+            WhatsAppChange(_as_dict(change.get("value")))
+            for entry in entries
+            if isinstance(entry, dict)
+            for change in _as_list(entry.get("changes"))
+            if isinstance(change, dict)
+        ]
+
+    def iter_messages(self):
+        """Itera (change, message) en orden de llegada."""
+        for change in self.changes:
+            for message in change.messages:
+                yield change, message
+
+
+def decode_whatsapp_payload(raw: bytes) -> WhatsAppPayload:
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError as e:
+        raise PayloadError(f"JSON inválido: {e}") from e
+    if not isinstance(data, dict):
+        raise PayloadError("El payload debe ser un objeto JSON")
+    return WhatsAppPayload(data)
+
+
+# ==========================================================
+# WEB
+# ==========================================================
+class WebPayload:
+    __slots__ = ("session_id", "message", "user_name", "webhook_url", "timestamp")
+
+    def __init__(self, data: dict):
+        self.session_id = data.get("userPhone") or data.get("session_id")
+        self.message = data.get("message") or data.get("text")
+        self.user_name = data.get("user_name") or data.get("userName", "Usuario Web")
+        self.webhook_url = data.get("webhook_url") or data.get("webhookUrl")
+        self.timestamp = data.get("timestamp")
+
+
+def decode_web_payload(raw: bytes) -> WebPayload:
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError as e:
+        raise PayloadError(f"JSON inválido: {e}") from e
+    if not isinstance(data, dict):
+        raise PayloadError("El payload debe ser un objeto JSON")
+    return WebPayload(data)
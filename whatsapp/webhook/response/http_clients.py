@@ -0,0 +1,163 @@
+"""
+Pools HTTP compartidos por todo whatsapp/webhook/response/*.
+
+Antes cada envío abría su propio aiohttp.ClientSession / httpx.AsyncClient
+y pagaba DNS + TCP + TLS en cada respuesta. Ahora hay dos clientes de larga
+vida con keep-alive, creados en el lifespan de FastAPI y cerrados al apagar:
+
+    - graph: aiohttp.ClientSession para la Graph API de Meta
+    - web: httpx.AsyncClient (HTTP/2 si `h2` está instalado) para los
+      webhooks de los clientes web
+
+Ambos registran cuántas requests reutilizaron una conexión abierta.
+"""
+
+import logging
+
+import aiohttp
+import httpx
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class _ReuseCounter:
+    __slots__ = ("requests", "connections_opened", "dns_cache_hits", "dns_lookups")
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.dns_cache_hits = 0
+        self.dns_lookups = 0
+
+    def as_dict(self, dns: bool = True) -> dict:
+        reused = max(0, self.requests - self.connections_opened)
+        data = {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "connections_reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+        }
+        if dns:
+            data["dns_lookups"] = self.dns_lookups
+            data["dns_cache_hits"] = self.dns_cache_hits
+        return data
+
+
+class HttpClients:
+    def __init__(self):
+        self._graph: aiohttp.ClientSession | None = None
+        self._web: httpx.AsyncClient | None = None
+        self.graph_metrics = _ReuseCounter()
+        self.web_metrics = _ReuseCounter()
+        self.web_http2 = config.http_client_http2 and HTTP2_AVAILABLE
+
+    # ------------------------------------------------------
+    # Graph API (aiohttp)
+    # ------------------------------------------------------
+    def _graph_trace_config(self) -> aiohttp.TraceConfig:
+        metrics = self.graph_metrics
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            metrics.requests += 1
+
+        async def on_connection_create_end(session, ctx, params):
+            metrics.connections_opened += 1
+
+        async def on_dns_resolvehost_end(session, ctx, params):
+            metrics.dns_lookups += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            metrics.dns_cache_hits += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        return trace
+
+    def graph(self) -> aiohttp.ClientSession:
+        """Sesión compartida para graph.facebook.com (se crea si hace falta)."""
+        if self._graph is None or self._graph.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.http_pool_limit,
+                limit_per_host=config.http_pool_limit_per_host,
+                keepalive_timeout=config.http_keepalive_seconds,
+                ttl_dns_cache=300,
+            )
+            self._graph = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=config.http_timeout,
+                    connect=config.http_connect_timeout,
+                ),
+                trace_configs=[self._graph_trace_config()],
+            )
+        return self._graph
+
+    # ------------------------------------------------------
+    # Webhooks web (httpx)
+    # ------------------------------------------------------
+    async def _trace_web(self, event_name: str, info: dict):
+        if event_name == "connection.connect_tcp.complete":
+            self.web_metrics.connections_opened += 1
+
+    async def _on_web_request(self, request: httpx.Request):
+        self.web_metrics.requests += 1
+        request.extensions["trace"] = self._trace_web
+
+    def web(self) -> httpx.AsyncClient:
+        """Cliente compartido para los webhooks web (se crea si hace falta)."""
+        if self._web is None or self._web.is_closed:
+            self._web = httpx.AsyncClient(
+                http2=self.web_http2,
+                limits=httpx.Limits(
+                    max_connections=config.http_pool_limit,
+                    max_keepalive_connections=config.http_pool_limit_per_host,
+                    keepalive_expiry=config.http_keepalive_seconds,
+                ),
+                timeout=httpx.Timeout(
+                    config.http_timeout, connect=config.http_connect_timeout
+                ),
+                event_hooks={"request": [self._on_web_request]},
+            )
+        return self._web
+
+    # ------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------
+    async def start(self):
+        self.graph()
+        self.web()
+        logger.info(
+            f"🌐 Pools HTTP listos (límite {config.http_pool_limit}, "
+            f"{config.http_pool_limit_per_host}/host, web HTTP/2={self.web_http2})"
+        )
+
+    async def close(self):
+        if self._graph is not None and not self._graph.closed:
+            await self._graph.close()
+        if self._web is not None and not self._web.is_closed:
+            await self._web.aclose()
+        self._graph = None
+        self._web = None
+        logger.info("🌐 Pools HTTP cerrados")
+
+    def stats(self) -> dict:
+        return {
+            "graph": self.graph_metrics.as_dict(),
+            "web": {**self.web_metrics.as_dict(dns=False), "http2": self.web_http2},
+        }
+
+
+# Instancia global
+HTTP_CLIENTS = HttpClients()
@@ -0,0 +1,226 @@
+"""
+Media saliente: brochures e imágenes de servicios enviados por WhatsApp.
+
+Subir el mismo archivo en cada envío cuesta una descarga + una subida a la
+Graph API. Aquí cada archivo se sube una sola vez a /{phone_number_id}/media
+y el media ID devuelto se guarda (diskcache) por negocio y sha256 del
+contenido hasta poco antes de que Meta lo expire (30 días):
+
+    id:<phone_number_id>:<sha256>  → media ID
+    url:<url>                      → {sha256, mime_type, filename}
+
+Con la URL ya vista y un media ID vigente, el envío no descarga ni sube
+nada. Las subidas concurrentes del mismo archivo se comparten.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from urllib.parse import unquote, urlsplit
+
+import aiohttp
+import diskcache
+import httpx
+
+from whatsapp.config import config
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+from whatsapp.webhook.response.reply import read_graph_response
+
+logger = logging.getLogger("whatsapp")
+
+GRAPH_API_URL = "https://graph.facebook.com/v21.0"
+
+
+class MediaSourceError(ValueError):
+    """La URL del archivo no se pudo descargar o no es válida."""
+
+
+def media_kind(mime_type: str) -> str:
+    """Tipo de mensaje de WhatsApp para un mime_type."""
+    mime_type = (mime_type or "").lower()
+    for prefix, kind in (("image/", "image"), ("video/", "video"), ("audio/", "audio")):
+        if mime_type.startswith(prefix):
+            return kind
+    return "document"
+
+
+def _filename(url: str) -> str:
+    return unquote(os.path.basename(urlsplit(url).path)) or "archivo"
+
+
+class MediaUploader:
+    def __init__(self, directory: str, ttl_seconds: float, url_ttl_seconds: float):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.url_ttl_seconds = url_ttl_seconds
+        self._cache: diskcache.Cache | None = None
+        self._inflight: dict[str, asyncio.Future] = {}
+
+        # Métricas
+        self.uploads = 0
+        self.upload_failures = 0
+        self.id_hits = 0
+        self.url_hits = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+
+    def _get_cache(self) -> diskcache.Cache:
+        if self._cache is None:
+            self._cache = diskcache.Cache(self.directory)
+        return self._cache
+
+    async def _download(self, url: str) -> tuple[bytes, str, str]:
+        """Descarga el archivo de origen. Returns: (contenido, mime_type, filename)."""
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise MediaSourceError(f"URL no soportada: {url}")
+
+        chunks = []
+        size = 0
+        try:
+            async with HTTP_CLIENTS.web().stream(
+                "GET", url, timeout=config.media_download_timeout
+            ) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes():
+                    size += len(chunk)
+                    if size > config.outbound_media_max_bytes:
+                        raise MediaSourceError(
+                            f"{url} supera {config.outbound_media_max_bytes} bytes"
+                        )
+                    chunks.append(chunk)
+                mime_type = resp.headers.get("content-type", "").split(";")[0].strip()
+        except httpx.HTTPError as e:
+            raise MediaSourceError(f"No se pudo descargar {url}: {e}") from e
+
+        return b"".join(chunks), mime_type or "application/octet-stream", _filename(url)
+
+    async def _upload(
+        self,
+        data: bytes,
+        mime_type: str,
+        filename: str,
+        token: str,
+        phone_number_id: str,
+    ) -> str:
+        form = aiohttp.FormData()
+        form.add_field("messaging_product", "whatsapp")
+        form.add_field("type", mime_type)
+        form.add_field("file", data, filename=filename, content_type=mime_type)
+
+        session = HTTP_CLIENTS.graph()
+        async with session.post(
+            f"{GRAPH_API_URL}/{phone_number_id}/media",
+            data=form,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=aiohttp.ClientTimeout(total=config.media_download_timeout),
+        ) as resp:
+            result = await read_graph_response(resp)
+        return result["id"]
+
+    async def media_for_url(
+        self, url: str, token: str, phone_number_id: str
+    ) -> tuple[str, str, str]:
+        """
+        Media ID vigente para enviar `url` desde `phone_number_id`, subiendo
+        el archivo solo si hace falta.
+
+        Returns:
+            (media_id, tipo de mensaje, filename)
+
+        Raises:
+            MediaSourceError: si la URL no se puede descargar
+            WhatsAppAPIError: si la subida falla
+        """
+        cache = self._get_cache()
+        source = cache.get(f"url:{url}")
+        if source is not None:
+            media_id = cache.get(f"id:{phone_number_id}:{source['sha256']}")
+            if media_id is not None:
+                self.url_hits += 1
+                self.bytes_saved += source.get("size", 0)
+                return media_id, media_kind(source["mime_type"]), source["filename"]
+
+        # Una sola descarga/subida por URL y negocio aunque lleguen varias a la vez
+        key = f"{phone_number_id}:{url}"
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._resolve(url, token, phone_number_id)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Evitar "exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _resolve(
+        self, url: str, token: str, phone_number_id: str
+    ) -> tuple[str, str, str]:
+        cache = self._get_cache()
+        data, mime_type, filename = await self._download(url)
+        sha256 = hashlib.sha256(data).hexdigest()
+        cache.set(
+            f"url:{url}",
+            {
+                "sha256": sha256,
+                "mime_type": mime_type,
+                "filename": filename,
+                "size": len(data),
+            },
+            expire=self.url_ttl_seconds,
+        )
+
+        id_key = f"id:{phone_number_id}:{sha256}"
+        media_id = cache.get(id_key)
+        if media_id is not None:
+            # Mismo archivo publicado en otra URL: se reutiliza la subida
+            self.id_hits += 1
+            self.bytes_saved += len(data)
+            return media_id, media_kind(mime_type), filename
+
+        try:
+            media_id = await self._upload(
+                data, mime_type, filename, token, phone_number_id
+            )
+        except Exception:
+            self.upload_failures += 1
+            raise
+        cache.set(id_key, media_id, expire=self.ttl_seconds)
+        self.uploads += 1
+        self.bytes_uploaded += len(data)
+        logger.info(
+            f"📤 Media subida a Meta ({filename}, {len(data)} bytes, "
+            f"Phone ID: {phone_number_id})"
+        )
+        return media_id, media_kind(mime_type), filename
+
+    def close(self):
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+    def stats(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "upload_failures": self.upload_failures,
+            "url_hits": self.url_hits,
+            "id_hits": self.id_hits,
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+# Instancia global
+MEDIA_UPLOADER = MediaUploader(
+    directory=config.outbound_media_cache_dir,
+    ttl_seconds=config.outbound_media_ttl_seconds,
+    url_ttl_seconds=config.outbound_media_url_ttl_seconds,
+)
@@ -0,0 +1,425 @@
+"""
+Despachador de envíos salientes a la Graph API, por phone_number_id.
+
+Meta limita el throughput de cada número (429 / 130429) y el de cada par
+número-destinatario (131056). Antes `send_text` lanzaba RuntimeError y la
+respuesta se perdía. Ahora cada número tiene un carril (lane) con:
+
+    - token bucket propio (OUTBOUND_RATE_PER_SECOND / OUTBOUND_BURST): los
+      envíos a distintos destinatarios salen en paralelo, sin más espera que
+      la de un token
+    - cola FIFO por destinatario: las partes de una respuesta salen en orden
+    - reintentos con backoff exponencial con jitter que respeta Retry-After
+      (throttling, 5xx y errores de red). El throttling del número pausa todo
+      el carril; el 131056 solo a ese destinatario
+    - indicadores de escritura/lectura coalescidos por destinatario (marcar
+      como leído el último mensaje marca también los anteriores) y enviados
+      antes de su próxima respuesta
+    - media (brochures, imágenes) en la misma cola que los textos, así un
+      adjunto sale siempre después de la respuesta que lo acompaña
+
+Cada destinatario con envíos pendientes tiene su propio task, que termina
+al vaciar su cola. Límite: un envío que sigue fallando tras
+OUTBOUND_MAX_ATTEMPTS intentos (o con un error no reintentable) se descarta;
+se registra en el log y el llamador recibe la excepción. No hay almacén
+persistente de reintentos.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import aiohttp
+
+from whatsapp.config import config
+from whatsapp.webhook.response.reply import WhatsAppAPIError, send_media, send_text
+from whatsapp.webhook.response.typing import send_typing_indicator
+
+logger = logging.getLogger("whatsapp")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = max(0.01, rate)
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float):
+        """Congela el carril (p. ej. por Retry-After de Meta)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Outgoing:
+    __slots__ = ("kwargs", "future", "enqueued_at", "send")
+
+    def __init__(self, kwargs: dict, future: asyncio.Future | None, send=send_text):
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.send = send
+
+
+class _Recipient:
+    __slots__ = ("queue", "indicator", "task")
+
+    def __init__(self):
+        self.queue: deque[_Outgoing] = deque()
+        self.indicator: _Outgoing | None = None
+        self.task: asyncio.Task | None = None
+
+
+class _Lane:
+    def __init__(self, phone_number_id: str):
+        self.phone_number_id = phone_number_id
+        self.bucket = TokenBucket(
+            config.outbound_rate_per_second, config.outbound_burst
+        )
+        self.recipients: dict[str, _Recipient] = {}
+
+        # Métricas
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.pair_throttled = 0
+        self.indicators_sent = 0
+        self.indicators_coalesced = 0
+        self.latencies: deque[float] = deque(maxlen=500)
+
+    @property
+    def depth(self) -> int:
+        return sum(len(r.queue) for r in self.recipients.values())
+
+    def recipient(self, to: str) -> _Recipient:
+        recipient = self.recipients.get(to)
+        if recipient is None:
+            recipient = self.recipients[to] = _Recipient()
+        return recipient
+
+    def ensure_sender(self, to: str):
+        recipient = self.recipients[to]
+        if recipient.task is None or recipient.task.done():
+            recipient.task = asyncio.create_task(
+                self._drain(to, recipient), name=f"outbound-{self.phone_number_id}"
+            )
+
+    async def _drain(self, to: str, recipient: _Recipient):
+        """Envía en orden lo pendiente de un destinatario."""
+        try:
+            while recipient.indicator or recipient.queue:
+                # El indicador va primero: solo tiene sentido antes de la respuesta
+                if recipient.indicator:
+                    item, recipient.indicator = recipient.indicator, None
+                    await self.bucket.take()
+                    await self._send_indicator(item)
+                    continue
+                await self._deliver(recipient.queue[0])
+                recipient.queue.popleft()
+        finally:
+            if (
+                not recipient.queue
+                and not recipient.indicator
+                and self.recipients.get(to) is recipient
+            ):
+                del self.recipients[to]
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        delay = random.uniform(
+            0,
+            min(config.outbound_backoff_max, config.outbound_backoff_base * 2**attempt),
+        )
+        return max(delay, retry_after or 0.0)
+
+    async def _deliver(self, item: _Outgoing):
+        attempt = 0
+        while True:
+            await self.bucket.take()
+            try:
+                result = await item.send(**item.kwargs)
+            except (WhatsAppAPIError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, WhatsAppAPIError) or e.retryable
+                attempt += 1
+                if not retryable or attempt >= config.outbound_max_attempts:
+                    self.failed += 1
+                    logger.error(
+                        f"❌ Envío a {item.kwargs.get('to')} descartado tras {attempt} intento(s) "
+                        f"(Phone ID: {self.phone_number_id}): {e}"
+                    )
+                    if item.future and not item.future.done():
+                        item.future.set_exception(e)
+                    return
+
+                retry_after = getattr(e, "retry_after", None)
+                delay = self._backoff(attempt, retry_after)
+                self.retries += 1
+                if isinstance(e, WhatsAppAPIError) and e.pair_limited:
+                    # Límite del par: solo espera este destinatario
+                    self.pair_throttled += 1
+                elif isinstance(e, WhatsAppAPIError) and e.throttled:
+                    # El throttling afecta a todo el número: pausar el carril
+                    self.throttled += 1
+                    self.bucket.pause(delay)
+                logger.warning(
+                    f"⏳ Reintento {attempt} a {item.kwargs.get('to')} en {delay:.1f}s "
+                    f"(Phone ID: {self.phone_number_id}): {e}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                self.failed += 1
+                if item.future and not item.future.done():
+                    item.future.set_exception(e)
+                return
+
+            self.sent += 1
+            self.latencies.append(time.monotonic() - item.enqueued_at)
+            if item.future and not item.future.done():
+                item.future.set_result(result)
+            return
+
+    async def _send_indicator(self, item: _Outgoing):
+        try:
+            await send_typing_indicator(**item.kwargs)
+            self.indicators_sent += 1
+        except WhatsAppAPIError as e:
+            # Best effort: no se reintenta, pero un throttle sí frena el carril
+            if e.throttled and not e.pair_limited:
+                self.throttled += 1
+                self.bucket.pause(self._backoff(1, e.retry_after))
+            logger.warning(f"⚠️ Indicador de escritura no enviado: {e}")
+        except Exception as e:
+            logger.warning(f"⚠️ Indicador de escritura no enviado: {e}")
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+        p95 = (
+            latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            if latencies
+            else 0.0
+        )
+        return {
+            "depth": self.depth,
+            "recipients": len(self.recipients),
+            "pending_indicators": sum(
+                1 for r in self.recipients.values() if r.indicator
+            ),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "pair_throttled": self.pair_throttled,
+            "indicators_sent": self.indicators_sent,
+            "indicators_coalesced": self.indicators_coalesced,
+            "latency_avg_ms": (
+                round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0
+            ),
+            "latency_p95_ms": round(p95 * 1000, 2),
+            "tokens": round(self.bucket.tokens, 2),
+        }
+
+
+class OutboundDispatcher:
+    def __init__(self):
+        self._lanes: dict[str, _Lane] = {}
+
+    def _lane(self, phone_number_id: str) -> _Lane:
+        lane = self._lanes.get(phone_number_id)
+        if lane is None:
+            lane = self._lanes[phone_number_id] = _Lane(phone_number_id)
+        return lane
+
+    async def send_text(
+        self,
+        to: str,
+        body: str,
+        *,
+        reply_to: str | None = None,
+        token: str = None,
+        phone_number_id: str = None,
+        preview_url: bool = False,
+    ) -> dict:
+        """
+        Encola un texto en el carril del número y espera a que se entregue.
+
+        Raises:
+            WhatsAppAPIError: si falla de forma definitiva (tras los reintentos)
+        """
+        results = await self.send_text_parts(
+            to,
+            [body],
+            reply_to=reply_to,
+            token=token,
+            phone_number_id=phone_number_id,
+            preview_url=preview_url,
+        )
+        return results[0]
+
+    async def send_text_parts(
+        self,
+        to: str,
+        parts: list[str],
+        *,
+        reply_to: str | None = None,
+        token: str = None,
+        phone_number_id: str = None,
+        preview_url: bool = False,
+    ) -> list[dict]:
+        """
+        Encola las partes de una misma respuesta en la cola del destinatario:
+        salen en orden y sin más espera que la del token bucket.
+        Solo la primera se enlaza al mensaje original (context.message_id).
+
+        Raises:
+            WhatsAppAPIError: si alguna parte falla de forma definitiva
+        """
+        lane = self._lane(phone_number_id)
+        recipient = lane.recipient(to)
+        loop = asyncio.get_running_loop()
+        futures = []
+        for i, part in enumerate(parts):
+            future = loop.create_future()
+            recipient.queue.append(
+                _Outgoing(
+                    {
+                        "to": to,
+                        "body": part,
+                        "reply_to": reply_to if i == 0 else None,
+                        "token": token,
+                        "phone_number_id": phone_number_id,
+                        "preview_url": preview_url,
+                    },
+                    future,
+                )
+            )
+            futures.append(future)
+        lane.ensure_sender(to)
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def send_media(
+        self,
+        to: str,
+        kind: str,
+        media_id: str,
+        *,
+        caption: str | None = None,
+        filename: str | None = None,
+        token: str = None,
+        phone_number_id: str = None,
+    ) -> dict:
+        """
+        Encola un media ya subido detrás de los textos pendientes del destinatario
+        y espera a que se entregue (mismos reintentos que los textos).
+
+        Raises:
+            WhatsAppAPIError: si falla de forma definitiva
+        """
+        lane = self._lane(phone_number_id)
+        future = asyncio.get_running_loop().create_future()
+        lane.recipient(to).queue.append(
+            _Outgoing(
+                {
+                    "to": to,
+                    "kind": kind,
+                    "media_id": media_id,
+                    "caption": caption,
+                    "filename": filename,
+                    "token": token,
+                    "phone_number_id": phone_number_id,
+                },
+                future,
+                send=send_media,
+            )
+        )
+        lane.ensure_sender(to)
+        return await future
+
+    def send_indicator(
+        self,
+        message_id: str,
+        token: str,
+        phone_number_id: str,
+        recipient: str | None = None,
+    ):
+        """
+        Encola un indicador de escritura + lectura (sin esperar). Si ya hay
+        uno pendiente para el mismo destinatario se reemplaza por el nuevo.
+        """
+        lane = self._lane(phone_number_id)
+        key = recipient or message_id
+        pending = lane.recipient(key)
+        if pending.indicator is not None:
+            lane.indicators_coalesced += 1
+        pending.indicator = _Outgoing(
+            {
+                "message_id": message_id,
+                "token": token,
+                "phone_number_id": phone_number_id,
+            },
+            None,
+        )
+        lane.ensure_sender(key)
+
+    async def stop(self, drain_timeout: float = 0.0):
+        """Espera (hasta drain_timeout) a vaciar los carriles y detiene los envíos."""
+        deadline = time.monotonic() + drain_timeout
+        while (
+            any(lane.depth for lane in self._lanes.values())
+            and time.monotonic() < deadline
+        ):
+            await asyncio.sleep(0.05)
+
+        pending = sum(lane.depth for lane in self._lanes.values())
+        if pending:
+            logger.warning(f"⚠️ {pending} mensaje(s) salientes sin enviar al apagar")
+
+        recipients = [
+            recipient
+            for lane in self._lanes.values()
+            for recipient in lane.recipients.values()
+        ]
+        for recipient in recipients:
+            for item in recipient.queue:
+                if item.future and not item.future.done():
+                    item.future.set_exception(RuntimeError("Servidor apagándose"))
+
+        tasks = [r.task for r in recipients if r.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lanes.clear()
+
+    def stats(self) -> dict:
+        return {
+            phone_number_id: lane.stats()
+            for phone_number_id, lane in self._lanes.items()
+        }
+
+
+# Instancia global
+OUTBOUND = OutboundDispatcher()
@@ -1,4 +1,56 @@
-import aiohttp
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+
+# Códigos de Meta que indican throttling (se reintentan)
+THROTTLE_ERROR_CODES = {
+    4,  # Application request limit reached
+    80007,  # Rate limit de la cuenta de WhatsApp Business
+    130429,  # Throughput del número superado
+    131056,  # Demasiados mensajes al mismo destinatario (pair rate limit)
+}
+
+# Límite por par número-destinatario: no frena envíos a otros destinatarios
+PAIR_RATE_LIMIT_CODE = 131056
+
+
+class WhatsAppAPIError(RuntimeError):
+    """Error HTTP de la Graph API con el código de Meta y el Retry-After."""
+
+    def __init__(self, status: int, data, retry_after: float | None = None):
+        error = data.get("error", {}) if isinstance(data, dict) else {}
+        self.status = status
+        self.code = error.get("code")
+        self.retry_after = retry_after
+        self.data = data
+        super().__init__(f"WhatsApp API error {status}: {data}")
+
+    @property
+    def throttled(self) -> bool:
+        return self.status == 429 or self.code in THROTTLE_ERROR_CODES
+
+    @property
+    def pair_limited(self) -> bool:
+        return self.code == PAIR_RATE_LIMIT_CODE
+
+    @property
+    def retryable(self) -> bool:
+        return self.throttled or self.status >= 500
+
+
+async def read_graph_response(resp) -> dict:
+    """Devuelve el JSON de la respuesta o lanza WhatsAppAPIError."""
+    try:
+        data = await resp.json(content_type=None)
+    except ValueError:
+        data = {"raw": await resp.text()}
+
+    if resp.status >= 400:
+        retry_after = resp.headers.get("Retry-After")
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        raise WhatsAppAPIError(resp.status, data, retry_after)
+    return data
 
 
 async def send_text(
@@ -27,9 +79,39 @@ async def send_text(
     if reply_to:
         payload["context"] = {"message_id": reply_to}
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(API_URL, json=payload, headers=headers) as resp:
-            data = await resp.json()
-            if resp.status >= 400:
-                raise RuntimeError(f"WhatsApp API error {resp.status}: {data}")
-            return data
+    session = HTTP_CLIENTS.graph()
+    async with session.post(API_URL, json=payload, headers=headers) as resp:
+        return await read_graph_response(resp)
+
+
+async def send_media(
+    to: str,
+    kind: str,
+    media_id: str,
+    *,
+    caption: str | None = None,
+    filename: str | None = None,
+    token: str = None,
+    phone_number_id: str = None,
+):
+    """Envía un media ya subido (image / document / video / audio) por su ID."""
+    API_URL = f"https://graph.facebook.com/v21.0/{phone_number_id}/messages"
+
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+
+    media = {"id": media_id}
+    if caption and kind in ("image", "video", "document"):
+        media["caption"] = caption
+    if filename and kind == "document":
+        media["filename"] = filename
+
+    payload = {
+        "messaging_product": "whatsapp",
+        "to": to,
+        "type": kind,
+        kind: media,
+    }
+
+    session = HTTP_CLIENTS.graph()
+    async with session.post(API_URL, json=payload, headers=headers) as resp:
+        return await read_graph_response(resp)
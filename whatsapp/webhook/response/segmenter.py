@@ -0,0 +1,85 @@
+"""
+Segmentación de respuestas largas para WhatsApp.
+
+Un mensaje de texto admite como máximo 4096 caracteres. `split_message`
+divide la respuesta del agente en partes que respetan ese límite, cortando
+en el borde más natural disponible:
+
+    párrafo → línea → oración → palabra → corte duro
+
+Los cortes se empaquetan de forma codiciosa para enviar la menor cantidad
+de mensajes posible. Módulo puro: no depende de config ni de la red.
+"""
+
+import re
+
+WHATSAPP_TEXT_LIMIT = 4096
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…;:])\s+")
+
+# Separadores en orden de preferencia (None = oraciones, por regex)
+_LEVELS = ("\n\n", "\n", None, " ")
+
+
+def _split_level(text: str, level) -> list[str]:
+    if level is None:
+        return _SENTENCE_END.split(text)
+    return text.split(level)
+
+
+def _joiner(level) -> str:
+    return " " if level is None else level
+
+
+def _pack(text: str, limit: int, depth: int = 0) -> list[str]:
+    if len(text) <= limit:
+        return [text]
+
+    if depth >= len(_LEVELS):
+        # Sin bordes naturales (p. ej. una URL gigante): corte duro
+        return [text[i : i + limit] for i in range(0, len(text), limit)]
+
+    level = _LEVELS[depth]
+    joiner = _joiner(level)
+    pieces = _split_level(text, level)
+    if len(pieces) == 1:
+        return _pack(text, limit, depth + 1)
+
+    parts = []
+    current = ""
+    for piece in pieces:
+        if not piece:
+            continue
+
+        candidate = f"{current}{joiner}{piece}" if current else piece
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+
+        if current:
+            parts.append(current)
+        if len(piece) <= limit:
+            current = piece
+        else:
+            # La pieza sola no entra: bajar al siguiente nivel de corte
+            sub_parts = _pack(piece, limit, depth + 1)
+            parts.extend(sub_parts[:-1])
+            current = sub_parts[-1]
+
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_message(text: str, limit: int = WHATSAPP_TEXT_LIMIT) -> list[str]:
+    """
+    Divide `text` en partes de como máximo `limit` caracteres.
+
+    Returns:
+        Lista de partes en orden (vacía si el texto está vacío)
+    """
+    text = (text or "").strip()
+    if not text:
+        return []
+
+    return [part.strip() for part in _pack(text, max(1, limit)) if part.strip()]
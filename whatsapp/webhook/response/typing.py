@@ -1,4 +1,5 @@
-import aiohttp
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+from whatsapp.webhook.response.reply import read_graph_response
 
 
 async def send_typing_indicator(message_id: str, token: str, phone_number_id: str):
@@ -13,11 +14,6 @@ async def send_typing_indicator(message_id: str, token: str, phone_number_id: st
         "typing_indicator": {"type": "text"},
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(API_URL, json=payload, headers=headers) as resp:
-            data = await resp.json()
-            if resp.status >= 400:
-                raise RuntimeError(
-                    f"WhatsApp typing indicator error {resp.status}: {data}"
-                )
-            return data
+    session = HTTP_CLIENTS.graph()
+    async with session.post(API_URL, json=payload, headers=headers) as resp:
+        return await read_graph_response(resp)
@@ -0,0 +1,137 @@
+"""
+Indicador de escritura sostenido durante toda la corrida del agente.
+
+El indicador de WhatsApp caduca a los ~25 s: en corridas lentas el usuario
+dejaba de ver "escribiendo...". `TYPING_KEEPALIVE.keep()` lo mantiene vivo
+refrescándolo cada TYPING_REFRESH_SECONDS mientras dura la corrida y lo
+detiene al salir (justo antes de enviar la respuesta).
+
+Los indicadores se coalescen por sesión: si ya hay un keepalive activo o
+se envió uno hace menos de un intervalo, no se manda otro. Las llamadas
+evitadas se cuentan en `saved`.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+class _Keepalive:
+    __slots__ = ("send", "holders", "task")
+
+    def __init__(self, send: Callable):
+        self.send = send
+        self.holders = 1
+        self.task: asyncio.Task | None = None
+
+
+class TypingKeepalive:
+    def __init__(self, interval: float):
+        self.interval = max(1.0, interval)
+        self._sessions: dict[str, _Keepalive] = {}
+        self._last_sent: dict[str, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+        # Métricas
+        self.sent = 0
+        self.refreshes = 0
+        self.saved = 0
+
+    def _recently_sent(self, key: str) -> bool:
+        last = self._last_sent.get(key)
+        return last is not None and time.monotonic() - last < self.interval
+
+    async def _fire(self, key: str, send: Callable):
+        self._last_sent[key] = time.monotonic()
+        self.sent += 1
+        try:
+            result = send()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.warning(f"⚠️ Indicador de escritura no enviado ({key}): {e}")
+
+        if len(self._last_sent) > 5000:
+            cutoff = time.monotonic() - self.interval
+            self._last_sent = {k: t for k, t in self._last_sent.items() if t > cutoff}
+
+    def touch(self, key: str, send: Callable | None):
+        """
+        Indicador puntual (p. ej. al recibir el mensaje). Se omite si la
+        sesión ya tiene un keepalive activo o uno reciente.
+        """
+        if send is None:
+            return
+        if key in self._sessions or self._recently_sent(key):
+            self.saved += 1
+            return
+
+        task = asyncio.create_task(self._fire(key, send))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _loop(self, key: str, entry: _Keepalive):
+        first = True
+        while True:
+            last = self._last_sent.get(key)
+            now = time.monotonic()
+            if last is None or now - last >= self.interval:
+                if not first:
+                    self.refreshes += 1
+                await self._fire(key, entry.send)
+                delay = self.interval
+            else:
+                if first:
+                    self.saved += 1
+                delay = self.interval - (now - last)
+            first = False
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def keep(self, key: str, send: Callable | None):
+        """
+        Mantiene el indicador mientras dura el bloque. Si la sesión ya tiene
+        un keepalive activo se reutiliza (con el `send` más reciente).
+        Sin `send` (canal sin destino para el indicador) no hace nada.
+        """
+        if send is None:
+            yield
+            return
+
+        entry = self._sessions.get(key)
+        if entry is not None:
+            entry.holders += 1
+            entry.send = send
+            self.saved += 1
+        else:
+            entry = self._sessions[key] = _Keepalive(send)
+            entry.task = asyncio.create_task(self._loop(key, entry))
+
+        try:
+            yield
+        finally:
+            entry.holders -= 1
+            if entry.holders == 0:
+                entry.task.cancel()
+                if self._sessions.get(key) is entry:
+                    del self._sessions[key]
+
+    def stats(self) -> dict:
+        return {
+            "interval_s": self.interval,
+            "active_sessions": len(self._sessions),
+            "sent": self.sent,
+            "refreshes": self.refreshes,
+            "saved": self.saved,
+        }
+
+
+# Instancia global compartida por los canales WhatsApp y web
+TYPING_KEEPALIVE = TypingKeepalive(interval=config.typing_refresh_seconds)
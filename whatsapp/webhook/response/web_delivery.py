@@ -0,0 +1,374 @@
+"""
+Entrega confiable a los `webhook_url` de los clientes web.
+
+Antes `send_web_message` hacía un único intento con timeout fijo de 10 s y
+devolvía False ante cualquier error: la respuesta generada se perdía y un
+frontend caído frenaba cada request. Ahora:
+
+    - circuit breaker por host: tras N fallos seguidos el host queda
+      "abierto" y no se le pega durante WEB_BREAKER_OPEN_SECONDS
+    - primer intento inline con timeout corto; si falla (o el circuito
+      está abierto) la entrega sigue en segundo plano con reintentos
+      acotados y backoff con jitter
+    - agotados los reintentos (o al apagar) el mensaje va a una tabla
+      SQLite de dead-letter, re-enviable con:
+
+        python -m whatsapp.webhook.response.web_delivery list
+        python -m whatsapp.webhook.response.web_delivery replay [--host H] [--limit N]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+from whatsapp.config import config
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+
+logger = logging.getLogger("whatsapp")
+
+DELIVERED = "delivered"
+QUEUED = "queued"
+DEAD = "dead"
+SKIPPED = "skipped"
+
+
+class CircuitBreaker:
+    """closed → (N fallos) → open → (espera) → half_open → 1 prueba."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = "closed"
+        self.probing = False
+
+        # Métricas
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self.state = "half_open"
+
+        if self.state == "half_open":
+            if self.probing:
+                self.short_circuited += 1
+                return False
+            self.probing = True
+        return True
+
+    def retry_in(self) -> float:
+        """Segundos hasta que el host vuelva a aceptar una prueba."""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class DeadLetterStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+
+    def _get_db(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS web_dead_letters ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "url TEXT NOT NULL, host TEXT NOT NULL, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL, last_error TEXT, "
+                "created_at REAL NOT NULL, last_attempt_at REAL, "
+                "delivered_at REAL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def add(self, url: str, payload: dict, attempts: int, error: str):
+        now = time.time()
+        db = self._get_db()
+        db.execute(
+            "INSERT INTO web_dead_letters "
+            "(url, host, payload, attempts, last_error, created_at, last_attempt_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, _host(url), json.dumps(payload), attempts, error, now, now),
+        )
+        db.commit()
+
+    def pending(self, host: str = None, limit: int = 100) -> list[tuple]:
+        query = (
+            "SELECT id, url, payload, attempts, last_error, created_at "
+            "FROM web_dead_letters WHERE delivered_at IS NULL"
+        )
+        params: list = []
+        if host:
+            query += " AND host = ?"
+            params.append(host)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return self._get_db().execute(query, params).fetchall()
+
+    def mark_delivered(self, row_id: int):
+        db = self._get_db()
+        db.execute(
+            "UPDATE web_dead_letters SET delivered_at = ?, "
+            "attempts = attempts + 1, last_attempt_at = ? WHERE id = ?",
+            (time.time(), time.time(), row_id),
+        )
+        db.commit()
+
+    def mark_failed(self, row_id: int, error: str):
+        db = self._get_db()
+        db.execute(
+            "UPDATE web_dead_letters SET attempts = attempts + 1, "
+            "last_error = ?, last_attempt_at = ? WHERE id = ?",
+            (error, time.time(), row_id),
+        )
+        db.commit()
+
+    def count_pending(self) -> int:
+        if self._db is None and not os.path.exists(self.path):
+            return 0
+        return (
+            self._get_db()
+            .execute("SELECT COUNT(*) FROM web_dead_letters WHERE delivered_at IS NULL")
+            .fetchone()[0]
+        )
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc.lower()
+
+
+class WebDelivery:
+    def __init__(self):
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._pending: dict[asyncio.Task, tuple[str, dict, int]] = {}
+        self.dead_letters = DeadLetterStore(config.web_dead_letter_path)
+
+        # Métricas
+        self.delivered = 0
+        self.delivered_after_retry = 0
+        self.queued = 0
+        self.dead = 0
+        self.indicators_skipped = 0
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = _host(url)
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(
+                config.web_breaker_failures, config.web_breaker_open_seconds
+            )
+        return breaker
+
+    async def _post(self, url: str, payload: dict, timeout: float):
+        """Un intento, registrado en el breaker del host."""
+        breaker = self.breaker(url)
+        try:
+            response = await HTTP_CLIENTS.web().post(
+                url,
+                json=payload,
+                headers={"Content-Type": "application/json"},
+                timeout=timeout,
+            )
+            response.raise_for_status()
+        except Exception:
+            # Cualquier error (también httpx.InvalidURL) cuenta como fallo
+            breaker.record_failure()
+            raise
+        else:
+            breaker.record_success()
+        finally:
+            # Cancelado a mitad de una prueba: no dejar el host bloqueado
+            breaker.probing = False
+
+    async def deliver(self, url: str, payload: dict, retry: bool = True) -> str:
+        """
+        Entrega `payload` a `url`.
+
+        Returns:
+            "delivered" si llegó en el primer intento, "queued" si sigue en
+            segundo plano, "dead" si fue al dead-letter y "skipped" para los
+            envíos sin reintento (indicadores) que no se pudieron hacer.
+        """
+        breaker = self.breaker(url)
+        error = "circuito abierto"
+        if breaker.allow():
+            try:
+                await self._post(url, payload, config.web_delivery_timeout)
+                self.delivered += 1
+                return DELIVERED
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+        if not retry:
+            self.indicators_skipped += 1
+            return SKIPPED
+
+        if config.web_delivery_max_attempts <= 1:
+            self._dead_letter(url, payload, 1, error)
+            return DEAD
+
+        logger.warning(
+            f"⏳ Entrega web a {_host(url)} pendiente ({error}): reintento en segundo plano"
+        )
+        self.queued += 1
+        task = asyncio.create_task(self._retry(url, payload, error))
+        self._pending[task] = (url, payload, 1)
+        task.add_done_callback(self._pending.pop)
+        return QUEUED
+
+    async def _retry(self, url: str, payload: dict, error: str):
+        breaker = self.breaker(url)
+        attempt = 1
+        while attempt < config.web_delivery_max_attempts:
+            delay = random.uniform(
+                0,
+                min(
+                    config.web_delivery_backoff_max,
+                    config.web_delivery_backoff_base * 2**attempt,
+                ),
+            )
+            await asyncio.sleep(max(delay, breaker.retry_in()))
+
+            # Un intento cortado por el circuito también cuenta: reintentos acotados
+            attempt += 1
+            if not breaker.allow():
+                error = "circuito abierto"
+                continue
+
+            self._pending[asyncio.current_task()] = (url, payload, attempt)
+            try:
+                await self._post(url, payload, config.web_delivery_timeout)
+                self.delivered_after_retry += 1
+                logger.info(f"✅ Entrega web a {_host(url)} tras {attempt} intentos")
+                return
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+        self._dead_letter(url, payload, attempt, error)
+
+    def _dead_letter(self, url: str, payload: dict, attempts: int, error: str):
+        self.dead += 1
+        try:
+            self.dead_letters.add(url, payload, attempts, error)
+            logger.error(
+                f"🪦 Entrega web a {_host(url)} enviada a dead-letter tras "
+                f"{attempts} intento(s): {error}"
+            )
+        except sqlite3.Error as e:
+            logger.error(f"❌ No se pudo guardar en dead-letter ({url}): {e}")
+
+    async def stop(self):
+        """Al apagar, las entregas aún pendientes van al dead-letter."""
+        pending = list(self._pending.items())
+        for task, (url, payload, attempts) in pending:
+            task.cancel()
+            self._dead_letter(url, payload, attempts, "apagado con reintento pendiente")
+        await asyncio.gather(*(task for task, _ in pending), return_exceptions=True)
+
+    async def replay(self, host: str = None, limit: int = 100) -> tuple[int, int]:
+        """Re-envía las entregas del dead-letter. Devuelve (ok, fallidas)."""
+        ok = failed = 0
+        for row_id, url, payload, _, _, _ in self.dead_letters.pending(host, limit):
+            try:
+                await self._post(url, json.loads(payload), config.web_delivery_timeout)
+                self.dead_letters.mark_delivered(row_id)
+                ok += 1
+            except Exception as e:
+                self.dead_letters.mark_failed(row_id, f"{type(e).__name__}: {e}")
+                failed += 1
+        return ok, failed
+
+    def stats(self) -> dict:
+        return {
+            "delivered": self.delivered,
+            "delivered_after_retry": self.delivered_after_retry,
+            "retrying": len(self._pending),
+            "queued": self.queued,
+            "dead": self.dead,
+            "indicators_skipped": self.indicators_skipped,
+            "breakers": {
+                host: {
+                    "state": b.state,
+                    "failures": b.failures,
+                    "times_opened": b.times_opened,
+                    "short_circuited": b.short_circuited,
+                }
+                for host, b in self._breakers.items()
+            },
+        }
+
+
+# Instancia global
+WEB_DELIVERY = WebDelivery()
+
+
+# ==========================================================
+# CLI: listar / re-enviar el dead-letter
+# ==========================================================
+async def _replay_cli(host: str, limit: int):
+    try:
+        ok, failed = await WEB_DELIVERY.replay(host, limit)
+    finally:
+        await HTTP_CLIENTS.close()
+    print(f"Re-enviados: {ok} · Fallidos: {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dead-letter de entregas web")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    list_cmd = sub.add_parser("list", help="Lista las entregas pendientes")
+    replay_cmd = sub.add_parser("replay", help="Re-envía las entregas pendientes")
+    for cmd in (list_cmd, replay_cmd):
+        cmd.add_argument("--host", default=None, help="Filtrar por host")
+        cmd.add_argument("--limit", type=int, default=100)
+
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for (
+            row_id,
+            url,
+            _,
+            attempts,
+            error,
+            created_at,
+        ) in WEB_DELIVERY.dead_letters.pending(args.host, args.limit):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at))
+            print(f"#{row_id}  {created}  {url}  intentos={attempts}  {error}")
+    else:
+        asyncio.run(_replay_cli(args.host, args.limit))
+
+
+if __name__ == "__main__":
+    main()
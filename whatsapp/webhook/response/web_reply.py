@@ -1,7 +1,7 @@
 import logging
 from typing import Optional
 
-import httpx
+from whatsapp.webhook.response.web_delivery import DEAD, DELIVERED, WEB_DELIVERY
 
 logger = logging.getLogger("whatsapp")
 
@@ -11,6 +11,7 @@ async def send_web_message(
     message: str,
     webhook_url: Optional[str] = None,
     metadata: Optional[dict] = None,
+    attachments: Optional[list[dict]] = None,
 ) -> bool:
     """
     Envía un mensaje de respuesta al canal web.
@@ -20,9 +21,11 @@ async def send_web_message(
         message: Texto del mensaje a enviar
         webhook_url: URL del webhook del cliente web (opcional)
         metadata: Datos adicionales del mensaje
+        attachments: Archivos adjuntos por las tools ({"url", "caption"})
 
     Returns:
-        bool: True si el envío fue exitoso, False en caso contrario
+        bool: True si se entregó o quedó reintentándose en segundo plano,
+        False si no hay datos o terminó en el dead-letter
     """
     try:
         if not (session_id and message):
@@ -37,26 +40,28 @@ async def send_web_message(
             "type": "text",
             "metadata": metadata or {},
         }
+        if attachments:
+            response_payload["attachments"] = attachments
 
-        # Si hay webhook_url, enviar la respuesta al cliente
+        # Si hay webhook_url, enviar la respuesta al cliente (con reintentos
+        # en segundo plano y dead-letter si el frontend no responde)
         if webhook_url:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    webhook_url,
-                    json=response_payload,
-                    headers={"Content-Type": "application/json"},
-                )
-                response.raise_for_status()
+            status = await WEB_DELIVERY.deliver(webhook_url, response_payload)
+            if status == DELIVERED:
                 logger.info(f"Mensaje web a {session_id}: Entrega exitosa")
-                return True
+            elif status == DEAD:
+                logger.error(f"Mensaje web a {session_id}: Enviado a dead-letter")
+                return False
+            else:
+                logger.warning(
+                    f"Mensaje web a {session_id}: Reintentando en segundo plano"
+                )
+            return True
         else:
             # Si no hay webhook_url, solo registrar (para websockets u otro método)
             logger.info(f"Mensaje web a {session_id}: Preparado para entrega")
             return True
 
-    except httpx.HTTPError as e:
-        logger.error(f"Mensaje web a {session_id}: Error HTTP - {str(e)}")
-        return False
     except Exception as e:
         logger.error(f"Mensaje web a {session_id}: Error inesperado - {str(e)}")
         return False
@@ -86,12 +91,8 @@ async def send_web_typing_indicator(
         }
 
         if webhook_url:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                await client.post(
-                    webhook_url,
-                    json=typing_payload,
-                    headers={"Content-Type": "application/json"},
-                )
+            # Sin reintentos: si el host está caído el indicador se omite
+            await WEB_DELIVERY.deliver(webhook_url, typing_payload, retry=False)
 
         logger.info(f"Indicador de escritura enviado a sesión web: {session_id}")
         return True
@@ -5,25 +5,56 @@
 # ==========================================================
 
 import asyncio
-import json
 import logging
 import re
+from functools import partial
 
-import httpx
-import openai
 from fastapi import APIRouter, HTTPException, Request, Response
 
-from whatsapp.agent.agents import agent_service
+from whatsapp.agent.agents import (
+    agent_service,
+    get_supersede_stats,
+    supersede_active_run,
+)
 from whatsapp.agent.load_instruction import load_instructions_for_user
 from whatsapp.config import config
-from whatsapp.webhook.request.dispatcher import dispatch_message
-from whatsapp.webhook.response.reply import send_text
-from whatsapp.webhook.response.typing import send_typing_indicator
+from whatsapp.webhook.media.documents import UnsupportedDocument
+from whatsapp.webhook.media.download import MediaTooLarge
+from whatsapp.webhook.media.processor import MEDIA_PROCESSOR
+from whatsapp.webhook.pipeline.admission import ADMISSION, Overloaded
+from whatsapp.webhook.pipeline.coalescer import (
+    MESSAGE_COALESCER,
+    combine_burst_messages,
+)
+from whatsapp.webhook.pipeline.session_executor import SESSION_EXECUTOR
+from whatsapp.webhook.pipeline.tenant_scheduler import (
+    AGENT_SCHEDULER,
+    SHEETS_SCHEDULER,
+    tenant_limits,
+)
+from whatsapp.webhook.pipeline.work_queue import WEBHOOK_QUEUE
+from whatsapp.webhook.request.dispatcher import dispatch_messages
+from whatsapp.webhook.request.payload import (
+    PayloadError,
+    WhatsAppMessage,
+    WhatsAppPayload,
+    decode_web_payload,
+    decode_whatsapp_payload,
+)
+from whatsapp.webhook.response.http_clients import HTTP_CLIENTS
+from whatsapp.webhook.response.media_upload import MEDIA_UPLOADER
+from whatsapp.webhook.response.outbound import OUTBOUND
+from whatsapp.webhook.response.segmenter import split_message
+from whatsapp.webhook.response.typing_keepalive import TYPING_KEEPALIVE
+from whatsapp.webhook.response.web_delivery import WEB_DELIVERY
 from whatsapp.webhook.response.web_reply import (
     send_web_message,
     send_web_typing_indicator,
 )
-from whatsapp.webhook.utilis.client_credentials import get_client_credentials
+from whatsapp.webhook.utilis.dedupe import WAMID_STORE
+from whatsapp.webhook.utilis.lead_index import LEAD_INDEX
+from whatsapp.webhook.utilis.security import SIGNATURE_STATS
+from whatsapp.webhook.utilis.tenant_registry import TENANT_REGISTRY, is_active
 from whatsapp.webhook.utilis.user_verify import get_or_create_user
 
 logger = logging.getLogger("whatsapp")
@@ -39,10 +70,17 @@ router = APIRouter()
 # ==========================================================
 # Helpers (mantienen igual)
 # ==========================================================
-async def parse_request_json(request: Request):
+async def parse_whatsapp_payload(request: Request) -> WhatsAppPayload:
+    """
+    Decodifica el cuerpo una sola vez a structs tipados. Si el middleware
+    de firma ya leyó (y verificó) el cuerpo, se reutiliza desde request.state.
+    """
+    raw_body = getattr(request.state, "raw_body", None)
+    if raw_body is None:
+        raw_body = await request.body()
     try:
-        return await request.json()
-    except Exception:
+        return decode_whatsapp_payload(raw_body)
+    except PayloadError:
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
 
@@ -51,8 +89,11 @@ def safe_get(d: dict, key: str, default=None):
 
 
 async def get_business(phone_id: str):
-    client = get_client_credentials(phone_id) if phone_id else None
-    return client
+    if not phone_id:
+        return None
+    # Solo espera si el registro todavía no cargó nunca (arranque sin lifespan)
+    await TENANT_REGISTRY.ensure_loaded()
+    return TENANT_REGISTRY.get(phone_id)
 
 
 async def send_whatsapp_message(
@@ -72,9 +113,18 @@ async def send_whatsapp_message(
             )
             return
 
-        await send_text(
+        # ✂️ Respuestas largas: partes dentro del límite de WhatsApp
+        parts = split_message(body, config.whatsapp_text_limit)
+        if not parts:
+            logger.warning(f"⚠️ Mensaje a {to}: sin contenido para enviar")
+            return
+        if len(parts) > 1:
+            logger.info(f"✂️ Mensaje a {to}: dividido en {len(parts)} partes")
+
+        # 📤 Carril del número: rate limit + reintentos ante throttling / 5xx
+        await OUTBOUND.send_text_parts(
             to=to,
-            body=body,
+            parts=parts,
             reply_to=reply_to_id,
             token=token,
             phone_number_id=phone_number_id,
@@ -87,37 +137,99 @@ async def send_whatsapp_message(
         logger.error(f"   Tipo: {type(e).__name__}")
 
 
-def extract_whatsapp_user_info(raw_data: dict) -> dict:
-    contacts = (
-        raw_data.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("contacts", [])
+# Envíos de adjuntos en curso (referencia fuerte hasta que terminen)
+ATTACHMENT_TASKS: set[asyncio.Task] = set()
+
+
+async def send_whatsapp_attachments(
+    to: str, attachments: list[dict], token: str, phone_number_id: str
+):
+    """
+    Sube (solo si el media ID no está en caché) y envía los adjuntos que
+    dejaron las tools, en orden y detrás del texto de la respuesta.
+    """
+    resolved = await asyncio.gather(
+        *(
+            MEDIA_UPLOADER.media_for_url(a["url"], token, phone_number_id)
+            for a in attachments
+        ),
+        return_exceptions=True,
     )
-    if contacts:
-        contact = contacts[0]
-        return {"usuario": contact.get("profile", {}).get("name", "")}
-    return {"usuario": ""}
+
+    for attachment, result in zip(attachments, resolved):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Adjunto {attachment['url']} no disponible: {result}")
+            continue
+
+        media_id, kind, filename = result
+        try:
+            await OUTBOUND.send_media(
+                to,
+                kind,
+                media_id,
+                caption=attachment.get("caption"),
+                filename=filename,
+                token=token,
+                phone_number_id=phone_number_id,
+            )
+            logger.info(f"📎 Adjunto a {to}: Entrega exitosa ({filename})")
+        except Exception as e:
+            logger.error(f"❌ Adjunto a {to}: Entrega fallida ({filename}): {e}")
 
 
-def get_media_url(media_id: str, token: str):
-    url = f"https://graph.facebook.com/v20.0/{media_id}"
-    resp = httpx.get(url, headers={"Authorization": f"Bearer {token}"})
-    resp.raise_for_status()
-    return resp.json().get("url")
+# Tipos de media que se convierten en texto para el agente
+MEDIA_TYPES = ("audio", "image", "document")
 
+MEDIA_TOO_LARGE_REPLIES = {
+    "audio": "Tu audio es demasiado largo para procesarlo.",
+    "image": "Tu imagen es demasiado grande para procesarla.",
+    "document": "Tu documento es demasiado grande para procesarlo.",
+}
 
-def download_media(media_url: str, token: str):
-    resp = httpx.get(media_url, headers={"Authorization": f"Bearer {token}"})
-    resp.raise_for_status()
-    return resp.content
+MEDIA_FAILED_REPLIES = {
+    "audio": "No pude procesar tu audio.",
+    "image": "No pude procesar tu imagen.",
+    "document": "No pude procesar tu documento.",
+}
 
 
-def transcribe_audio(audio_bytes: bytes):
-    resp = openai.audio.transcriptions.create(
-        model="gpt-4o-transcribe", file=("audio.ogg", audio_bytes)
-    )
-    return resp.text
+async def media_to_message(unit: dict, token: str) -> str:
+    """
+    Convierte un audio, imagen o documento en el texto que recibe el agente
+    (transcripción, descripción o contenido extraído + el caption).
+    """
+    msg_type = unit.get("type")
+    media_id = unit.get("media_id")
+    caption = (unit.get("caption") or "").strip()
+
+    try:
+        if msg_type == "audio":
+            return await MEDIA_PROCESSOR.transcribe_voice_note(media_id, token)
+
+        if msg_type == "image":
+            description = await MEDIA_PROCESSOR.describe_image(media_id, token)
+            text = f"[El usuario envió una imagen: {description}]"
+        else:
+            filename = unit.get("filename")
+            content = await MEDIA_PROCESSOR.read_document(media_id, token, filename)
+            text = (
+                f'[El usuario envió el documento "{filename or "sin nombre"}". '
+                f"Contenido:\n{content or '(sin texto legible)'}]"
+            )
+    except MediaTooLarge as e:
+        logger.warning(f"⚠️ Media descartada ({msg_type}): {e}")
+        return MEDIA_TOO_LARGE_REPLIES[msg_type]
+    except UnsupportedDocument as e:
+        logger.warning(f"⚠️ Documento no soportado: {e}")
+        return (
+            f'[El usuario envió el documento "{unit.get("filename") or "sin nombre"}", '
+            "en un formato que no se puede leer]"
+        )
+    except Exception as e:
+        logger.error(f"❌ Error procesando {msg_type}: {e}")
+        return MEDIA_FAILED_REPLIES[msg_type]
+
+    return f"{text}\n{caption}" if caption else text
 
 
 def normalize_whatsapp_number(raw: str) -> str:
@@ -175,14 +287,9 @@ def validate_business_status(client: dict, phone_id: str) -> bool:
         logger.error(f"❌ Phone ID {phone_id}: Cliente no encontrado")
         return False
 
-    status = safe_get(client, "Status")
     business_name = safe_get(client, "Business Name", "Desconocido")
 
-    # Convertir a booleano si viene como string
-    if isinstance(status, str):
-        status = status.lower() in ("true", "1", "yes", "si", "sí")
-
-    if not status:
+    if not is_active(client):
         logger.warning(
             f"⛔ Negocio '{business_name}' (Phone ID: {phone_id}): Status = FALSE - Agente desactivado"
         )
@@ -212,7 +319,30 @@ async def verify(request: Request):
 # ==========================================================
 # ✅ NUEVA FUNCIÓN: FILTRAR NOTIFICACIONES DE ESTADO
 # ==========================================================
-def should_process_webhook(raw_data: dict) -> bool:
+VALID_MESSAGE_TYPES = [
+    "text",
+    "audio",
+    "image",
+    "video",
+    "document",
+    "button",
+    "interactive",
+]
+
+
+def is_processable_message(message: WhatsAppMessage) -> bool:
+    """
+    Determina si un mensaje individual del webhook debe procesarse.
+
+    Ignora mensajes sin remitente (enviados por el negocio) y tipos
+    de mensaje no soportados.
+    """
+    # Si el mensaje tiene el campo "from", es del usuario
+    # Los mensajes del negocio no tienen este campo o tienen estructura diferente
+    return bool(message.sender) and message.type in VALID_MESSAGE_TYPES
+
+
+def should_process_webhook(payload: WhatsAppPayload) -> bool:
     """
     Determina si el webhook debe procesarse o ignorarse.
 
@@ -221,98 +351,260 @@ def should_process_webhook(raw_data: dict) -> bool:
     - Mensajes enviados por el negocio
     - Webhooks sin mensajes
 
+    Recorre todos los entry / changes / messages: basta con que un
+    mensaje sea válido para procesar el webhook.
+
     Args:
-        raw_data: Payload completo del webhook
+        payload: Webhook ya decodificado
 
     Returns:
         True si debe procesarse, False si debe ignorarse
     """
-    try:
-        entry = raw_data.get("entry", [])
-        if not entry:
-            logger.info("⏭️ Webhook ignorado: No hay entry")
-            return False
-
-        changes = entry[0].get("changes", [])
-        if not changes:
-            logger.info("⏭️ Webhook ignorado: No hay changes")
-            return False
-
-        value = changes[0].get("value", {})
-
-        # 1. Verificar si es una notificación de estado
-        statuses = value.get("statuses", [])
-        if statuses:
-            status_info = statuses[0]
-            status_type = status_info.get("status", "unknown")
-            recipient = status_info.get("recipient_id", "unknown")
-            logger.info(
-                f"⏭️ Notificación de estado ignorada: {status_type} para {recipient}"
-            )
-            return False
-
-        # 2. Verificar si hay mensajes
-        messages = value.get("messages", [])
-        if not messages:
-            logger.info("⏭️ Webhook ignorado: No hay messages")
-            return False
-
-        # 3. Verificar que el mensaje sea del usuario (no del negocio)
-        message = messages[0]
-        message_from = message.get("from", "")
-
-        # Si el mensaje tiene el campo "from", es del usuario
-        # Los mensajes del negocio no tienen este campo o tienen estructura diferente
-        if not message_from:
-            logger.info("⏭️ Webhook ignorado: Mensaje sin remitente válido")
-            return False
-
-        # 4. Verificar tipos de mensaje válidos
-        message_type = message.get("type", "")
-        valid_types = [
-            "text",
-            "audio",
-            "image",
-            "video",
-            "document",
-            "button",
-            "interactive",
-        ]
+    if not payload.has_entries:
+        logger.info("⏭️ Webhook ignorado: No hay entry")
+        return False
 
-        if message_type not in valid_types:
+    valid_count = 0
+    for change in payload.changes:
+        # 1. Notificaciones de estado
+        for status_info in change.statuses:
             logger.info(
-                f"⏭️ Webhook ignorado: Tipo de mensaje no válido: {message_type}"
+                f"⏭️ Notificación de estado ignorada: {status_info.status} para {status_info.recipient_id}"
             )
-            return False
 
-        logger.info(
-            f"✅ Webhook válido: Mensaje tipo '{message_type}' de {message_from}"
-        )
-        return True
+        # 2. Mensajes del usuario con tipo válido
+        for message in change.messages:
+            if is_processable_message(message):
+                valid_count += 1
+            elif not message.sender:
+                logger.info("⏭️ Mensaje ignorado: Mensaje sin remitente válido")
+            else:
+                logger.info(
+                    f"⏭️ Mensaje ignorado: Tipo de mensaje no válido: {message.type}"
+                )
 
-    except Exception as e:
-        logger.error(f"❌ Error al validar webhook: {e}")
+    if not valid_count:
+        logger.info("⏭️ Webhook ignorado: No hay messages válidos")
         return False
 
+    logger.info(f"✅ Webhook válido: {valid_count} mensaje(s) a procesar")
+    return True
+
+
+# ==========================================================
+# MÉTRICAS
+# ==========================================================
+@router.get("/webhook/metrics")
+async def webhook_metrics():
+    return {
+        "queue": WEBHOOK_QUEUE.stats(),
+        "admission": ADMISSION.stats(),
+        "dedupe": WAMID_STORE.stats(),
+        "sessions": SESSION_EXECUTOR.stats(),
+        "tenants": {
+            "agent": AGENT_SCHEDULER.stats(),
+            "sheets": SHEETS_SCHEDULER.stats(),
+        },
+        "coalescer": MESSAGE_COALESCER.stats(),
+        "supersede": get_supersede_stats(),
+        "signature": dict(SIGNATURE_STATS),
+        "http": HTTP_CLIENTS.stats(),
+        "outbound": OUTBOUND.stats(),
+        "typing": TYPING_KEEPALIVE.stats(),
+        "web_delivery": WEB_DELIVERY.stats(),
+        "media": MEDIA_PROCESSOR.stats(),
+        "media_upload": MEDIA_UPLOADER.stats(),
+        "tenant_registry": TENANT_REGISTRY.stats(),
+        "lead_index": LEAD_INDEX.stats(),
+    }
+
 
 # ==========================================================
 # WEBHOOK WHATSAPP
 # ==========================================================
 @router.post("/webhook")
 async def receive_data(request: Request):
-    raw_data = await parse_request_json(request)
+    payload = await parse_whatsapp_payload(request)
 
     # ✅ FILTRAR NOTIFICACIONES DE ESTADO PRIMERO
-    if not should_process_webhook(raw_data):
+    if not should_process_webhook(payload):
         return {"status": "ignored", "reason": "notification or invalid message"}
 
-    phone_id = (
-        raw_data.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("metadata", {})
-        .get("phone_number_id")
+    # 📦 FAN-OUT: una unidad por mensaje (cada una con su tenant y contacto)
+    units = dispatch_messages(payload, accept=is_processable_message)
+    if not units:
+        return {"status": "no_message"}
+
+    # ⛔ Negocios desconocidos o desactivados: fuera antes de tocar Google
+    units = drop_rejected_units(units)
+    if not units:
+        return {"status": "rejected"}
+
+    # 🔁 IDEMPOTENCIA: descartar reintentos de Meta antes de cualquier trabajo caro
+    units = drop_duplicate_units(units)
+    if not units:
+        return {"status": "duplicate"}
+
+    # ⚡ MODO ACK RÁPIDO: encolar y responder 200 de inmediato
+    if config.webhook_async_mode:
+        rejected = [
+            u for u in units if not WEBHOOK_QUEUE.submit(process_whatsapp_unit, u)
+        ]
+        for unit in rejected:
+            # Cola llena → se confirma igual y se avisa al usuario que estamos ocupados
+            ADMISSION.record_shed()
+            task = asyncio.create_task(shed_whatsapp_unit(unit))
+            SHED_TASKS.add(task)
+            task.add_done_callback(SHED_TASKS.discard)
+        return {
+            "status": "queued",
+            "messages": len(units) - len(rejected),
+            "shed": len(rejected),
+        }
+
+    return await process_whatsapp_units(units)
+
+
+def drop_rejected_units(units: list[dict]) -> list[dict]:
+    """Filtra las unidades de phone_number_ids desconocidos o desactivados."""
+    accepted = []
+    for unit in units:
+        phone_id = unit.get("phone_number_id")
+        reason = TENANT_REGISTRY.rejection_reason(phone_id)
+        if reason:
+            logger.warning(
+                f"⛔ Mensaje {unit.get('wamid')} rechazado: negocio {reason} "
+                f"(Phone ID: {phone_id})"
+            )
+            continue
+        accepted.append(unit)
+    return accepted
+
+
+def drop_duplicate_units(units: list[dict]) -> list[dict]:
+    """Filtra las unidades cuyo wamid ya fue procesado (reintentos de Meta)."""
+    fresh = []
+    for unit in units:
+        wamid = unit.get("wamid")
+        if WAMID_STORE.check_and_mark(wamid):
+            logger.info(f"🔁 Mensaje duplicado ignorado (wamid={wamid})")
+            continue
+        fresh.append(unit)
+    return fresh
+
+
+async def process_whatsapp_units(units: list[dict]) -> dict:
+    """
+    Procesa en paralelo todas las unidades de un mismo webhook, de modo
+    que una entrega agrupada cueste la latencia de un solo mensaje.
+    """
+    if len(units) == 1:
+        return await process_whatsapp_unit(units[0])
+
+    logger.info(f"📦 Webhook agrupado: procesando {len(units)} mensajes en paralelo")
+    results = await asyncio.gather(
+        *(process_whatsapp_unit(unit) for unit in units), return_exceptions=True
     )
+
+    summary = []
+    for unit, result in zip(units, results):
+        if isinstance(result, Exception):
+            logger.error(f"❌ Error procesando mensaje {unit.get('wamid')}: {result}")
+            result = {"status": "error", "message": str(result)}
+        summary.append({"wamid": unit.get("wamid"), **result})
+
+    return {"status": "ok", "results": summary}
+
+
+async def process_whatsapp_unit(unit: dict) -> dict:
+    """
+    Pipeline completo para una unidad de mensaje de WhatsApp:
+    credenciales → Lead → instrucciones → agente → envío.
+    Se ejecuta inline o desde los workers de WEBHOOK_QUEUE. La ventana de
+    coalescencia corre fuera del control de admisión: un mensaje absorbido
+    por la ráfaga no ocupa un turno. Si falla, el wamid se libera en ambos
+    modos para que el reintento de Meta vuelva a procesarlo.
+    """
+    try:
+        context = await prepare_whatsapp_unit(unit)
+        if "status" in context:
+            return context
+
+        # 🧺 Combinar ráfagas de mensajes seguidos en una sola corrida del agente
+        burst = await MESSAGE_COALESCER.submit(
+            context["session_key"],
+            {"message": context["message"], "wamid": context["reply_to_id"]},
+        )
+        if burst is None:
+            return {"status": "coalesced"}
+        if len(burst) > 1:
+            context["message"] = combine_burst_messages(burst)
+            context["reply_to_id"] = burst[-1]["wamid"]
+
+        async with ADMISSION.admit():
+            return await run_whatsapp_unit(unit, context)
+    except Overloaded:
+        return await shed_whatsapp_unit(unit)
+    except Exception:
+        WAMID_STORE.release(unit.get("wamid"))
+        raise
+
+
+# Avisos de "ocupado" en curso (referencia fuerte hasta que terminen)
+SHED_TASKS: set[asyncio.Task] = set()
+
+
+async def drain_background_tasks(timeout: float):
+    """
+    Al apagar: espera (hasta `timeout`) los avisos de saturación y los
+    envíos de adjuntos en curso y cancela los que queden.
+    """
+    tasks = SHED_TASKS | ATTACHMENT_TASKS
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    if pending:
+        logger.warning(
+            f"⚠️ {len(pending)} envío(s) en segundo plano cancelados al apagar"
+        )
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def shed_whatsapp_unit(unit: dict) -> dict:
+    """
+    Pipeline saturado: no se toca Sheets ni OpenAI. Si el negocio está en
+    el registro en memoria se envía un aviso corto de "ocupado".
+    """
+    phone_id = unit.get("phone_number_id")
+    client = TENANT_REGISTRY.get(phone_id) if phone_id else None
+
+    logger.warning(
+        f"🚦 Mensaje {unit.get('wamid')} descartado por saturación (Phone ID: {phone_id})"
+    )
+
+    if client and validate_business_status(client, phone_id):
+        await send_whatsapp_message(
+            to=normalize_whatsapp_number(unit.get("from")),
+            body=config.admission_busy_message,
+            reply_to_id=unit.get("wamid"),
+            token=safe_get(client, "Access Token"),
+            phone_number_id=safe_get(client, "Phone Number ID"),
+        )
+
+    return {"status": "busy"}
+
+
+async def prepare_whatsapp_unit(unit: dict) -> dict:
+    """
+    Valida el negocio, normaliza el número y convierte el media en texto.
+
+    Returns:
+        El contexto para run_whatsapp_unit, o un resultado con "status" si
+        el mensaje no sigue
+    """
+    phone_id = unit.get("phone_number_id")
     client = await get_business(phone_id)
 
     # ✅ VALIDAR STATUS ANTES DE CONTINUAR
@@ -337,13 +629,9 @@ async def receive_data(request: Request):
         )
         return {"status": "error", "message": "Credenciales incompletas"}
 
-    transformed = dispatch_message(raw_data)
-    if not transformed:
-        return {"status": "no_message"}
-
-    message = transformed.get("message") or transformed.get("text")
-    from_number = transformed.get("from")
-    reply_to_id = transformed.get("wamid")
+    message = unit.get("message") or unit.get("text")
+    from_number = unit.get("from")
+    reply_to_id = unit.get("wamid")
 
     logger.info(f"📥 Número original recibido: {from_number}")
 
@@ -352,98 +640,193 @@ async def receive_data(request: Request):
 
     logger.info(f"📥 Número normalizado: {from_number}")
 
+    # ⌨️ Lectura + "escribiendo..." al recibir (coalescido por sesión)
+    typing_key = f"wa:{from_number}"
     if reply_to_id:
-        asyncio.create_task(
-            send_typing_indicator(
+        TYPING_KEEPALIVE.touch(
+            typing_key,
+            partial(
+                OUTBOUND.send_indicator,
                 message_id=reply_to_id,
                 token=whatsapp_token,
                 phone_number_id=phone_number_id,
-            )
+                recipient=from_number,
+            ),
         )
 
-    user_info = extract_whatsapp_user_info(raw_data)
-
-    media_id = transformed.get("media_id")
-    msg_type = transformed.get("type")
-    if msg_type == "audio" and media_id:
-        try:
-            media_url = get_media_url(media_id, whatsapp_token)
-            audio_bytes = download_media(media_url, whatsapp_token)
-            transcript = transcribe_audio(audio_bytes)
-            message = transcript
-        except Exception as e:
-            logger.error(f"❌ Error procesando audio: {e}")
-            message = "No pude procesar tu audio."
+    if unit.get("media_id") and unit.get("type") in MEDIA_TYPES:
+        # Transcripción / visión: trabajo caro, bajo el control de admisión
+        async with ADMISSION.admit():
+            message = await media_to_message(unit, whatsapp_token)
 
     if not message:
         return {"status": "no_message"}
 
-    user_defaults = {
-        "Usuario": user_info.get("usuario", from_number),
-        "Canal": "whatsapp",
+    session_key = from_number
+
+    # ✂️ Un mensaje nuevo deja obsoleta la corrida en curso de la sesión
+    supersede_active_run(session_key)
+
+    return {
+        "client": client,
+        "whatsapp_token": whatsapp_token,
+        "phone_number_id": phone_number_id,
+        "sheet_crm_id": sheet_crm_id,
+        "role_id": role_id,
+        "from_number": from_number,
+        "message": message,
+        "reply_to_id": reply_to_id,
+        "typing_key": typing_key,
+        "session_key": session_key,
     }
-    user_data = await get_or_create_user(
-        from_number, sheet_crm_id, defaults=user_defaults
+
+
+async def run_whatsapp_unit(unit: dict, context: dict) -> dict:
+    """Lead → instrucciones → agente → envío, para un mensaje (o ráfaga)."""
+    client = context["client"]
+    whatsapp_token = context["whatsapp_token"]
+    phone_number_id = context["phone_number_id"]
+    sheet_crm_id = context["sheet_crm_id"]
+    role_id = context["role_id"]
+    from_number = context["from_number"]
+    message = context["message"]
+    reply_to_id = context["reply_to_id"]
+    typing_key = context["typing_key"]
+    session_key = context["session_key"]
+
+    # ⌨️ Indicador sostenido durante la corrida (se refresca antes de caducar)
+    typing_indicator = partial(
+        OUTBOUND.send_indicator,
+        message_id=reply_to_id,
+        token=whatsapp_token,
+        phone_number_id=phone_number_id,
+        recipient=from_number,
     )
-    if not user_data:
-        user_data = {}
 
-    instructions = await load_instructions_for_user(role_id, client)
-    session_key = from_number
+    # 📬 Un mensaje a la vez por sesión (orden de llegada), sesiones en paralelo
+    async with SESSION_EXECUTOR.hold(session_key):
+        # 🏢 Turnos justos por negocio para Sheets y para el agente
+        limits = tenant_limits(client)
+
+        async with TYPING_KEEPALIVE.keep(typing_key, typing_indicator):
+            async with SHEETS_SCHEDULER.slot(phone_number_id, **limits):
+                user_defaults = {
+                    "Usuario": unit.get("nombre") or "",
+                    "Canal": "whatsapp",
+                }
+                user_data = await get_or_create_user(
+                    from_number, sheet_crm_id, defaults=user_defaults
+                )
+                if not user_data:
+                    user_data = {}
 
-    logger.info(f"🤖 Procesando mensaje de {from_number}: {message[:50]}...")
+                instructions = await load_instructions_for_user(role_id, client)
 
-    reply_dict = await agent_service(
-        user_message=message,
-        system_instructions=instructions,
-        session_key=session_key,
-        user_data=user_data,
-        sheet_crm_id=sheet_crm_id,
-    )
+            logger.info(f"🤖 Procesando mensaje de {from_number}: {message[:50]}...")
+
+            async with AGENT_SCHEDULER.slot(phone_number_id, **limits):
+                reply_dict = await agent_service(
+                    user_message=message,
+                    system_instructions=instructions,
+                    session_key=session_key,
+                    user_data=user_data,
+                    sheet_crm_id=sheet_crm_id,
+                )
+
+        if reply_dict.get("superseded"):
+            logger.info(
+                f"✂️ Respuesta descartada para {from_number}: mensaje más nuevo"
+            )
+            return {"status": "superseded"}
 
-    reply = reply_dict.get("final_output", "No pude generar respuesta.")
+        reply = reply_dict.get("final_output", "No pude generar respuesta.")
 
-    logger.info(f"💬 Respuesta generada para {from_number}: {reply[:50]}...")
+        logger.info(f"💬 Respuesta generada para {from_number}: {reply[:50]}...")
 
-    await send_whatsapp_message(
-        to=from_number,
-        body=reply,
-        reply_to_id=reply_to_id,
-        token=whatsapp_token,
-        phone_number_id=phone_number_id,
-    )
+        await send_whatsapp_message(
+            to=from_number,
+            body=reply,
+            reply_to_id=reply_to_id,
+            token=whatsapp_token,
+            phone_number_id=phone_number_id,
+        )
+
+        # 📎 Adjuntos de las tools: en segundo plano, después del texto
+        attachments = reply_dict.get("attachments")
+        if attachments:
+            task = asyncio.create_task(
+                send_whatsapp_attachments(
+                    to=from_number,
+                    attachments=attachments,
+                    token=whatsapp_token,
+                    phone_number_id=phone_number_id,
+                )
+            )
+            ATTACHMENT_TASKS.add(task)
+            task.add_done_callback(ATTACHMENT_TASKS.discard)
 
     return {"status": "ok", "user_data": user_data}
 
 
+async def reject_disabled_web(
+    phone_number_id: str, session_id: str, webhook_response_url: str
+) -> dict:
+    logger.warning(
+        f"⛔ Mensaje web ignorado - Negocio desactivado (Phone ID: {phone_number_id})"
+    )
+
+    # Opcionalmente, enviar mensaje al usuario informando que el servicio está desactivado
+    if webhook_response_url:
+        await send_web_message(
+            session_id=session_id,
+            message="Lo sentimos, el servicio está temporalmente desactivado. Por favor, intenta más tarde.",
+            webhook_url=webhook_response_url,
+            metadata={"status": "disabled"},
+        )
+
+    return {
+        "status": "disabled",
+        "message": "El agente está desactivado para este negocio",
+        "phone_number_id": phone_number_id,
+    }
+
+
 # ==========================================================
 # WEBHOOK WEB - CON PHONE_ID EN LA URL
 # ==========================================================
 @router.post("/webhook/web/{phone_number_id}")
 async def receive_web_data(request: Request, phone_number_id: str):
+    admitted_at = None
+
+    # ⛔ Phone ID desconocido: se rechaza sin leer el cuerpo ni tocar Google
+    rejection = TENANT_REGISTRY.rejection_reason(phone_number_id)
+    if rejection == "unknown":
+        logger.warning(
+            f"⛔ Mensaje web rechazado: Phone ID {phone_number_id} desconocido"
+        )
+        return {
+            "status": "error",
+            "message": f"Phone ID {phone_number_id} no encontrado",
+        }
+
     try:
         raw_body = await request.body()
-        body_str = raw_body.decode("utf-8", errors="ignore")
 
         logger.info(
-            f"\n===== 🌐 WEBHOOK-WEB RECIBIDO (Phone ID: {phone_number_id}) ====="
+            f"🌐 WEBHOOK-WEB RECIBIDO (Phone ID: {phone_number_id}, {len(raw_body)} bytes)"
         )
 
         try:
-            payload = json.loads(body_str)
-        except json.JSONDecodeError as e:
+            payload = decode_web_payload(raw_body)
+        except PayloadError as e:
             logger.error(f"❌ JSON inválido: {e}")
-            raise HTTPException(status_code=400, detail=f"JSON inválido: {str(e)}")
+            raise HTTPException(status_code=400, detail=str(e))
 
-        logger.info(json.dumps(payload, indent=2, ensure_ascii=False))
-        logger.info("===== 🌐 FIN WEBHOOK-WEB ============\n")
+        message = payload.message
+        user_name = payload.user_name
+        webhook_response_url = payload.webhook_url
 
-        user_phone = payload.get("userPhone") or payload.get("session_id")
-        message = payload.get("message") or payload.get("text")
-        user_name = payload.get("user_name") or payload.get("userName", "Usuario Web")
-        webhook_response_url = payload.get("webhook_url") or payload.get("webhookUrl")
-
-        session_id = user_phone
+        session_id = payload.session_id
 
         logger.info(
             f"📥 Datos: session_id={session_id}, phone_id={phone_number_id}, user={user_name}"
@@ -457,6 +840,22 @@ async def receive_web_data(request: Request, phone_number_id: str):
             logger.error("❌ Falta message")
             return {"status": "error", "message": "Falta message"}
 
+        if rejection == "disabled":
+            return await reject_disabled_web(
+                phone_number_id, session_id, webhook_response_url
+            )
+
+        # 🚦 Control de admisión: saturado → 429 con Retry-After
+        try:
+            admitted_at = await ADMISSION.acquire()
+        except Overloaded as e:
+            logger.warning(f"🚦 Mensaje web de {session_id} rechazado (429)")
+            raise HTTPException(
+                status_code=429,
+                detail="Servidor ocupado, intenta más tarde",
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
         logger.info(f"🔍 Buscando negocio con Phone ID: {phone_number_id}")
         client = await get_business(phone_number_id)
 
@@ -469,25 +868,10 @@ async def receive_web_data(request: Request, phone_number_id: str):
 
         # ✅ VALIDAR STATUS ANTES DE CONTINUAR
         if not validate_business_status(client, phone_number_id):
-            logger.warning(
-                f"⛔ Mensaje web ignorado - Negocio desactivado (Phone ID: {phone_number_id})"
+            return await reject_disabled_web(
+                phone_number_id, session_id, webhook_response_url
             )
 
-            # Opcionalmente, enviar mensaje al usuario informando que el servicio está desactivado
-            if webhook_response_url:
-                await send_web_message(
-                    session_id=session_id,
-                    message="Lo sentimos, el servicio está temporalmente desactivado. Por favor, intenta más tarde.",
-                    webhook_url=webhook_response_url,
-                    metadata={"status": "disabled"},
-                )
-
-            return {
-                "status": "disabled",
-                "message": "El agente está desactivado para este negocio",
-                "phone_number_id": phone_number_id,
-            }
-
         sheet_crm_id = safe_get(client, "Sheet CRM ID")
         role_id = safe_get(client, "Role ID")
         business_name = safe_get(client, "Business Name", "Negocio Web")
@@ -503,74 +887,100 @@ async def receive_web_data(request: Request, phone_number_id: str):
                 "message": "Configuración incompleta: falta role_id",
             }
 
+        # ⌨️ Indicador al recibir y sostenido durante la corrida
+        typing_key = f"web:{session_id}"
+        typing_indicator = None
         if webhook_response_url:
             logger.info(f"⌨️ Enviando typing indicator a: {webhook_response_url}")
-            asyncio.create_task(
-                send_web_typing_indicator(
-                    session_id=session_id, webhook_url=webhook_response_url
-                )
-            )
-
-        user_defaults = {
-            "Nombre": user_name,
-            "Usuario": user_name,
-            "Canal": "web",
-            "Negocio": business_name,
-        }
-
-        logger.info(
-            f"👤 Obteniendo/creando usuario: {session_id} (Nombre: {user_name})"
-        )
-        user_data = await get_or_create_user(
-            session_id, sheet_crm_id, defaults=user_defaults
-        )
-        if not user_data:
-            user_data = {}
-            logger.warning(f"⚠️ Usuario {session_id}: No se pudo crear/obtener datos")
-        else:
-            logger.info(
-                f"✅ Usuario obtenido/creado: {user_data.get('Usuario', 'Sin nombre')}"
-            )
-
-        logger.info(f"📋 Cargando instrucciones para role_id: {role_id}")
-        instructions = await load_instructions_for_user(role_id, client)
-
-        logger.info(f"🤖 Procesando mensaje con agent_service...")
-        reply_dict = await agent_service(
-            user_message=message,
-            system_instructions=instructions,
-            session_key=session_id,
-            user_data=user_data,
-            sheet_crm_id=sheet_crm_id,
-        )
-
-        reply = reply_dict.get("final_output", "No pude generar respuesta.")
-        logger.info(f"💬 Respuesta generada: {reply[:100]}...")
-
-        success = False
-        if webhook_response_url:
-            logger.info(f"📤 Enviando respuesta a: {webhook_response_url}")
-            success = await send_web_message(
+            typing_indicator = partial(
+                send_web_typing_indicator,
                 session_id=session_id,
-                message=reply,
                 webhook_url=webhook_response_url,
-                metadata={
-                    "timestamp": payload.get("timestamp"),
-                    "user_name": user_name,
-                    "business_name": business_name,
-                    "phone_number_id": phone_number_id,
-                },
             )
+            TYPING_KEEPALIVE.touch(typing_key, typing_indicator)
+
+        # ✂️ Un mensaje nuevo deja obsoleta la corrida en curso de la sesión
+        supersede_active_run(session_id)
+
+        # 📬 Un mensaje a la vez por sesión (orden de llegada), sesiones en paralelo
+        async with SESSION_EXECUTOR.hold(session_id):
+            # 🏢 Turnos justos por negocio para Sheets y para el agente
+            limits = tenant_limits(client)
+
+            async with TYPING_KEEPALIVE.keep(typing_key, typing_indicator):
+                async with SHEETS_SCHEDULER.slot(phone_number_id, **limits):
+                    user_defaults = {
+                        "Nombre": user_name,
+                        "Usuario": user_name,
+                        "Canal": "web",
+                        "Negocio": business_name,
+                    }
+
+                    logger.info(
+                        f"👤 Obteniendo/creando usuario: {session_id} (Nombre: {user_name})"
+                    )
+                    user_data = await get_or_create_user(
+                        session_id, sheet_crm_id, defaults=user_defaults
+                    )
+                    if not user_data:
+                        user_data = {}
+                        logger.warning(
+                            f"⚠️ Usuario {session_id}: No se pudo crear/obtener datos"
+                        )
+                    else:
+                        logger.info(
+                            f"✅ Usuario obtenido/creado: {user_data.get('Usuario', 'Sin nombre')}"
+                        )
+
+                    logger.info(f"📋 Cargando instrucciones para role_id: {role_id}")
+                    instructions = await load_instructions_for_user(role_id, client)
+
+                logger.info(f"🤖 Procesando mensaje con agent_service...")
+                async with AGENT_SCHEDULER.slot(phone_number_id, **limits):
+                    reply_dict = await agent_service(
+                        user_message=message,
+                        system_instructions=instructions,
+                        session_key=session_id,
+                        user_data=user_data,
+                        sheet_crm_id=sheet_crm_id,
+                    )
+
+            if reply_dict.get("superseded"):
+                logger.info(f"✂️ Respuesta web descartada para {session_id}")
+                return {
+                    "status": "superseded",
+                    "session_id": session_id,
+                    "phone_number_id": phone_number_id,
+                }
 
-            if success:
-                logger.info(
-                    f"✅ Respuesta web enviada exitosamente a sesión: {session_id}"
+            reply = reply_dict.get("final_output", "No pude generar respuesta.")
+            logger.info(f"💬 Respuesta generada: {reply[:100]}...")
+
+            success = False
+            if webhook_response_url:
+                logger.info(f"📤 Enviando respuesta a: {webhook_response_url}")
+                success = await send_web_message(
+                    session_id=session_id,
+                    message=reply,
+                    webhook_url=webhook_response_url,
+                    attachments=reply_dict.get("attachments"),
+                    metadata={
+                        "timestamp": payload.timestamp,
+                        "user_name": user_name,
+                        "business_name": business_name,
+                        "phone_number_id": phone_number_id,
+                    },
                 )
+
+                if success:
+                    logger.info(
+                        f"✅ Respuesta web enviada exitosamente a sesión: {session_id}"
+                    )
+                else:
+                    logger.error(f"❌ Error enviando respuesta web a: {session_id}")
             else:
-                logger.error(f"❌ Error enviando respuesta web a: {session_id}")
-        else:
-            logger.info(f"📋 Respuesta generada (sin webhook): {reply[:100]}...")
-            success = True
+                logger.info(f"📋 Respuesta generada (sin webhook): {reply[:100]}...")
+                success = True
 
         return {
             "status": "ok",
@@ -580,6 +990,7 @@ async def receive_web_data(request: Request, phone_number_id: str):
             "user_data": user_data,
             "message_sent": success,
             "reply": reply,
+            "attachments": reply_dict.get("attachments") or [],
         }
 
     except HTTPException:
@@ -587,3 +998,6 @@ async def receive_web_data(request: Request, phone_number_id: str):
     except Exception as e:
         logger.error(f"❌ Error procesando mensaje web: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    finally:
+        if admitted_at is not None:
+            ADMISSION.release(admitted_at)
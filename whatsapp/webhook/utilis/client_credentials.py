@@ -6,10 +6,8 @@ from oauth2client.service_account import ServiceAccountCredentials
 
 from whatsapp.config import config
 
-# ==========================================================
-# Caché de credenciales con hash para detectar cambios
-# ==========================================================
-CREDENTIALS_CACHE = {}  # {phone_id: {"data": dict, "hash": str, "source": str}}
+# Hoja autorizada reutilizada entre refrescos del registro de negocios
+_SHEET = None
 
 
 def load_sheet():
@@ -42,38 +40,17 @@ def compute_row_hash(row: dict) -> str:
     return hashlib.md5(row_str.encode("utf-8")).hexdigest()
 
 
-def get_client_credentials(phone_id: str) -> dict:
+def fetch_credentials_rows() -> list[dict]:
     """
-    Obtiene las credenciales de un cliente según su phone_number_id
-    usando caché basado en hash de la fila. Siempre devuelve dict.
+    Descarga todas las filas de Credentials. Síncrona (red): la llama el
+    registro de negocios en un hilo, nunca el camino caliente.
     """
-    if not phone_id:
-        return {}
-
+    global _SHEET
+    if _SHEET is None:
+        _SHEET = load_sheet()
     try:
-        sheet = load_sheet()
-        rows = sheet.get_all_records()
-        if not rows:
-            return {}
-
-        for row in rows:
-            row_id = str(row.get("Phone Number ID") or "").strip()
-            if row_id == str(phone_id).strip():
-                row_hash = compute_row_hash(row)
-                cached = CREDENTIALS_CACHE.get(phone_id)
-
-                if cached and cached["hash"] == row_hash:
-                    return cached["data"]
-
-                # Cache nuevo o actualizado
-                CREDENTIALS_CACHE[phone_id] = {
-                    "data": row,
-                    "hash": row_hash,
-                    "source": "sheet",
-                }
-                return row
-
-        return {}
-
+        return _SHEET.get_all_records()
     except Exception:
-        return {}
+        # Token vencido o hoja movida: reautorizar una vez
+        _SHEET = load_sheet()
+        return _SHEET.get_all_records()
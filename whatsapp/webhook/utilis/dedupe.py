@@ -0,0 +1,170 @@
+"""
+Almacén de idempotencia por wamid.
+
+Meta reintenta los webhooks; cada reintento volvería a pagar las lecturas
+de Sheets, el guardrail, el agente y el envío. Este módulo recuerda los
+wamid ya procesados durante la ventana de reintentos de Meta:
+
+- Nivel 1: memoria (LRU + TTL, acotado a `max_entries`)
+- Nivel 2: SQLite opcional, sobrevive a reinicios del contenedor
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+
+class WamidDedupeStore:
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_entries: int,
+        sqlite_path: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.sqlite_path = sqlite_path or None
+
+        self._memory: OrderedDict[str, float] = OrderedDict()  # wamid → expira
+        self._db: sqlite3.Connection | None = None
+        self._writes_since_purge = 0
+
+        # Métricas
+        self.checked = 0
+        self.duplicates_avoided = 0
+        self.memory_hits = 0
+        self.sqlite_hits = 0
+
+    # ------------------------------------------------------
+    # SQLite (opcional)
+    # ------------------------------------------------------
+    def _get_db(self) -> sqlite3.Connection | None:
+        if not self.sqlite_path:
+            return None
+
+        if self._db is None:
+            directory = os.path.dirname(self.sqlite_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS processed_wamids ("
+                "wamid TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"🗄️ Dedupe SQLite listo en {self.sqlite_path}")
+        return self._db
+
+    def _sqlite_mark(self, wamid: str, now: float) -> bool:
+        """Inserta el wamid en SQLite. Devuelve True si ya existía y sigue vigente."""
+        db = self._get_db()
+        if db is None:
+            return False
+
+        row = db.execute(
+            "SELECT expires_at FROM processed_wamids WHERE wamid = ?", (wamid,)
+        ).fetchone()
+        if row and row[0] > now:
+            return True
+
+        db.execute(
+            "INSERT OR REPLACE INTO processed_wamids (wamid, expires_at) VALUES (?, ?)",
+            (wamid, now + self.ttl_seconds),
+        )
+        self._writes_since_purge += 1
+        if self._writes_since_purge >= 500:
+            db.execute("DELETE FROM processed_wamids WHERE expires_at <= ?", (now,))
+            self._writes_since_purge = 0
+        db.commit()
+        return False
+
+    # ------------------------------------------------------
+    # Memoria (LRU + TTL)
+    # ------------------------------------------------------
+    def _evict(self, now: float):
+        # Las entradas se insertan en orden temporal con el mismo TTL:
+        # las expiradas siempre están al principio.
+        while self._memory:
+            wamid, expires_at = next(iter(self._memory.items()))
+            if expires_at > now and len(self._memory) <= self.max_entries:
+                break
+            self._memory.popitem(last=False)
+
+    # ------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------
+    def check_and_mark(self, wamid: str) -> bool:
+        """
+        Marca el wamid como procesado.
+
+        Returns:
+            True si el wamid ya se había visto (duplicado), False si es nuevo.
+        """
+        if not wamid:
+            return False
+
+        self.checked += 1
+        now = time.time()
+        self._evict(now)
+
+        expires_at = self._memory.get(wamid)
+        if expires_at and expires_at > now:
+            self._memory.move_to_end(wamid)
+            self.memory_hits += 1
+            self.duplicates_avoided += 1
+            return True
+
+        try:
+            duplicate = self._sqlite_mark(wamid, now)
+        except sqlite3.Error as e:
+            logger.error(f"❌ Error en dedupe SQLite: {e}")
+            duplicate = False
+
+        self._memory[wamid] = now + self.ttl_seconds
+        self._memory.move_to_end(wamid)
+
+        if duplicate:
+            self.sqlite_hits += 1
+            self.duplicates_avoided += 1
+        return duplicate
+
+    def release(self, wamid: str):
+        """Olvida un wamid (p. ej. si falló su procesamiento y debe reintentarse)."""
+        if not wamid:
+            return
+
+        self._memory.pop(wamid, None)
+        db = self._get_db()
+        if db is not None:
+            try:
+                db.execute("DELETE FROM processed_wamids WHERE wamid = ?", (wamid,))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"❌ Error liberando wamid en SQLite: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "duplicates_avoided": self.duplicates_avoided,
+            "memory_hits": self.memory_hits,
+            "sqlite_hits": self.sqlite_hits,
+            "memory_entries": len(self._memory),
+            "sqlite_enabled": bool(self.sqlite_path),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+# Instancia global
+WAMID_STORE = WamidDedupeStore(
+    ttl_seconds=config.dedupe_ttl_seconds,
+    max_entries=config.dedupe_max_entries,
+    sqlite_path=config.dedupe_sqlite_path,
+)
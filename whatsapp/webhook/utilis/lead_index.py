@@ -0,0 +1,298 @@
+"""
+Índice en memoria de la hoja Lead, por spreadsheet.
+
+get_or_create_user llegaba a llamar load_user tres veces por mensaje y cada
+llamada reconstruía las credenciales, reautorizaba gspread y descargaba la
+hoja Lead completa para buscar el Telefono. Ahora cada spreadsheet tiene un
+índice teléfono → (fila, datos) que:
+
+    - se carga leyendo solo la columna Telefono (lectura por columnas de
+      gspread_helper); cada fila se trae por rango A1 la primera vez que
+      se pide y queda cacheada
+    - se actualiza write-through al crear o actualizar un lead
+    - vence a los LEAD_INDEX_TTL_SECONDS
+    - ante un teléfono que no está se relee la columna (alguien pudo
+      agregarlo a mano); si sigue sin estar, el usuario es nuevo de verdad
+
+Un usuario que vuelve no necesita ninguna lectura de Sheets. Las llamadas
+a gspread (síncronas) corren en un hilo; el cliente y las hojas abiertas
+se reutilizan.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+from whatsapp.agent.services.google_sheet.gspread_helper import (
+    appended_row,
+    get_rows,
+    invalidate_headers,
+    on_row_changed,
+    read_columns,
+)
+from whatsapp.config import config
+
+logger = logging.getLogger("whatsapp")
+
+PHONE_COLUMN = "Telefono"
+
+
+def normalize_number(number: str) -> str:
+    """Elimina todo excepto dígitos"""
+    if not number:
+        return ""
+    return "".join(filter(str.isdigit, str(number)))
+
+
+class _SheetIndex:
+    __slots__ = ("phones", "rows", "loaded_at")
+
+    def __init__(self, phones: list):
+        # teléfono → fila (start=2 porque la fila 1 son los encabezados)
+        self.phones: dict[str, int] = {}
+        for row_index, phone in enumerate(phones, start=2):
+            key = normalize_number(phone)
+            if key:
+                self.phones[key] = row_index
+        # Filas ya leídas: fila → datos
+        self.rows: dict[int, dict] = {}
+        self.loaded_at = time.monotonic()
+
+
+class LeadIndex:
+    def __init__(self, sheet_name: str, ttl_seconds: float, max_sheets: int):
+        self.sheet_name = sheet_name
+        self.ttl_seconds = ttl_seconds
+        self.max_sheets = max(1, max_sheets)
+
+        self._client: gspread.Client | None = None
+        self._worksheets: dict[str, gspread.Worksheet] = {}
+        self._indexes: OrderedDict[str, _SheetIndex] = OrderedDict()
+        self._locks: dict[str, asyncio.Lock] = {}
+
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.row_fetches = 0
+        self.writes = 0
+
+    # ------------------------------------------------------
+    # gspread (síncrono, siempre en un hilo)
+    # ------------------------------------------------------
+    def _get_client(self) -> gspread.Client:
+        if self._client is None:
+            scope = ["https://www.googleapis.com/auth/spreadsheets"]
+            creds = ServiceAccountCredentials.from_json_keyfile_name(
+                config.get_service_account_file_path(), scope
+            )
+            self._client = gspread.authorize(creds)
+        return self._client
+
+    def worksheet(self, spreadsheet_id: str) -> gspread.Worksheet:
+        """Hoja Lead abierta (se reutiliza entre llamadas)."""
+        sheet = self._worksheets.get(spreadsheet_id)
+        if sheet is None:
+            sheet = self._get_client().open_by_key(spreadsheet_id)
+            sheet = sheet.worksheet(self.sheet_name)
+            self._worksheets[spreadsheet_id] = sheet
+        return sheet
+
+    def _forget_worksheet(self, spreadsheet_id: str):
+        # Ante un error se reabre (y reautoriza) en la próxima llamada
+        self._worksheets.pop(spreadsheet_id, None)
+        self._client = None
+
+    def _read_index(self, spreadsheet_id: str) -> _SheetIndex:
+        """Solo la columna Telefono."""
+        sheet = self.worksheet(spreadsheet_id)
+        phones = read_columns(sheet, [PHONE_COLUMN]).get(PHONE_COLUMN, [])
+        return _SheetIndex(phones)
+
+    def _read_row(self, spreadsheet_id: str, row_index: int) -> dict:
+        return get_rows(self.worksheet(spreadsheet_id), [row_index])[0]
+
+    async def _call(self, spreadsheet_id: str, func, *args):
+        try:
+            return await asyncio.to_thread(func, *args)
+        except Exception:
+            self._forget_worksheet(spreadsheet_id)
+            invalidate_headers(spreadsheet_id)
+            raise
+
+    # ------------------------------------------------------
+    # Índice
+    # ------------------------------------------------------
+    def _cached(self, spreadsheet_id: str) -> _SheetIndex | None:
+        index = self._indexes.get(spreadsheet_id)
+        if index is None:
+            return None
+        if time.monotonic() - index.loaded_at > self.ttl_seconds:
+            del self._indexes[spreadsheet_id]
+            return None
+        self._indexes.move_to_end(spreadsheet_id)
+        return index
+
+    def _store(self, spreadsheet_id: str, index: _SheetIndex):
+        self._indexes[spreadsheet_id] = index
+        self._indexes.move_to_end(spreadsheet_id)
+        while len(self._indexes) > self.max_sheets:
+            evicted, _ = self._indexes.popitem(last=False)
+            self._drop_lock(evicted)
+
+    def _drop_lock(self, spreadsheet_id: str):
+        # Los locks viven lo mismo que el índice: no crecen sin límite
+        lock = self._locks.get(spreadsheet_id)
+        if lock is not None and not lock.locked():
+            del self._locks[spreadsheet_id]
+
+    async def _index(self, spreadsheet_id: str, reload: bool = False) -> _SheetIndex:
+        lock = self._locks.setdefault(spreadsheet_id, asyncio.Lock())
+        try:
+            async with lock:
+                # Otra corrida pudo cargarlo mientras se esperaba el lock
+                index = None if reload else self._cached(spreadsheet_id)
+                if index is None:
+                    index = await self._call(
+                        spreadsheet_id, self._read_index, spreadsheet_id
+                    )
+                    if reload:
+                        self._keep_rows(self._indexes.get(spreadsheet_id), index)
+                    self._store(spreadsheet_id, index)
+                    self.loads += 1
+                return index
+        finally:
+            # Carga fallida (o índice ya desalojado): el lock no queda colgado
+            if spreadsheet_id not in self._indexes:
+                self._drop_lock(spreadsheet_id)
+
+    @staticmethod
+    def _keep_rows(old: _SheetIndex | None, new: _SheetIndex):
+        """Conserva las filas ya leídas que siguen en el mismo lugar."""
+        if old is None:
+            return
+        for row_index, row in old.rows.items():
+            if new.phones.get(normalize_number(row.get(PHONE_COLUMN))) == row_index:
+                new.rows[row_index] = row
+
+    def invalidate(self, spreadsheet_id: str):
+        self._indexes.pop(spreadsheet_id, None)
+        self._drop_lock(spreadsheet_id)
+        invalidate_headers(spreadsheet_id)
+
+    @staticmethod
+    def _user(row_index: int, row: dict) -> dict:
+        # Copia: quien la recibe no puede modificar el índice
+        return {**row, "_row_index": row_index}
+
+    async def lookup(
+        self, phone_number: str, spreadsheet_id: str, _retry: bool = True
+    ) -> dict | None:
+        """
+        Lead con ese teléfono (con "_row_index") o None si no existe.
+
+        Raises:
+            Exception: errores de gspread al leer la hoja
+        """
+        key = normalize_number(phone_number)
+        loads = self.loads
+        index = await self._index(spreadsheet_id)
+        row_index = index.phones.get(key)
+
+        if row_index is None and self.loads == loads:
+            # ¿Lo agregaron a mano? Se relee la columna Telefono
+            index = await self._index(spreadsheet_id, reload=True)
+            row_index = index.phones.get(key)
+        if row_index is None:
+            self.misses += 1
+            return None
+
+        row = index.rows.get(row_index)
+        if row is None:
+            self.row_fetches += 1
+            row = await self._call(
+                spreadsheet_id, self._read_row, spreadsheet_id, row_index
+            )
+            if normalize_number(row.get(PHONE_COLUMN)) != key and _retry:
+                # La hoja se movió (filas insertadas o borradas): recargar
+                self.invalidate(spreadsheet_id)
+                return await self.lookup(phone_number, spreadsheet_id, _retry=False)
+            index.rows[row_index] = row
+        elif self.loads == loads:
+            self.hits += 1
+
+        return self._user(row_index, row)
+
+    # ------------------------------------------------------
+    # Write-through
+    # ------------------------------------------------------
+    def record_created(self, spreadsheet_id: str, row: dict, response: dict = None):
+        """
+        Agrega al índice la fila recién creada con append_row (la fila sale
+        del updatedRange de la respuesta); sin ella se invalida el índice.
+        """
+        self.writes += 1
+        index = self._indexes.get(spreadsheet_id)
+        if index is None:
+            return
+
+        row_index = appended_row(response)
+        key = normalize_number(row.get(PHONE_COLUMN))
+        if not row_index or not key:
+            self.invalidate(spreadsheet_id)
+            return
+
+        index.phones[key] = row_index
+        index.rows[row_index] = row
+
+    def record_updated(
+        self, spreadsheet_id: str, phone_number: str, updates: dict
+    ) -> dict | None:
+        """Aplica `updates` a la fila cacheada. Returns: el lead actualizado."""
+        self.writes += 1
+        index = self._indexes.get(spreadsheet_id)
+        row_index = index.phones.get(normalize_number(phone_number)) if index else None
+        row = index.rows.get(row_index) if row_index else None
+        if row is None:
+            return None
+        row = {**row, **updates}
+        index.rows[row_index] = row
+        return self._user(row_index, row)
+
+    def forget_row(self, spreadsheet_id: str, row_index: int):
+        """Una fila cambió por otro camino (herramientas del CRM): se relee."""
+        index = self._indexes.get(spreadsheet_id)
+        if index is not None:
+            index.rows.pop(row_index, None)
+
+    def _row_changed(self, spreadsheet_id: str, sheet_name: str, row_index: int):
+        if sheet_name == self.sheet_name:
+            self.forget_row(spreadsheet_id, row_index)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sheets": len(self._indexes),
+            "leads": sum(len(index.phones) for index in self._indexes.values()),
+            "rows_cached": sum(len(index.rows) for index in self._indexes.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "loads": self.loads,
+            "row_fetches": self.row_fetches,
+            "writes": self.writes,
+        }
+
+
+# Instancia global
+LEAD_INDEX = LeadIndex(
+    sheet_name=config.sheet_name_lead,
+    ttl_seconds=config.lead_index_ttl_seconds,
+    max_sheets=config.lead_index_max_sheets,
+)
+# Escrituras de las herramientas del CRM sobre la hoja Lead
+on_row_changed(LEAD_INDEX._row_changed)
@@ -1,9 +1,39 @@
+"""
+Verificación de la firma X-Hub-Signature-256 de Meta.
+
+`WebhookSignatureMiddleware` es un middleware ASGI puro para POST /webhook:
+actualiza el HMAC por cada chunk mientras llega el cuerpo, corta con 413
+los cuerpos que superan el límite y con 403 las firmas inválidas, todo
+antes de decodificar JSON o tocar Sheets / OpenAI. El cuerpo verificado
+queda en `request.state.raw_body` para que la ruta no lo vuelva a leer.
+
+Sin APP_SECRET la verificación solo se omite en desarrollo: en producción
+todos los POST /webhook se rechazan con 403 hasta configurarlo.
+"""
+
 import hashlib
 import hmac
 
 from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from whatsapp.config import config, logger
+
+SIGNATURE_HEADER = b"x-hub-signature-256"
+
+# Métricas del middleware
+SIGNATURE_STATS = {
+    "verified": 0,
+    "rejected_missing": 0,
+    "rejected_invalid": 0,
+    "rejected_oversized": 0,
+    "rejected_unconfigured": 0,
+}
+
 
-from whatsapp.config import APP_SECRET, logger
+def _expected_signature(mac) -> bytes:
+    # En bytes: compare_digest lanza TypeError con str no ASCII
+    return b"sha256=" + mac.hexdigest().encode()
 
 
 def verify_signature(body: bytes, signature: str):
@@ -13,12 +43,127 @@ def verify_signature(body: bytes, signature: str):
     if not signature:
         raise HTTPException(status_code=403, detail="Signature missing")
 
-    expected = (
-        "sha256=" + hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    expected = _expected_signature(
+        hmac.new(config.app_secret.encode(), body, hashlib.sha256)
     )
 
-    if not hmac.compare_digest(expected, signature):
-        logger.error(
-            f"❌ Invalid signature\nExpected: {expected}\nReceived: {signature}"
-        )
+    if not hmac.compare_digest(expected, signature.encode()):
+        logger.error(f"❌ Invalid signature (received: {signature[:16]}...)")
         raise HTTPException(status_code=403, detail="Invalid signature")
+
+
+class WebhookSignatureMiddleware:
+    def __init__(
+        self,
+        app,
+        path: str = "/webhook",
+        secret: str = None,
+        max_body_bytes: int = None,
+        required: bool = None,
+    ):
+        """
+        Args:
+            required: sin secreto, rechazar todo en vez de no verificar
+                (por defecto, en producción)
+        """
+        self.app = app
+        self.path = path
+        secret = config.app_secret if secret is None else secret
+        self.secret = secret.encode() if secret else None
+        self.max_body_bytes = max_body_bytes or config.webhook_max_body_bytes
+        self.required = config.is_prod if required is None else required
+
+        if not self.secret and self.required:
+            logger.error(
+                "❌ APP_SECRET no configurado en producción: POST /webhook se rechaza con 403"
+            )
+        elif not self.secret:
+            logger.warning(
+                "⚠️ APP_SECRET no configurado: la firma X-Hub-Signature-256 NO se verifica"
+            )
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] != self.path
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+
+        # 1) Precheck por Content-Length (sin leer el cuerpo)
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_body_bytes:
+            await self._reject(scope, receive, send, 413, "oversized")
+            return
+
+        # 2) Firma presente (si la verificación está activa)
+        mac = None
+        signature = headers.get(SIGNATURE_HEADER, b"")
+        if not self.secret and self.required:
+            await self._reject(scope, receive, send, 403, "unconfigured")
+            return
+        if self.secret:
+            if not signature:
+                await self._reject(scope, receive, send, 403, "missing")
+                return
+            mac = hmac.new(self.secret, digestmod=hashlib.sha256)
+
+        # 3) Leer el cuerpo en streaming, actualizando el HMAC por chunk
+        chunks = []
+        total = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+
+            chunk = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            total += len(chunk)
+            if total > self.max_body_bytes:
+                await self._reject(scope, receive, send, 413, "oversized")
+                return
+
+            if mac is not None:
+                mac.update(chunk)
+            chunks.append(chunk)
+
+        if mac is not None and not hmac.compare_digest(
+            _expected_signature(mac), signature
+        ):
+            await self._reject(scope, receive, send, 403, "invalid")
+            return
+
+        if mac is not None:
+            SIGNATURE_STATS["verified"] += 1
+
+        # 4) Pasar el cuerpo verificado a la ruta sin volver a bufferizarlo
+        body = b"".join(chunks)
+        scope.setdefault("state", {})["raw_body"] = body
+
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay_receive, send)
+
+    async def _reject(self, scope, receive, send, status_code: int, reason: str):
+        SIGNATURE_STATS[f"rejected_{reason}"] += 1
+        client = scope.get("client") or ("?", 0)
+        logger.warning(
+            f"🚫 POST {self.path} rechazado ({status_code}, {reason}) desde {client[0]}"
+        )
+        detail = "Payload too large" if status_code == 413 else "Invalid signature"
+        response = JSONResponse({"detail": detail}, status_code=status_code)
+        await response(scope, receive, send)
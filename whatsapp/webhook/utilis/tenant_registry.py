@@ -0,0 +1,313 @@
+"""
+Registro en memoria de negocios (tenants) por phone_number_id.
+
+Antes cada mensaje entrante autorizaba gspread, abría la hoja Credentials,
+descargaba todas las filas con get_all_records(), las recorría y
+hasheaba la fila encontrada. Ahora:
+
+    - el índice phone_number_id → fila vive en memoria: la búsqueda es un
+      dict.get, sin red
+    - un task de fondo lo refresca cada TENANT_REFRESH_SECONDS
+    - stale-while-revalidate: si el índice está vencido se sigue sirviendo
+      y se dispara un refresco en segundo plano (uno a la vez)
+    - si un refresco falla se conserva el último índice bueno
+
+Rechazo temprano (antes de dedupe, cola o cualquier llamada a Google):
+
+    - los negocios con Status FALSE se precalculan en cada refresco
+    - un phone_number_id desconocido entra a una caché negativa con su
+      propio TTL (TENANT_NEGATIVE_TTL_SECONDS). La primera vez dispara un
+      refresco en segundo plano, como mucho uno cada
+      TENANT_MISS_REFRESH_SECONDS, para que un negocio recién dado de alta
+      aparezca rápido sin que el tráfico basura relea la hoja
+    - los rechazos se cuentan por id para detectar tráfico mal ruteado
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+
+from whatsapp.config import config
+from whatsapp.webhook.utilis.client_credentials import (
+    compute_row_hash,
+    fetch_credentials_rows,
+)
+
+logger = logging.getLogger("whatsapp")
+
+ACTIVE_STATUSES = ("true", "1", "yes", "si", "sí")
+
+
+def _normalize_id(phone_id) -> str:
+    return str(phone_id or "").strip()
+
+
+def is_active(row: dict) -> bool:
+    """Status de la fila de Credentials como booleano."""
+    status = row.get("Status") if row else None
+    if isinstance(status, str):
+        return status.strip().lower() in ACTIVE_STATUSES
+    return bool(status)
+
+
+class TenantRegistry:
+    def __init__(
+        self,
+        fetch_rows,
+        refresh_interval: float,
+        hash_row=None,
+        negative_ttl: float = 300.0,
+        miss_refresh_interval: float = 15.0,
+        max_tracked_ids: int = 10000,
+    ):
+        """
+        Args:
+            fetch_rows: función síncrona que devuelve las filas de Credentials
+            refresh_interval: segundos entre refrescos
+            hash_row: función fila → hash para contar filas cambiadas
+            negative_ttl: segundos que un id desconocido se rechaza sin más
+            miss_refresh_interval: separación mínima entre refrescos
+                disparados por ids desconocidos
+            max_tracked_ids: tope de ids en la caché negativa y el conteo
+                de rechazos (tráfico con ids aleatorios no crece sin límite)
+        """
+        self._fetch_rows = fetch_rows
+        self._hash_row = hash_row
+        self.refresh_interval = max(1.0, refresh_interval)
+        self.negative_ttl = negative_ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self.max_tracked_ids = max(1, max_tracked_ids)
+
+        self._index: dict[str, dict] = {}
+        self._disabled: frozenset[str] = frozenset()
+        # {phone_id: vence_en} en orden de inserción
+        self._negative: OrderedDict[str, float] = OrderedDict()
+        self.rejections: Counter = Counter()  # {(phone_id, motivo): n}
+        self._hashes: dict[str, str] = {}
+        self.loaded_at: float | None = None
+        self._attempted_at: float | None = None
+        self._refreshing: asyncio.Task | None = None
+        self._loop_task: asyncio.Task | None = None
+
+        # Métricas
+        self.lookups = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.stale_served = 0
+        self.last_refresh_ms = 0.0
+        self.last_changed = 0
+        self.last_error: str | None = None
+
+    # ------------------------------------------------------
+    # Lectura (camino caliente)
+    # ------------------------------------------------------
+    @property
+    def loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def _is_stale(self) -> bool:
+        return (
+            self.loaded_at is None
+            or time.monotonic() - self.loaded_at > self.refresh_interval
+        )
+
+    def get(self, phone_id) -> dict:
+        """Fila del negocio ({} si no existe). Nunca hace llamadas de red."""
+        self.lookups += 1
+        if self._is_stale():
+            self.stale_served += 1
+            self._revalidate()
+
+        row = self._index.get(_normalize_id(phone_id))
+        if row is None:
+            self.misses += 1
+            return {}
+        return row
+
+    def all(self) -> dict[str, dict]:
+        return self._index
+
+    def rejection_reason(self, phone_id) -> str | None:
+        """
+        "unknown" o "disabled" si el mensaje para `phone_id` debe
+        rechazarse ya; None si hay que procesarlo (o si el registro aún no
+        cargó y no se puede decidir). Nunca hace llamadas de red.
+        """
+        phone_id = _normalize_id(phone_id)
+        now = time.monotonic()
+
+        reason = None
+        expires_at = self._negative.get(phone_id)
+        if expires_at is not None and expires_at > now:
+            reason = "unknown"
+        elif phone_id in self._disabled:
+            reason = "disabled"
+        elif self.loaded and phone_id not in self._index:
+            reason = "unknown"
+            self._remember_unknown(phone_id, now)
+
+        if reason:
+            self._count_rejection(phone_id, reason)
+        return reason
+
+    def _remember_unknown(self, phone_id: str, now: float):
+        self._negative.pop(phone_id, None)
+        self._negative[phone_id] = now + self.negative_ttl
+        while len(self._negative) > self.max_tracked_ids:
+            self._negative.popitem(last=False)
+        # Quizás es un negocio recién agregado a la hoja
+        self._revalidate(min_gap=self.miss_refresh_interval)
+
+    def _count_rejection(self, phone_id: str, reason: str):
+        key = (phone_id, reason)
+        if key not in self.rejections and len(self.rejections) >= self.max_tracked_ids:
+            key = ("*", reason)
+        self.rejections[key] += 1
+
+    async def ensure_loaded(self, timeout: float = None):
+        """
+        Antes de la primera carga (p. ej. sin lifespan) espera a que termine;
+        después no hace nada.
+        """
+        if self.loaded:
+            return
+        task = self._revalidate(min_gap=0 if self._attempted_at is None else None)
+        if task is not None:
+            await asyncio.wait(
+                [task], timeout=timeout or config.tenant_initial_load_timeout
+            )
+
+    # ------------------------------------------------------
+    # Refresco
+    # ------------------------------------------------------
+    def _revalidate(self, min_gap: float = None) -> asyncio.Task | None:
+        """
+        Dispara un refresco en segundo plano si no hay uno en curso y pasaron
+        `min_gap` segundos (por defecto un intervalo) desde el último
+        intento: con la hoja caída no se dispara un refresco por mensaje.
+        """
+        if self._refreshing is not None and not self._refreshing.done():
+            return self._refreshing
+        if min_gap is None:
+            min_gap = self.refresh_interval
+        if (
+            self._attempted_at is not None
+            and time.monotonic() - self._attempted_at < min_gap
+        ):
+            return None
+        try:
+            self._refreshing = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            return None
+        return self._refreshing
+
+    def _build_index(self, rows: list[dict]) -> tuple[dict, dict, int]:
+        index = {}
+        hashes = {}
+        for row in rows:
+            phone_id = _normalize_id(row.get("Phone Number ID"))
+            if phone_id:
+                index[phone_id] = row
+                self._negative.pop(phone_id, None)
+                if self._hash_row:
+                    hashes[phone_id] = self._hash_row(row)
+
+        changed = sum(
+            1
+            for phone_id, row_hash in hashes.items()
+            if self._hashes.get(phone_id) != row_hash
+        ) + len(self._hashes.keys() - hashes.keys())
+        return index, hashes, changed
+
+    async def refresh(self) -> bool:
+        """Relee Credentials (en un hilo) y reemplaza el índice completo."""
+        started = self._attempted_at = time.monotonic()
+        try:
+            rows = await asyncio.to_thread(self._fetch_rows)
+            index, hashes, changed = self._build_index(rows or [])
+        except Exception as e:
+            self.refresh_failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"❌ No se pudo refrescar el registro de negocios: {e}")
+            return False
+
+        # Reemplazo atómico: los lectores ven el índice viejo o el nuevo
+        self._index = index
+        self._disabled = frozenset(
+            phone_id for phone_id, row in index.items() if not is_active(row)
+        )
+        self._hashes = hashes
+        self.loaded_at = time.monotonic()
+        self.refreshes += 1
+        self.last_changed = changed
+        self.last_error = None
+        self.last_refresh_ms = round((time.monotonic() - started) * 1000, 2)
+        if changed:
+            logger.info(
+                f"🏢 Registro de negocios: {len(index)} negocios, "
+                f"{changed} cambio(s) ({self.last_refresh_ms} ms)"
+            )
+        return True
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await asyncio.wait([self._revalidate(min_gap=0)])
+
+    async def start(self):
+        await self.ensure_loaded()
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(
+                self._refresh_loop(), name="tenant-registry"
+            )
+        logger.info(
+            f"🏢 Registro de negocios listo: {len(self._index)} negocios "
+            f"(refresco cada {self.refresh_interval:.0f}s)"
+        )
+
+    async def stop(self):
+        tasks = [t for t in (self._loop_task, self._refreshing) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._refreshing = None
+
+    def stats(self) -> dict:
+        by_reason = Counter()
+        for (_, reason), count in self.rejections.items():
+            by_reason[reason] += count
+        return {
+            "tenants": len(self._index),
+            "disabled": len(self._disabled),
+            "negative_cached": len(self._negative),
+            "age_s": (
+                round(time.monotonic() - self.loaded_at, 1) if self.loaded else None
+            ),
+            "lookups": self.lookups,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "last_refresh_ms": self.last_refresh_ms,
+            "last_changed": self.last_changed,
+            "last_error": self.last_error,
+            "rejections": dict(by_reason),
+            "top_rejected": [
+                {"phone_id": phone_id, "reason": reason, "count": count}
+                for (phone_id, reason), count in self.rejections.most_common(20)
+            ],
+        }
+
+
+# Instancia global
+TENANT_REGISTRY = TenantRegistry(
+    fetch_rows=fetch_credentials_rows,
+    refresh_interval=config.tenant_refresh_seconds,
+    hash_row=compute_row_hash,
+    negative_ttl=config.tenant_negative_ttl_seconds,
+    miss_refresh_interval=config.tenant_miss_refresh_seconds,
+    max_tracked_ids=config.tenant_max_tracked_ids,
+)
@@ -1,66 +1,46 @@
 # whatsapp/webhook/utilis/user_verify.py
+import asyncio
+import logging
 import uuid
 from datetime import datetime
 
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
+from whatsapp.agent.services.google_sheet.gspread_helper import RowWriteBuilder
 from whatsapp.config import config
+from whatsapp.webhook.utilis.lead_index import LEAD_INDEX
+
+logger = logging.getLogger("whatsapp")
 
 # Obtener variables del config
-SERVICE_ACCOUNT_FILE = config.get_service_account_file_path()
-SHEET_NAME_LEAD = config.sheet_name_lead
 TIMEZONE = config.timezone
 
 
-def normalize_number(number: str) -> str:
-    """Elimina todo excepto dígitos"""
-    if not number:
-        return ""
-    return "".join(filter(str.isdigit, str(number)))
-
-
 def get_sheet(spreadsheet_id: str):
-    """Carga la hoja Lead de un spreadsheet específico"""
-    scope = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(
-        SERVICE_ACCOUNT_FILE, scope
-    )
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(spreadsheet_id).worksheet(SHEET_NAME_LEAD)
-    return sheet
+    """Hoja Lead de un spreadsheet específico (cliente y hoja reutilizados)"""
+    return LEAD_INDEX.worksheet(spreadsheet_id)
 
 
 async def load_user(phone_number: str, spreadsheet_id: str) -> dict:
     """
     Verifica si existe un usuario, retorna los datos completos o None.
     Incluye el índice de la fila para actualizaciones posteriores.
-    """
-    key = normalize_number(phone_number)
+    Sale del índice en memoria: un usuario conocido no lee Sheets.
 
-    try:
-        sheet = get_sheet(spreadsheet_id)
-        rows = sheet.get_all_records()
-
-        for idx, row in enumerate(rows, start=2):  # start=2 porque fila 1 son headers
-            if normalize_number(row.get("Telefono")) == key:
-                row["_row_index"] = idx
-                return row
-
-        return None
-    except Exception:
-        return None
+    Raises:
+        Exception: si no se pudo leer la hoja. No se traduce a None: un
+            error de lectura no significa que el usuario no exista
+    """
+    return await LEAD_INDEX.lookup(phone_number, spreadsheet_id)
 
 
 async def update_user_fields(
-    phone_number: str, spreadsheet_id: str, updates: dict
+    phone_number: str, spreadsheet_id: str, updates: dict, user: dict = None
 ) -> dict:
     """
     Actualiza campos específicos de un usuario existente.
     Solo actualiza los campos que tienen valores no vacíos.
     """
     try:
-        user = await load_user(phone_number, spreadsheet_id)
+        user = user or await load_user(phone_number, spreadsheet_id)
         if not user:
             return None
 
@@ -68,35 +48,47 @@ async def update_user_fields(
         if not row_index:
             return None
 
-        sheet = get_sheet(spreadsheet_id)
-        headers = sheet.row_values(1)
+        # Solo actualizar los campos especificados que tengan valor
+        updates = {field: value for field, value in updates.items() if value}
+
+        def write() -> list[str]:
+            # Todas las celdas de la fila en un solo batch_update
+            builder = RowWriteBuilder(get_sheet(spreadsheet_id))
+            applied = builder.update(updates)
+            builder.update_row(row_index)
+            return applied
 
-        # Actualizar solo los campos especificados que tengan valor
-        for field, value in updates.items():
-            if field in headers and value:  # Solo actualizar si hay valor
-                col_index = headers.index(field) + 1  # +1 porque gspread usa 1-indexed
-                sheet.update_cell(row_index, col_index, value)
+        applied = await asyncio.to_thread(write)
+        updates = {field: updates[field] for field in applied}
 
-        # Retornar usuario actualizado
-        return await load_user(phone_number, spreadsheet_id)
+        # Usuario actualizado sin volver a leer la hoja
+        updated = LEAD_INDEX.record_updated(spreadsheet_id, phone_number, updates)
+        return updated or {**user, **updates}
 
     except Exception:
+        LEAD_INDEX.invalidate(spreadsheet_id)
         return None
 
 
 async def create_user(
-    phone_number: str, spreadsheet_id: str, defaults: dict = None
+    phone_number: str,
+    spreadsheet_id: str,
+    defaults: dict = None,
+    check_existing: bool = True,
 ) -> dict:
-    """Crea un usuario en la hoja Lead si no existe"""
+    """
+    Crea un usuario en la hoja Lead si no existe.
+    check_existing=False cuando quien llama acaba de buscarlo.
+    """
     defaults = defaults or {}
 
-    # Evitar duplicados: revisamos antes
-    existing_user = await load_user(phone_number, spreadsheet_id)
-    if existing_user:
-        return existing_user
-
     try:
-        sheet = get_sheet(spreadsheet_id)
+        # Evitar duplicados: revisamos antes (si la lectura falla no se crea)
+        if check_existing:
+            existing_user = await load_user(phone_number, spreadsheet_id)
+            if existing_user:
+                return existing_user
+
         timestamp = datetime.now(TIMEZONE).strftime("%d/%m/%Y %H:%M:%S")
         short_id = str(uuid.uuid4())[:8]  # Short UUID
 
@@ -115,10 +107,15 @@ async def create_user(
             "Thread_Id": defaults.get("Thread_Id", ""),
         }
 
-        sheet.append_row(list(new_row.values()))
+        # get_sheet puede reabrir la hoja: también va en el hilo
+        response = await asyncio.to_thread(
+            lambda: get_sheet(spreadsheet_id).append_row(list(new_row.values()))
+        )
+        LEAD_INDEX.record_created(spreadsheet_id, new_row, response)
         return new_row
 
     except Exception:
+        LEAD_INDEX.invalidate(spreadsheet_id)
         return None
 
 
@@ -130,7 +127,12 @@ async def get_or_create_user(
     Si existe, actualiza campos relevantes que hayan cambiado.
     """
     defaults = defaults or {}
-    user = await load_user(phone_number, spreadsheet_id)
+    try:
+        user = await load_user(phone_number, spreadsheet_id)
+    except Exception as e:
+        # Sin saber si existe no se crea: evitaría filas duplicadas
+        logger.error(f"❌ No se pudo buscar el usuario {phone_number}: {e}")
+        return None
 
     if user:
         # Usuario existe, verificar si hay campos que actualizar
@@ -156,9 +158,13 @@ async def get_or_create_user(
 
         # Si hay actualizaciones, aplicarlas
         if updates:
-            user = await update_user_fields(phone_number, spreadsheet_id, updates)
+            user = await update_user_fields(
+                phone_number, spreadsheet_id, updates, user=user
+            )
 
         return user
 
     # Usuario no existe, crear uno nuevo
-    return await create_user(phone_number, spreadsheet_id, defaults)
+    return await create_user(
+        phone_number, spreadsheet_id, defaults, check_existing=False
+    )